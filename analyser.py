@@ -2,9 +2,12 @@ import rule
 import cellular_automaton as ca
 import numpy as np
 import random
-import visualiser
+import estimators
+import mean_field
 import csv
 import pickle
+import multiprocessing
+import shared_results
 
 class Analyser:
     """
@@ -15,10 +18,203 @@ class Analyser:
         self.max_timesteps = max_timesteps
         self.num_runs_per_point = num_runs_per_point
 
-    def _run_single_simulation(self, num_cars, rule_instance):
+    def _run_single_simulation(self, num_cars, rule_instance, num_runs=None, max_timesteps=None, seed=None):
         """
         Helper method: Runs multiple simulations for a given configuration
         and returns averaged metrics (flow, velocity, variance).
+        :param num_runs: number of runs, defaults to num_runs_per_point
+        :param max_timesteps: length of every run, defaults to max_timesteps
+        :param seed: if given, run k draws its initial positions and braking events from seed + k,
+                     so that different rules see common random numbers
+        """
+        num_runs = self.num_runs_per_point if num_runs is None else num_runs
+        max_timesteps = self.max_timesteps if max_timesteps is None else max_timesteps
+        run_flows = []
+        run_vels = []
+        run_vars = []
+
+        # the rng of the caller is put back, also if a run fails
+        previous_rng = rule_instance.rng
+        try:
+            for run in range(num_runs):
+                if seed is not None:
+                    rule_instance.rng = np.random.RandomState(seed + run)
+                    initial_positions = rule.initial_positions(rule_instance, num_cars, self.road_length,
+                                                               rule_instance.rng)
+                elif getattr(rule_instance, "fleet", None) is not None:
+                    initial_positions = rule.initial_positions(rule_instance, num_cars, self.road_length)
+                else:
+                    initial_positions = np.sort(random.sample(range(self.road_length), num_cars))
+                initial_velocities = np.zeros(num_cars)
+
+                automaton = ca.CellularAutomaton(initial_positions, initial_velocities,
+                                                 self.road_length, max_timesteps,
+                                                 0, self.road_length - 1)
+
+                (traffic_evolution, space_mean_velocities, local_variance_velocity,
+                 local_densities, local_flows, _) = automaton.simulate(rule_instance)
+
+                # steady state series of every run
+                run_flows.append(local_flows[1:])
+                run_vels.append(space_mean_velocities[1:])
+                run_vars.append(local_variance_velocity[1:])
+        finally:
+            rule_instance.rng = previous_rng
+
+        # Return averages over the runs with their uncertainty, from (1, runs, timesteps) arrays of one point
+        metrics = self._summarise({"flow": np.asarray(run_flows)[None],
+                                   "velocity": np.asarray(run_vels)[None],
+                                   "variance": np.asarray(run_vars)[None]}, seed)
+        return {key: value[0] for key, value in metrics.items()}
+
+    # key of the per run means of every metric
+    RUN_KEYS = {"flow": "run_flows", "velocity": "run_velocities", "variance": "run_variances"}
+    # key of the means of every metric in the study results, next to its _stderrs, _ci_lowers and _ci_uppers
+    RESULT_KEYS = {"flow": "flows", "velocity": "velocities", "variance": "variances"}
+
+    @staticmethod
+    def _new_results(prefix=""):
+        """
+        Helper method: Empty result lists for the mean, standard error and confidence interval of every metric.
+        :param prefix: prefix of the keys, e.g. "gw_" for gw_flows, gw_flow_stderrs, ...
+        """
+        results = {}
+        for name, key in Analyser.RESULT_KEYS.items():
+            for suffix in (key, f"{name}_stderrs", f"{name}_ci_lowers", f"{name}_ci_uppers"):
+                results[prefix + suffix] = []
+        return results
+
+    @staticmethod
+    def _metric_values(metrics, prefix=""):
+        """
+        Helper method: Mean, standard error and confidence interval of every metric of a point under their
+        result keys. The arrays of a batched point become lists over the plans.
+        """
+        values = {}
+        for name, key in Analyser.RESULT_KEYS.items():
+            for suffix, value in ((key, metrics[name]),
+                                  (f"{name}_stderrs", metrics[f"{name}_stderr"]),
+                                  (f"{name}_ci_lowers", metrics[f"{name}_ci_lower"]),
+                                  (f"{name}_ci_uppers", metrics[f"{name}_ci_upper"])):
+                values[prefix + suffix] = list(value) if np.ndim(value) else value
+        return values
+
+    @staticmethod
+    def _append_metrics(results, metrics, prefix=""):
+        """
+        Helper method: Appends the metrics of a point to result lists made by _new_results.
+        """
+        for key, value in Analyser._metric_values(metrics, prefix).items():
+            results[key].append(value)
+
+    @staticmethod
+    def _summarise(series, seed=None):
+        """
+        Helper method: Reduces the (points, runs, timesteps) series of every metric to its mean over runs
+        and time with standard error and bootstrap confidence interval.
+        :param seed: seed of the bootstrap resampling, so that seeded studies give reproducible intervals
+        :return: dict with arrays over the points, e.g. flow, flow_stderr, flow_ci_lower, flow_ci_upper, run_flows
+        """
+        metrics = {}
+        for name, values in series.items():
+            rng = np.random.default_rng(seed) if seed is not None else None
+            summary = estimators.summarise_runs(values, rng=rng)
+            metrics[name] = summary["mean"]
+            metrics[f"{name}_stderr"] = summary["stderr"]
+            metrics[f"{name}_ci_lower"] = summary["ci_lower"]
+            metrics[f"{name}_ci_upper"] = summary["ci_upper"]
+            metrics[Analyser.RUN_KEYS[name]] = summary["run_means"]
+        return metrics
+
+    @staticmethod
+    def _change_num_cars(positions, velocities, num_cars, road_length, rng):
+        """
+        Helper method: Adds cars in the middle of the largest gap, one at a time, or removes randomly
+        chosen cars, until num_cars cars are on the road.
+        :return: sorted positions and velocities
+        """
+        positions = np.asarray(positions, dtype=int)
+        velocities = np.asarray(velocities, dtype=int)
+        while len(positions) > num_cars:
+            removed = rng.randint(len(positions))
+            positions = np.delete(positions, removed)
+            velocities = np.delete(velocities, removed)
+        while len(positions) < num_cars:
+            if len(positions) == 0:
+                positions, velocities = np.array([0]), np.array([0])
+                continue
+            gaps = np.roll(positions, -1) - positions - 1
+            gaps[-1] += road_length
+            behind = np.argmax(gaps)
+            offset = gaps[behind] // 2 + 1
+            # the new car drives like the car behind, as far as its gap allows
+            new_velocity = min(velocities[behind], gaps[behind] - offset)
+            positions = np.insert(positions, behind + 1, positions[behind] + offset)
+            velocities = np.insert(velocities, behind + 1, new_velocity)
+            positions %= road_length
+            order = np.argsort(positions)
+            positions, velocities = positions[order], velocities[order]
+        return positions, velocities
+
+    def _run_warm_start_sweep(self, num_cars_list, rule_instance, relaxation_steps=None, measure_steps=None,
+                              seed=None):
+        """
+        Helper method: Continuation sweep over the numbers of cars. Every run is one chain through the sorted
+        numbers of cars: the state of the previous point, with a car added or removed, is relaxed for
+        relaxation_steps and then measured for measure_steps, instead of starting from random positions at
+        rest. Only the first point of a chain relaxes for max_timesteps. With the defaults, every later point
+        costs 0.6 * max_timesteps steps, against max_timesteps of a cold start.
+        :param relaxation_steps: steps discarded before measuring, defaults to max_timesteps // 10
+        :param measure_steps: steps measured at every point, defaults to max_timesteps // 2
+        :param seed: if given, chain k draws its positions, removals and braking events from seed + k
+        :return: list of metric dicts as returned by _run_single_simulation, in the order of num_cars_list
+        """
+        if getattr(rule_instance, "fleet", None) is not None:
+            raise ValueError("warm start sweeps change the number of cars and can not keep a fleet")
+        relaxation_steps = self.max_timesteps // 10 if relaxation_steps is None else relaxation_steps
+        measure_steps = self.max_timesteps // 2 if measure_steps is None else measure_steps
+        order = np.argsort(num_cars_list)
+        sorted_num_cars = np.asarray(num_cars_list)[order]
+        series = {"flow": [], "velocity": [], "variance": []}
+        previous_rng = rule_instance.rng
+        try:
+            for run in range(self.num_runs_per_point):
+                rng = np.random.RandomState(seed + run) if seed is not None else previous_rng
+                rule_instance.rng = rng
+                positions = np.sort(rng.choice(self.road_length, sorted_num_cars[0], replace=False))
+                velocities = np.zeros(sorted_num_cars[0], dtype=int)
+                run_series = {name: [] for name in series}
+                for k, num_cars in enumerate(sorted_num_cars):
+                    positions, velocities = self._change_num_cars(positions, velocities, num_cars,
+                                                                  self.road_length, rng)
+                    discarded = self.max_timesteps if k == 0 else relaxation_steps
+                    # the light cycles start again at t = 0, the relaxation also absorbs this phase jump
+                    automaton = ca.CellularAutomaton(positions, velocities, self.road_length,
+                                                     discarded + measure_steps, 0, self.road_length - 1,
+                                                     record_evolution=False, record_light_states=False)
+                    (_, space_mean_velocities, local_variance_velocity,
+                     _, local_flows, _) = automaton.simulate(rule_instance)
+                    run_series["flow"].append(local_flows[discarded:])
+                    run_series["velocity"].append(space_mean_velocities[discarded:])
+                    run_series["variance"].append(local_variance_velocity[discarded:])
+                    positions, velocities = automaton.positions, automaton.velocities
+                for name in series:
+                    series[name].append(run_series[name])
+        finally:
+            rule_instance.rng = previous_rng
+
+        # (points, runs, timesteps) arrays in the sorted order of the points
+        metrics = self._summarise({name: np.swapaxes(np.asarray(values), 0, 1) for name, values in series.items()},
+                                  seed)
+        point_metrics = [None] * len(num_cars_list)
+        for k, point in enumerate(order):
+            point_metrics[point] = {key: value[k] for key, value in metrics.items()}
+        return point_metrics
+
+    def _run_batched_simulation(self, num_cars, batched_rule):
+        """
+        Helper method: Same as _run_single_simulation, but simulates all plans of a
+        BatchedTrafficLights rule together and returns arrays of metrics over the plans.
         """
         run_flows = []
         run_vels = []
@@ -26,70 +222,210 @@ class Analyser:
 
         for run in range(self.num_runs_per_point):
             initial_positions = np.sort(random.sample(range(self.road_length), num_cars))
-            initial_velocities = np.zeros(num_cars)
+            initial_positions = np.tile(initial_positions, (batched_rule.num_plans, 1))
+            initial_velocities = np.zeros((batched_rule.num_plans, num_cars))
 
-            automaton = ca.CellularAutomaton(initial_positions, initial_velocities,
-                                             self.road_length, self.max_timesteps,
-                                             0, self.road_length - 1)
+            automaton = ca.BatchedCellularAutomaton(initial_positions, initial_velocities,
+                                                    self.road_length, self.max_timesteps,
+                                                    0, self.road_length - 1)
 
-            (traffic_evolution, space_mean_velocities, local_variance_velocity,
-             local_densities, local_flows, _) = automaton.simulate(rule_instance)
+            (_, space_mean_velocities, local_variance_velocity,
+             local_densities, local_flows, _) = automaton.simulate(batched_rule)
 
-            steady_flows = local_flows[1:]
-            steady_vels = space_mean_velocities[1:]
-            steady_vars = local_variance_velocity[1:]
+            # (timesteps, plans) steady state series of every run
+            run_flows.append(local_flows[1:])
+            run_vels.append(space_mean_velocities[1:])
+            run_vars.append(local_variance_velocity[1:])
 
-            run_flows.append(np.mean(steady_flows))
-            run_vels.append(np.mean(steady_vels))
-            # Variance can be zero, avoid NaN division if averaging variance itself
-            run_vars.append(np.mean(steady_vars) if len(steady_vars) > 0 else 0)
+        # (runs, timesteps, plans) -> (plans, runs, timesteps)
+        return self._summarise({"flow": np.transpose(run_flows, (2, 0, 1)),
+                                "velocity": np.transpose(run_vels, (2, 0, 1)),
+                                "variance": np.transpose(run_vars, (2, 0, 1))})
 
-        # Return averages over the runs
-        avg_metrics = {
-            "flow": np.mean(run_flows),
-            "velocity": np.mean(run_vels),
-            "variance": np.mean(run_vars)
-        }
-        return avg_metrics
+    def _run_paired_simulations(self, num_cars, rule_instances, seed=0, antithetic=False):
+        """
+        Helper method: Runs every rule with common random numbers. In run k all rules start from the same
+        initial positions and draw their braking events from the same random stream, so that the
+        difference between the rules is not buried in run-to-run noise.
+        :param antithetic: if True, every run is repeated with mirrored braking events (u -> 1-u)
+        :return: list with one dict per rule, holding per run flows, velocities, variances and braking rates.
+                 The arrays have shape (runs,) or (runs, 2) for antithetic pairs.
+        """
+        variants = [False, True] if antithetic else [False]
+        shape = (self.num_runs_per_point, len(variants))
+        per_rule = [{'flows': np.zeros(shape), 'velocities': np.zeros(shape), 'variances': np.zeros(shape),
+                     'braking_rates': np.zeros(shape)}
+                    for _ in rule_instances]
 
-    def density_vel_flow(self, max_velocity_list, braking_prob_list):
+        previous_rngs = [rule_instance.rng for rule_instance in rule_instances]
+        try:
+            for run in range(self.num_runs_per_point):
+                initial_positions = rule.initial_positions(rule_instances[0], num_cars, self.road_length,
+                                                           np.random.RandomState(seed + run))
+                for k, mirrored in enumerate(variants):
+                    for rule_instance, metrics in zip(rule_instances, per_rule):
+                        braking_stream = np.random.RandomState([seed + run, 1])
+                        rule_instance.rng = estimators.AntitheticRandomState(braking_stream) if mirrored else braking_stream
+                        rule_instance.braking_draws = 0
+                        rule_instance.braking_count = 0
+
+                        automaton = ca.CellularAutomaton(np.copy(initial_positions), np.zeros(num_cars),
+                                                         self.road_length, self.max_timesteps,
+                                                         0, self.road_length - 1)
+                        (_, space_mean_velocities, local_variance_velocity,
+                         _, local_flows, _) = automaton.simulate(rule_instance)
+
+                        metrics['flows'][run, k] = np.mean(local_flows[1:])
+                        metrics['velocities'][run, k] = np.mean(space_mean_velocities[1:])
+                        metrics['variances'][run, k] = np.mean(local_variance_velocity[1:])
+                        metrics['braking_rates'][run, k] = rule_instance.braking_count / max(rule_instance.braking_draws, 1)
+        finally:
+            for rule_instance, previous_rng in zip(rule_instances, previous_rngs):
+                rule_instance.rng = previous_rng
+
+        for metrics in per_rule:
+            if not antithetic:
+                for key in metrics:
+                    metrics[key] = metrics[key][:, 0]
+        return per_rule
+
+    def _compare_paired(self, results, names, per_rule, braking_probability, control_variate):
+        """
+        Appends the means of both strategies and their flow difference with confidence interval to results.
+        """
+        (first, second) = per_rule
+        control = None
+        if control_variate:
+            # both strategies draw the same braking events, so one braking rate per run is the control
+            control = first['braking_rates']
+        for name, metrics in zip(names, per_rule):
+            point_metrics = {}
+            for metric, key in self.RESULT_KEYS.items():
+                # antithetic pairs count as one independent sample
+                values = np.reshape(metrics[key], (self.num_runs_per_point, -1)).mean(axis=1)
+                interval = estimators.mean_confidence_interval(values)
+                point_metrics[metric] = interval["mean"]
+                point_metrics[f"{metric}_stderr"] = interval["stderr"]
+                point_metrics[f"{metric}_ci_lower"], point_metrics[f"{metric}_ci_upper"] = interval["ci"]
+            self._append_metrics(results, point_metrics, f"{name}_")
+        difference = estimators.paired_difference(first['flows'], second['flows'],
+                                                  control=control, control_mean=braking_probability)
+        results['flow_differences'].append(difference['mean'])
+        results['flow_difference_stderrs'].append(difference['stderr'])
+        results['flow_difference_cis'].append(difference['ci'])
+
+    def run_shared_sweep(self, points, num_processes=None, seed=0, record_evolution=False):
+        """
+        Runs num_runs_per_point simulations of every parameter point in worker processes. The workers
+        write their per-step measurements into shared memory blocks indexed by (point, run), which are
+        reduced here in place, without pickling any arrays back.
+        :param points: list of (num_cars, rule_instance) tuples
+        :param num_processes: number of worker processes, defaults to the number of CPUs
+        :param seed: run k of every point uses seed + k, as in _run_single_simulation
+        :param record_evolution: also collects the occupancy grids and returns their mean over the runs
+        :return: dict with flow, velocity and variance arrays over the points with their uncertainty
+        """
+        shape = (len(points), self.num_runs_per_point, self.max_timesteps)
+        shapes = {'flows': shape, 'velocities': shape, 'variances': shape, 'densities': shape}
+        dtypes = {metric: np.float64 for metric in shapes}
+        if record_evolution:
+            shapes['occupancy'] = shape + (self.road_length,)
+            dtypes['occupancy'] = np.uint8
+        block = shared_results.SharedResultBlock(shapes, dtypes)
+        print(f"Allocated {block.nbytes / 1e6:.1f} MB of shared result memory")
+
+        tasks = [(point_index, run, num_cars, rule_instance, self.road_length, seed)
+                 for point_index, (num_cars, rule_instance) in enumerate(points)
+                 for run in range(self.num_runs_per_point)]
+        try:
+            with multiprocessing.Pool(num_processes, initializer=shared_results.attach_worker,
+                                      initargs=(block.spec(),)) as pool:
+                for _ in pool.imap_unordered(shared_results.simulate_into_block, tasks):
+                    pass
+
+            # steady state means with their uncertainty, reduced from views of the shared arrays
+            metrics = self._summarise({"flow": block['flows'][:, :, 1:],
+                                       "velocity": block['velocities'][:, :, 1:],
+                                       "variance": block['variances'][:, :, 1:]}, seed)
+            if record_evolution:
+                metrics["occupancy"] = block['occupancy'].mean(axis=1, dtype=np.float32)
+        finally:
+            block.close()
+        return metrics
+
+    def density_vel_flow(self, max_velocity_list, braking_prob_list, num_points=None, warm_start=False,
+                         relaxation_steps=None, measure_steps=None, seed=None):
         """
         Calculates flow, mean velocity and variance vs. density for given rule
         :param rule: the given rule
+        :param num_points: if given, only this many densities are simulated, placed around the
+                           critical density estimated by the mean-field approximation
+        :param warm_start: every density starts from the relaxed state of the previous one with a car added
+                           or removed, see _run_warm_start_sweep
+        :param relaxation_steps: steps discarded at every density of a warm start sweep
+        :param measure_steps: steps measured at every density of a warm start sweep
+        :param seed: if given, run k draws its initial state and braking events from seed + k
         :return: Dictionary containing the results
         """
-        num_cars_list = np.arange(1, self.road_length+1, 1)
         results = {}
         for v_max in max_velocity_list:
             for prob in braking_prob_list:
-                r = rule.MaxVelocity(road_length, v_max, prob)
+                if num_points is None:
+                    num_cars_list = np.arange(1, self.road_length+1, 1)
+                else:
+                    num_cars_list = mean_field.adaptive_num_cars(self.road_length, v_max, prob, num_points)
+                r = rule.MaxVelocity(self.road_length, v_max, prob)
                 print(f"Processing vmax={v_max}, prob={prob}")
                 prob_label = f"{prob:.2f}"
                 label = f"vmax={v_max}, p={prob_label}"
-                results[label] = {'densities': [], 'flows': [], 'velocities': [], 'variances': []}
-                for num_cars in num_cars_list:
+                results[label] = {'densities': [], **self._new_results()}
+                if warm_start:
+                    sweep_metrics = self._run_warm_start_sweep(num_cars_list, r, relaxation_steps, measure_steps,
+                                                               seed)
+                for k, num_cars in enumerate(num_cars_list):
                     print(f"Density {num_cars/self.road_length}")
-                    metrics = self._run_single_simulation(num_cars, r)
+                    metrics = sweep_metrics[k] if warm_start else self._run_single_simulation(num_cars, r, seed=seed)
                     results[label]['densities'].append(num_cars/self.road_length)
-                    results[label]['flows'].append(metrics["flow"])
-                    results[label]['velocities'].append(metrics["velocity"])
-                    results[label]['variances'].append(metrics["variance"])
+                    self._append_metrics(results[label], metrics)
         self.write_pickle(results, "pickle_results/density_vel_flow.pkl")
         return results
 
+    @staticmethod
+    def mean_field_deviation(results):
+        """
+        Compares simulated fundamental diagrams with the mean-field estimates.
+        :param results: results dict of density_vel_flow, with labels "vmax=..., p=..."
+        :return: dict mapping every label to the estimated flows and their deviation from the simulation
+        """
+        deviations = {}
+        for label, data in results.items():
+            v_max, prob = (part.split("=")[1] for part in label.split(","))
+            estimate = mean_field.estimate_fundamental_diagram(data['densities'], int(v_max), float(prob))
+            simulated = np.asarray(data['flows'])
+            errors = np.asarray(estimate['flows']) - simulated
+            deviations[label] = {
+                'densities': data['densities'],
+                'estimated_flows': estimate['flows'],
+                'flow_errors': list(errors),
+                'max_absolute_error': np.max(np.abs(errors)),
+                'relative_capacity_error': (np.max(estimate['flows']) - np.max(simulated)) / np.max(simulated)
+            }
+            print(f"{label}: max. flow error {deviations[label]['max_absolute_error']:.3f}, "
+                  f"capacity error {100 * deviations[label]['relative_capacity_error']:.1f}%")
+        return deviations
+
     def flow_braking_prob_plot(self, p_values, num_cars):
         """
         Analyses the influence of the braking probability on the average flow
+        :return: results dict with the metrics of every braking probability
         """
-        results = {'densities': [], 'flows': [], 'velocities': [], 'variances': []}
+        results = {'braking_probabilities': list(p_values), 'densities': [], **self._new_results()}
         for i in range(len(p_values)):
             r = rule.Rule184_random(self.road_length, p_values[i])
             metrics = self._run_single_simulation(num_cars, r)
 
             results['densities'].append(num_cars / self.road_length)
-            results['flows'].append(metrics["flow"])
-            results['velocities'].append(metrics["velocity"])
-            results['variances'].append(metrics["variance"])
+            self._append_metrics(results, metrics)
         return results
 
 
@@ -97,26 +433,24 @@ class Analyser:
                                      cycle_lengths, braking_probability):
         """
         Analyses flow vs. cycle length for SYNCHRONISED traffic light strategy using several densities
+        :return: results dict, the metrics hold one list over the cycle lengths per density
         """
         num_lights = len(light_positions)
-        flows = []
+        cycle_lengths = np.asarray(cycle_lengths)
+        results = {'densities': [num_cars / self.road_length for num_cars in num_cars_list],
+                   'cycle_lengths': list(cycle_lengths), **self._new_results()}
         for num_cars in num_cars_list:
-            results = {'densities': [], 'flows': [], 'velocities': [], 'variances': []}
-            for T_phase in cycle_lengths:
-                print(f"Processing cycle length {T_phase} for density {num_cars/self.road_length}")
-                sync_rule = rule.TrafficLights(self.road_length, max_velocity, light_positions,
-                                               [T_phase] * num_lights, [T_phase] * num_lights,
-                                               start_red=[False] * num_lights, offset=[0] * num_lights,
-                                               braking_probability=braking_probability)
-
-                metrics = self._run_single_simulation(num_cars, sync_rule)
-                results['densities'].append(num_cars / self.road_length)
-                results['flows'].append(metrics["flow"])
-                results['velocities'].append(metrics["velocity"])
-                results['variances'].append(metrics["variance"])
-            flows.append(results["flows"])
-        self.write_pickle(flows, "pickle_results/flows_cycle.pkl")
-        return flows
+            print(f"Processing {len(cycle_lengths)} cycle lengths for density {num_cars/self.road_length}")
+            phases = np.repeat(cycle_lengths[:, None], num_lights, axis=1)
+            sync_rule = rule.BatchedTrafficLights(self.road_length, max_velocity, light_positions,
+                                                  phases, phases,
+                                                  start_red=[False] * num_lights, offset=[0] * num_lights,
+                                                  braking_probability=braking_probability)
+
+            metrics = self._run_batched_simulation(num_cars, sync_rule)
+            self._append_metrics(results, metrics)
+        self.write_pickle(results, "pickle_results/flows_cycle.pkl")
+        return results
 
     def analyse_green_red_split(self, num_cars, max_velocity, light_positions,
                                 total_cycle_lengths, braking_probability):
@@ -124,20 +458,20 @@ class Analyser:
         num_lights = len(light_positions)
         for T in total_cycle_lengths:
             print(f"Processing cycle length {T}")
-            cycle_results = {'green_durations': [], 'red_durations': [], 'flows': []}
-            for green_dur in range(1, T):
-                red_dur = T - green_dur
-                sync_rule = rule.TrafficLights(
-                    self.road_length, max_velocity, light_positions,
-                    [green_dur] * num_lights, [red_dur] * num_lights,
-                    start_red=[False] * num_lights, offset=[0] * num_lights,
-                    braking_probability=braking_probability
-                )
-                metrics = self._run_single_simulation(num_cars, sync_rule)
+            green_durs = np.arange(1, T)
+            red_durs = T - green_durs
+            sync_rule = rule.BatchedTrafficLights(
+                self.road_length, max_velocity, light_positions,
+                np.repeat(green_durs[:, None], num_lights, axis=1),
+                np.repeat(red_durs[:, None], num_lights, axis=1),
+                start_red=[False] * num_lights, offset=[0] * num_lights,
+                braking_probability=braking_probability
+            )
+            metrics = self._run_batched_simulation(num_cars, sync_rule)
 
-                cycle_results['green_durations'].append(green_dur)
-                cycle_results['red_durations'].append(red_dur)
-                cycle_results['flows'].append(metrics["flow"])
+            cycle_results = {'green_durations': list(green_durs),
+                             'red_durations': list(red_durs),
+                             **self._metric_values(metrics)}
 
             results[T] = cycle_results
         self.write_pickle(results, "pickle_results/green_red_split.pkl")
@@ -148,63 +482,57 @@ class Analyser:
                                   offset_range, braking_probability=None):
         """
         Analyses flow vs. offset time used to find optimal offset for green wave strategy
+        :return: results dict, the metrics hold one list over the offsets per density
         """
-        flows = []
+        results = {'densities': [num_cars / self.road_length for num_cars in num_cars_list],
+                   'offsets': list(offset_range), **self._new_results()}
+        # offsets of every plan, (plans, lights)
+        offsets = np.outer(offset_range, np.arange(len(light_positions)))
         for num_cars in num_cars_list:
-            results = {'densities': [], 'flows': [], 'velocities': [], 'variances': []}
-            for i in range(len(offset_range)):
-                offset = [(k * offset_range[i]) for k in range(len(light_positions))]
-                sync_rule = rule.TrafficLights(self.road_length, max_velocity, light_positions,
-                                               green_durations, red_durations, offset=offset,
-                                               start_red=[False] * len(light_positions),
-                                               braking_probability=braking_probability)
-
-                metrics = self._run_single_simulation(num_cars, sync_rule)
-                results['densities'].append(num_cars / self.road_length)
-                results['flows'].append(metrics["flow"])
-                results['velocities'].append(metrics["velocity"])
-                results['variances'].append(metrics["variance"])
-
-            flows.append(results["flows"])
-        return flows
+            sync_rule = rule.BatchedTrafficLights(self.road_length, max_velocity, light_positions,
+                                                  green_durations, red_durations, offset=offsets,
+                                                  start_red=[False] * len(light_positions),
+                                                  braking_probability=braking_probability)
+
+            metrics = self._run_batched_simulation(num_cars, sync_rule)
+            self._append_metrics(results, metrics)
+        return results
 
     def traffic_light_cycle_flow_offset(self, num_cars, max_velocity,
                                         light_positions, cycle_lengths,
                                         offsets, braking_probability=None):
         """
         Compares green wave strategy with synchronised strategy
+        :return: results dict, the metrics hold one list over the cycle lengths per offset
         """
-        flows = []
-        velocities = []
         num_lights = len(light_positions)
+        cycle_lengths = np.asarray(cycle_lengths)
+        results = {'cycle_lengths': list(cycle_lengths), 'offsets': list(offsets), **self._new_results()}
+        phases = np.repeat(cycle_lengths[:, None], num_lights, axis=1)
         for i in range(len(offsets)):
-            results = {'densities': [], 'flows': [], 'velocities': [], 'variances': []}
-            for T_phase in cycle_lengths:
-                offset = [(k * offsets[i]) for k in range(len(light_positions))]
-                sync_rule = rule.TrafficLights(self.road_length, max_velocity, light_positions,
-                                               [T_phase] * num_lights, [T_phase] * num_lights,
-                                               start_red=[False] * num_lights, offset=offset,
-                                               braking_probability=braking_probability)
-
-                metrics = self._run_single_simulation(num_cars, sync_rule)
-                results['densities'].append(num_cars / self.road_length)
-                results['flows'].append(metrics["flow"])
-                results['velocities'].append(metrics["velocity"])
-                results['variances'].append(metrics["variance"])
-
-            flows.append(results["flows"])
-            velocities.append(results["velocities"])
-        return flows, velocities
+            offset = [(k * offsets[i]) for k in range(len(light_positions))]
+            sync_rule = rule.BatchedTrafficLights(self.road_length, max_velocity, light_positions,
+                                                  phases, phases,
+                                                  start_red=[False] * num_lights, offset=offset,
+                                                  braking_probability=braking_probability)
+
+            metrics = self._run_batched_simulation(num_cars, sync_rule)
+            self._append_metrics(results, metrics)
+        return results
 
     def compare_sync_gw(self, num_cars_list, max_velocity, light_positions,
-                        sync_parameters, optimal_offset):
+                        sync_parameters, optimal_offset, paired=False, antithetic=False,
+                        control_variate=False, seed=0):
+        """
+        Compares the green wave strategy with the synchronised strategy over densities.
+        :param paired: if True, both strategies are simulated with common random numbers and the
+                       flow difference (green wave - synchronised) is reported with a confidence interval
+        :param antithetic: adds a mirrored braking run to every paired run
+        :param control_variate: corrects the difference with the realised braking rate as control variate
+        """
 
         num_lights = len(light_positions)
-        results = {
-            "densities": [],
-            'gw_flows': [], 'sync_flows': [],
-            'gw_velocities': [], 'sync_velocities': []
-        }
+        results = {"densities": [], **self._new_results("gw_"), **self._new_results("sync_")}
 
         sync_rule = rule.TrafficLights(self.road_length, max_velocity, light_positions,
                                      [sync_parameters['green_duration']] * num_lights,
@@ -220,15 +548,18 @@ class Analyser:
                                      offset=[k*optimal_offset for k in range(num_lights)],
                                      braking_probability=0.1)
 
+        if paired:
+            results.update({'flow_differences': [], 'flow_difference_stderrs': [], 'flow_difference_cis': []})
+
         for num_cars in num_cars_list:
             print(f"Processing density={num_cars/self.road_length}")
             results["densities"].append(num_cars / self.road_length)
-            gw_metrics = self._run_single_simulation(num_cars, gw_rule)
-            sync_metrics = self._run_single_simulation(num_cars, sync_rule)
-            results['gw_flows'].append(gw_metrics["flow"])
-            results['gw_velocities'].append(gw_metrics["velocity"])
-            results['sync_flows'].append(sync_metrics["flow"])
-            results['sync_velocities'].append(sync_metrics["velocity"])
+            if paired:
+                per_rule = self._run_paired_simulations(num_cars, [gw_rule, sync_rule], seed, antithetic)
+                self._compare_paired(results, ['gw', 'sync'], per_rule, 0.1, control_variate)
+            else:
+                self._append_metrics(results, self._run_single_simulation(num_cars, gw_rule), "gw_")
+                self._append_metrics(results, self._run_single_simulation(num_cars, sync_rule), "sync_")
 
         return results
 
@@ -241,7 +572,7 @@ class Analyser:
         :param fixed_sotl_parameters: Dict containing the remaining fixed parameters
         :return: results dict
         """
-        results = {'parameter_values': parameter_values, 'flows': []}
+        results = {'parameter_values': parameter_values, **self._new_results()}
         density = num_cars / self.road_length
         for value in parameter_values:
             current_params = fixed_sotl_parameters.copy()
@@ -254,9 +585,106 @@ class Analyser:
             )
 
             metrics = self._run_single_simulation(num_cars, sotl_rule)
-            results['flows'].append(metrics["flow"])
+            self._append_metrics(results, metrics)
         return results
 
+    def _successive_halving(self, rule_factory, candidates, num_cars, eta=3, min_runs=1,
+                            min_timesteps=100, seed=0):
+        """
+        Searches the candidate with the highest flow by successive halving. All candidates start with a
+        small number of runs and timesteps, after every rung only the best 1/eta are kept and their
+        budget grows by eta, until the last rung is simulated with the full budget.
+        All candidates of a rung use the same seed, i.e. common random numbers.
+        :param rule_factory: function which creates a fresh rule from a candidate's parameters
+        :param candidates: list of parameter dicts
+        :return: results dict
+        """
+        num_rungs = max(int(np.floor(np.log(len(candidates)) / np.log(eta))), 0) + 1
+        survivors = list(candidates)
+        history = []
+        simulated_steps = 0
+        for rung in range(num_rungs):
+            fraction = float(eta) ** (rung - num_rungs + 1)
+            num_runs = min(max(min_runs, int(np.ceil(self.num_runs_per_point * fraction))), self.num_runs_per_point)
+            timesteps = min(max(min_timesteps, int(np.ceil(self.max_timesteps * fraction))), self.max_timesteps)
+            print(f"Rung {rung}: {len(survivors)} candidates, {num_runs} runs of {timesteps} timesteps")
+
+            flows = np.array([self._run_single_simulation(num_cars, rule_factory(params), num_runs,
+                                                          timesteps, seed)["flow"]
+                              for params in survivors])
+            simulated_steps += len(survivors) * num_runs * timesteps
+            history.append({'num_runs': num_runs, 'timesteps': timesteps,
+                            'candidates': survivors, 'flows': flows})
+
+            ranking = np.argsort(-flows, kind="stable")
+            num_kept = max(int(np.ceil(len(survivors) / eta)), 1)
+            if rung < num_rungs - 1:
+                survivors = [survivors[k] for k in ranking[:num_kept]]
+
+        best = ranking[0]
+        exhaustive_steps = len(candidates) * self.num_runs_per_point * self.max_timesteps
+        return {'best_parameters': survivors[best], 'best_flow': flows[best],
+                'history': history, 'simulated_fraction': simulated_steps / exhaustive_steps}
+
+    def optimise_traffic_lights(self, num_cars, max_velocity, light_positions, cycle_lengths,
+                                green_fractions, offsets, braking_probability=0.1, num_candidates=None,
+                                eta=3, min_runs=1, min_timesteps=100, seed=0):
+        """
+        Searches the fixed-cycle plan (cycle length, green fraction, offset) with the highest flow
+        by successive halving instead of an exhaustive grid.
+        :param cycle_lengths: candidate total cycle lengths
+        :param green_fractions: candidate fractions of the cycle which are green
+        :param offsets: candidate time delays between neighbouring lights (0 is synchronised)
+        :param num_candidates: if given, a random subset of this size of the grid is searched
+        :return: results dict of _successive_halving
+        """
+        num_lights = len(light_positions)
+        candidates = []
+        for T in cycle_lengths:
+            for fraction in green_fractions:
+                green = int(np.clip(round(T * fraction), 1, T - 1))
+                for delay in offsets:
+                    candidates.append({'green_duration': green, 'red_duration': int(T) - green,
+                                       'offset': delay})
+        if num_candidates is not None and num_candidates < len(candidates):
+            picks = np.random.RandomState(seed).choice(len(candidates), num_candidates, replace=False)
+            candidates = [candidates[k] for k in picks]
+
+        def rule_factory(params):
+            return rule.TrafficLights(self.road_length, max_velocity, light_positions,
+                                      [params['green_duration']] * num_lights,
+                                      [params['red_duration']] * num_lights,
+                                      start_red=[False] * num_lights,
+                                      offset=[k * params['offset'] for k in range(num_lights)],
+                                      braking_probability=braking_probability)
+
+        return self._successive_halving(rule_factory, candidates, num_cars, eta, min_runs, min_timesteps, seed)
+
+    def optimise_sotl(self, num_cars, max_velocity, light_positions, distance_values, threshold_values,
+                      min_green_values, max_green_values, braking_probability=0.1, num_candidates=None,
+                      eta=3, min_runs=1, min_timesteps=100, seed=0):
+        """
+        Searches the self organised parameters (d, threshold, min_green, max_green) with the highest flow
+        by successive halving instead of an exhaustive grid.
+        :param num_candidates: if given, a random subset of this size of the grid is searched
+        :return: results dict of _successive_halving
+        """
+        candidates = [{'d': d, 'threshold': threshold, 'min_green': min_green, 'max_green': max_green}
+                      for d in distance_values for threshold in threshold_values
+                      for min_green in min_green_values for max_green in max_green_values
+                      if min_green <= max_green]
+        if num_candidates is not None and num_candidates < len(candidates):
+            picks = np.random.RandomState(seed).choice(len(candidates), num_candidates, replace=False)
+            candidates = [candidates[k] for k in picks]
+
+        def rule_factory(params):
+            return rule.SelfOrganisedTrafficLights(self.road_length, max_velocity, light_positions,
+                                                   params['d'], params['threshold'],
+                                                   params['min_green'], params['max_green'],
+                                                   braking_probability=braking_probability)
+
+        return self._successive_halving(rule_factory, candidates, num_cars, eta, min_runs, min_timesteps, seed)
+
     @staticmethod
     def write_csv_grid(data_grid, filename):
         full_path = f"{filename}.csv"
@@ -276,8 +704,15 @@ class Analyser:
 
     def analyse_sotl_parametergrid(self, num_cars, max_velocity, light_positions,
                                    threshold_values, distance_values, fixed_parameters):
-
-        flows_grid = np.zeros((len(threshold_values), len(distance_values)))
+        """
+        Analyses the influence of threshold and distance of the self organised strategy.
+        :return: results dict with (thresholds, distances) grids of every metric, e.g. flows_grid,
+                 flow_stderr_grid, flow_ci_lower_grid and flow_ci_upper_grid
+        """
+        grids = {}
+        for name, key in self.RESULT_KEYS.items():
+            for grid_key in (f"{key}_grid", f"{name}_stderr_grid", f"{name}_ci_lower_grid", f"{name}_ci_upper_grid"):
+                grids[grid_key] = np.zeros((len(threshold_values), len(distance_values)))
         for i, threshold_val in enumerate(threshold_values):
             for j, distance_val in enumerate(distance_values):
                 print(f"  Processing Threshold={threshold_val}, Distance={distance_val}")
@@ -292,24 +727,40 @@ class Analyser:
                 )
 
                 metrics = self._run_single_simulation(num_cars, sotl_rule)
-                flows_grid[i, j] = metrics["flow"]
+                for name, key in self.RESULT_KEYS.items():
+                    grids[f"{key}_grid"][i, j] = metrics[name]
+                    for suffix in ("stderr", "ci_lower", "ci_upper"):
+                        grids[f"{name}_{suffix}_grid"][i, j] = metrics[f"{name}_{suffix}"]
         results = {
             'thresholds': threshold_values,
             'distances': distance_values,
-            'flows_grid': flows_grid
+            **grids
         }
-        self.write_csv_grid(flows_grid, "data/flows_grid.csv")
+        self.write_csv_grid(grids['flows_grid'], "data/flows_grid.csv")
         return results
 
     def compare_gw_sotl(self, num_cars_list, max_velocity, light_positions,
-                        gw_parameters, sotl_parameters):
+                        gw_parameters, sotl_parameters, paired=False, antithetic=False,
+                        control_variate=False, seed=None, warm_start=False, relaxation_steps=None,
+                        measure_steps=None):
+        """
+        Compares the green wave strategy with the self organised strategy over densities.
+        :param paired: if True, both strategies are simulated with common random numbers and the
+                       flow difference (green wave - self organised) is reported with a confidence interval
+        :param antithetic: adds a mirrored braking run to every paired run
+        :param control_variate: corrects the difference with the realised braking rate as control variate
+        :param seed: if given, run k of both strategies draws its initial state and braking events from
+                     seed + k, as in density_vel_flow. Paired runs always need common random numbers and
+                     use seed 0 if none is given.
+        :param warm_start: continuation sweep over the densities for every strategy. Not available for paired runs.
+        :param relaxation_steps: steps discarded at every density of a warm start sweep
+        :param measure_steps: steps measured at every density of a warm start sweep
+        """
+        if paired and warm_start:
+            raise ValueError("warm_start is not available for paired runs")
 
         num_lights = len(light_positions)
-        results = {
-            "densities": [],
-            'gw_flows': [], 'sotl_flows': [],
-            'gw_velocities': [], 'sotl_velocities': []
-        }
+        results = {"densities": [], **self._new_results("gw_"), **self._new_results("sotl_")}
 
         gw_rule = rule.TrafficLights(self.road_length, max_velocity, light_positions,
                                      [gw_parameters['green_duration']] * num_lights,
@@ -324,166 +775,28 @@ class Analyser:
             sotl_parameters['min_green'], sotl_parameters['max_green'],
             braking_probability=0.1)
 
-        for num_cars in num_cars_list:
+        if paired:
+            results.update({'flow_differences': [], 'flow_difference_stderrs': [], 'flow_difference_cis': []})
+
+        if warm_start:
+            gw_sweep = self._run_warm_start_sweep(num_cars_list, gw_rule, relaxation_steps, measure_steps, seed)
+            sotl_sweep = self._run_warm_start_sweep(num_cars_list, sotl_rule, relaxation_steps, measure_steps, seed)
+
+        for k, num_cars in enumerate(num_cars_list):
             print(f"Processing density={num_cars/self.road_length}")
             results["densities"].append(num_cars / self.road_length)
-            gw_metrics = self._run_single_simulation(num_cars, gw_rule)
-            sotl_metrics = self._run_single_simulation(num_cars, sotl_rule)
-            results['gw_flows'].append(gw_metrics["flow"])
-            results['gw_velocities'].append(gw_metrics["velocity"])
-            results['sotl_flows'].append(sotl_metrics["flow"])
-            results['sotl_velocities'].append(sotl_metrics["velocity"])
+            if paired:
+                per_rule = self._run_paired_simulations(num_cars, [gw_rule, sotl_rule], 0 if seed is None else seed,
+                                                        antithetic)
+                self._compare_paired(results, ['gw', 'sotl'], per_rule, 0.1, control_variate)
+            elif warm_start:
+                gw_metrics, sotl_metrics = gw_sweep[k], sotl_sweep[k]
+            else:
+                gw_metrics = self._run_single_simulation(num_cars, gw_rule, seed=seed)
+                sotl_metrics = self._run_single_simulation(num_cars, sotl_rule, seed=seed)
+            if not paired:
+                self._append_metrics(results, gw_metrics, "gw_")
+                self._append_metrics(results, sotl_metrics, "sotl_")
 
         return results
 
-
-max_timesteps = int(2000)
-max_velocity = 5
-
-"""
-# compares gw and sotl strategies across all densities for fixed parameters (density / flow and velocity - plots)
-road_length = 200
-analyser = Analyser(road_length, max_timesteps, 5)
-visualiser = visualiser.Visualiser()
-num_cars_list = np.arange(1, road_length + 1, 1)
-light_positions = [25, 75, 125, 175]
-gw_parameters = {"green_duration": 10, "red_duration": 10,
-                 "offset": [k*10 for k in range(len(light_positions))]}
-sotl_parameters = {"d": 10, "threshold":25,
-                   "min_green": 10, "max_green":20}
-results = analyser.compare_gw_sotl(num_cars_list, max_velocity, light_positions,
-                        gw_parameters, sotl_parameters)
-visualiser.compare_gw_sotl(results)
-"""
-
-"""
-# Analyses the influence of distance and threshold parameter in a 2d grid and produces a flow heatmap
-road_length = 200
-analyser = Analyser(road_length, max_timesteps, 5)
-visualiser = visualiser.Visualiser()
-num_cars = 140
-light_positions = [25, 75, 125, 175]
-fixed_parameters = {"min_green": 10, "max_green": 25, "braking_probability": 0.1}
-threshold_values = np.arange(1, 40, 1)
-distance_values = np.arange(1, 40, 1)
-results = analyser.analyse_sotl_parametergrid(num_cars, max_velocity, light_positions,
-                                              threshold_values, distance_values, fixed_parameters)
-path_to_grid = "data/flows_grid.csv"
-visualiser.sotl_parameter_influence_grid(threshold_values, distance_values, path_to_grid)
-"""
-
-"""
-# analyses the influence of parameters in the sotl strategy by varying one and fixing the other
-road_length = 200
-analyser = Analyser(road_length, max_timesteps, 5)
-visualiser = visualiser.Visualiser()
-num_cars = 10
-light_positions = [25, 75, 125, 175]
-fixed_parameters= {"threshold":4, "min_green":10, "max_green":25}
-parameter_to_vary = "d"
-parameter_values = np.arange(5, 40, 1)
-results = analyser.analyse_sotl_parameter_onefixed(num_cars, max_velocity, light_positions,
-                                parameter_to_vary, parameter_values, fixed_parameters)
-visualiser.sotl_parameter_influence_onefixed(parameter_to_vary, parameter_values, results["flows"])
-"""
-
-"""
-# code to obtain cycle length vs. flow plot for different time delays
-# to compare synchronised strategy with green wave strategy using the optimal time delay
-road_length = 200
-analyser = Analyser(road_length, max_timesteps, 5)
-visualiser = visualiser.Visualiser()
-num_cars = 100
-light_positions = [25, 75, 125, 175]
-green_durations = [15, 15, 15, 15]
-red_durations = [15, 15, 15, 15]
-start_red = [False, False, False, False]
-cycle_lengths = np.arange(5, 151, 5)
-offsets = [0, 10]
-flow, velocities = analyser.traffic_light_cycle_flow_offset(num_cars, max_velocity,
-                                        light_positions, cycle_lengths,
-                                        offsets, 0.1)
-visualiser.traffic_light_cycle_flow_delay(cycle_lengths, offsets, flow, velocities)
-"""
-
-# code to analyse the influence of green and red proportion
-road_length = 200
-analyser = Analyser(road_length, max_timesteps, 5)
-visualiser = visualiser.Visualiser()
-num_cars = 10
-light_positions = [25, 75, 125, 175]
-total_cycle_lengths = [30, 70, 100]
-proportion_results = analyser.analyse_green_red_split(num_cars, max_velocity, light_positions,
-                                total_cycle_lengths, 0.1)
-results_path = "pickle_results/green_red_split.pkl"
-visualiser.red_green_proportion_plot(results_path)
-
-"""
-road_length = 200
-analyser = Analyser(road_length, max_timesteps, 5)
-visualiser = visualiser.Visualiser()
-num_cars_list = np.arange(1, road_length + 1, 1)
-sync_parameters = {"green_duration": 15, "red_duration":15}
-light_positions = [25, 75, 125, 175]
-cycle_lengths = np.arange(5, 151, 5)
-optimal_offset = 10
-results = analyser.compare_sync_gw(num_cars_list, max_velocity,
-                                        light_positions, sync_parameters,
-                                        optimal_offset)
-visualiser.compare_sync_gw(results)
-"""
-
-"""
-# code to obtain flow vs time delay plot
-# to verify optimal time delay for the green wave strategy
-road_length = 200
-analyser = Analyser(road_length, max_timesteps, 10)
-visualiser = visualiser.Visualiser()
-num_cars_list = [10]
-light_positions = [25, 75, 125, 175]
-green_durations = [15, 15, 15, 15]
-red_durations = [15, 15, 15, 15]
-start_red = [False, False, False, False]
-offset_range = [k for k in range(30)]
-braking_probability = 0.1
-flow = analyser.traffic_light_offset_analysis(num_cars_list, max_velocity,
-                                  light_positions, green_durations, red_durations,
-                                  offset_range, braking_probability)
-visualiser.traffic_light_delay_flow_plot(num_cars_list, road_length, offset_range, flow)
-"""
-
-"""
-#Code to obtain the plot cycle length vs. through flow
-# to understand the relation of those parameters for the synchronised strategy
-road_length = 200
-analyser = Analyser(road_length, max_timesteps, 20)
-visualiser = visualiser.Visualiser()
-num_cars = [10, 40, 100, 140]
-cycle_lengths = np.arange(1, 151, 1)
-light_positions = [25, 75, 125, 175]
-flow = analyser.traffic_light_cycle_analysis(num_cars, max_velocity, light_positions,
-                                             cycle_lengths, 0.1)
-path_to_flows = "pickle_results/flows_cycle.pkl"
-visualiser.traffic_light_cycle_flow_sync_plot(num_cars, road_length, cycle_lengths, path_to_flows)
-"""
-
-"""
-#Code to obtain the density flow/mean velocity plot
-road_length = 100
-analyser = Analyser(road_length, max_timesteps, 3)
-visualiser = visualiser.Visualiser()
-max_velocity_list = [1, 2, 3, 4, 5]
-braking_prob_list = [0.0, 0.1, 0.5, 0.9]
-#results = analyser.density_vel_flow(max_velocity_list, braking_prob_list)
-visualiser.density_meanvel_flow_plot("pickle_results/density_vel_flow.pkl", "vmax=5")
-"""
-
-"""
-road_length = 200
-analyser = Analyser(road_length, max_timesteps, 5)
-visualiser = visualiser.Visualiser()
-num_cars = 50
-p_values = np.linspace(0, 1, 20)
-results = analyser.flow_braking_prob_plot(p_values, num_cars)
-visualiser.flow_braking_prob(p_values, results["flows"])
-"""
\ No newline at end of file
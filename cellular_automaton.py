@@ -1,4 +1,5 @@
 import numpy as np
+from spacetime_io import SpaceTimeWriter
 
 
 """
@@ -8,12 +9,38 @@ approach, where the positions and velocities of each car are tracked and updated
 
 class CellularAutomaton:
     def __init__(self, initial_positions, initial_velocities, 
-                 road_length, max_timesteps, detect_start=None, detect_end=None):
+                 road_length, max_timesteps, detect_start=None, detect_end=None,
+                 record_evolution=True, record_trajectories=False, live_buffer=None,
+                 record_light_states=True, evolution_file=None, chunk_rows=1024):
+        """
+        :param record_evolution: records the dense (max_timesteps, road_length) occupancy grid
+        :param record_trajectories: records int32 (max_timesteps, cars) positions and velocities of
+                                    every vehicle, whose columns follow the order of the initial positions
+        :param live_buffer: SpaceTimeRingBuffer every timestep is pushed into, for watching the simulation
+        :param record_light_states: keeps the light states of every timestep in light_state_history
+        :param evolution_file: .npy path the occupancy grid is written to in chunks of chunk_rows rows instead
+                               of keeping it in memory; traffic_evolution is then a read-only memmap of it
+        """
         self.road_length = road_length
         self.max_timesteps = max_timesteps
         self.positions = initial_positions
         self.velocities = initial_velocities
-        self.traffic_evolution = np.zeros((self.max_timesteps, self.road_length))
+        self.record_evolution = record_evolution
+        self.evolution_file = evolution_file
+        self.chunk_rows = chunk_rows
+        self.evolution_writer = None
+        self.traffic_evolution = (np.zeros((self.max_timesteps, self.road_length))
+                                  if record_evolution and evolution_file is None else None)
+        self.record_trajectories = record_trajectories
+        self.live_buffer = live_buffer
+        self.fleet = None
+        self.record_light_states = record_light_states
+        if record_trajectories:
+            num_cars = len(initial_positions)
+            self.trajectory_positions = np.zeros((self.max_timesteps, num_cars), dtype=np.int32)
+            self.trajectory_velocities = np.zeros((self.max_timesteps, num_cars), dtype=np.int32)
+            # vehicle at each index of the positions array, the rules return the cars in sorted order
+            self.vehicle_ids = np.arange(num_cars)
         self.local_space_meanVels = np.zeros(self.max_timesteps)
         self.local_velocity_variance = np.zeros(self.max_timesteps)
         self.local_densities = np.zeros(self.max_timesteps)
@@ -24,26 +51,50 @@ class CellularAutomaton:
 
     def simulate(self, rule):
         self.light_state_history = []
-        for t in range(self.max_timesteps):
-            self.update_traffic_evolution(t)
-            current_positions = np.copy(self.positions)
-            current_velocities = np.copy(self.velocities)
-
-            # local detector measurements
-            if self.start is not None and self.end is not None:
-                (local_mean_velocity, local_variance_velocity,
-                 local_density, local_flow) = self.local_measurement(current_positions, current_velocities)
-                self.local_space_meanVels[t] = local_mean_velocity
-                self.local_velocity_variance[t] = local_variance_velocity
-                self.local_densities[t] = local_density
-                self.local_flows[t] = local_flow
+        rule.reset()
+        # multi-cell vehicles of a mixed fleet cover several cells of the occupancy grid
+        fleet = getattr(rule, "fleet", None)
+        self.fleet = fleet if fleet is not None and np.any(fleet.lengths > 1) else None
+        if self.record_evolution and self.evolution_file is not None:
+            self.evolution_writer = SpaceTimeWriter(self.evolution_file, self.max_timesteps,
+                                                    self.road_length, self.chunk_rows)
+        try:
+            for t in range(self.max_timesteps):
+                # the cells are taken before apply_rule, which reorders the fleet when a car passes the end
+                cells = self.occupied_cells(self.positions) \
+                    if self.record_evolution or self.live_buffer is not None else None
+                self.update_traffic_evolution(t, cells)
+                current_positions = np.copy(self.positions)
+                current_velocities = np.copy(self.velocities)
+                if self.record_trajectories:
+                    self.update_trajectories(t, current_positions, current_velocities)
+
+                # local detector measurements
+                if self.start is not None and self.end is not None:
+                    (local_mean_velocity, local_variance_velocity,
+                     local_density, local_flow) = self.local_measurement(current_positions, current_velocities)
+                    self.local_space_meanVels[t] = local_mean_velocity
+                    self.local_velocity_variance[t] = local_variance_velocity
+                    self.local_densities[t] = local_density
+                    self.local_flows[t] = local_flow
                     
-            next_positions, next_velocities = rule.apply_rule(current_positions, current_velocities, t)
-            current_light_states = rule.get_light_states(t)
-            self.light_state_history.append(current_light_states)
-            self.positions = next_positions
-            self.velocities = next_velocities
+                next_positions, next_velocities = rule.apply_rule(current_positions, current_velocities, t)
+                current_light_states = rule.get_light_states(t)
+                if self.record_light_states:
+                    self.light_state_history.append(current_light_states)
+                if self.live_buffer is not None:
+                    self.live_buffer.push(cells, current_light_states)
+                self.positions = next_positions
+                self.velocities = next_velocities
 
+            if self.evolution_writer is not None:
+                self.traffic_evolution = self.evolution_writer.close()
+                self.evolution_writer = None
+        finally:
+            # a failed run must not leave the writer thread and the open file behind
+            if self.evolution_writer is not None:
+                self.evolution_writer.abort()
+                self.evolution_writer = None
         return (self.traffic_evolution, self.local_space_meanVels, self.local_velocity_variance,
                 self.local_densities, self.local_flows, self.light_state_history)
 
@@ -65,6 +116,59 @@ class CellularAutomaton:
         
         return local_mean_velocity, local_variance_velocity, local_density, local_flow
 
-    def update_traffic_evolution(self, t):
-        for i in self.positions:
-            self.traffic_evolution[t, int(i)] = 1
+    def occupied_cells(self, positions):
+        if self.fleet is None:
+            return positions
+        return self.fleet.occupied_cells(positions, self.road_length)
+
+    def update_traffic_evolution(self, t, cells):
+        """
+        :param cells: occupied cells of timestep t, see occupied_cells
+        """
+        if self.evolution_writer is not None:
+            self.evolution_writer.push(cells)
+        elif self.record_evolution:
+            self.traffic_evolution[t, np.asarray(cells).astype(int)] = 1
+
+    def update_trajectories(self, t, current_positions, current_velocities):
+        self.trajectory_positions[t, self.vehicle_ids] = current_positions
+        self.trajectory_velocities[t, self.vehicle_ids] = current_velocities
+        # the rule returns the cars sorted by position, so the ids are sorted the same way
+        self.vehicle_ids = self.vehicle_ids[np.argsort(current_positions)]
+
+
+class BatchedCellularAutomaton(CellularAutomaton):
+    """
+    Simulates a batch of plans on the same road at once. Positions and velocities are (plans, cars)
+    arrays and the detector measurements are (max_timesteps, plans) arrays. The occupancy grid is not
+    recorded, since it would need max_timesteps x plans x road_length cells.
+    """
+    def __init__(self, initial_positions, initial_velocities,
+                 road_length, max_timesteps, detect_start=None, detect_end=None):
+        super().__init__(initial_positions, initial_velocities, road_length, max_timesteps,
+                         detect_start, detect_end, record_evolution=False)
+        # one measurement per plan and timestep
+        num_plans = initial_positions.shape[0]
+        self.local_space_meanVels = np.zeros((self.max_timesteps, num_plans))
+        self.local_velocity_variance = np.zeros((self.max_timesteps, num_plans))
+        self.local_densities = np.zeros((self.max_timesteps, num_plans))
+        self.local_flows = np.zeros((self.max_timesteps, num_plans))
+
+    def local_measurement(self, current_positions, current_velocities):
+        mask = (current_positions >= self.start) & (current_positions <= self.end)
+        num_cars = np.sum(mask, axis=1)
+        region_length = self.end - self.start + 1  # inclusive detector region
+        local_density = num_cars / region_length
+
+        # plans without cars in the detector region report zero velocity and variance
+        detected_cars = np.maximum(num_cars, 1)
+        local_mean_velocity = np.sum(current_velocities * mask, axis=1) / detected_cars
+        deviations = (current_velocities - local_mean_velocity[:, None]) * mask
+        local_variance_velocity = np.sum(deviations ** 2, axis=1) / detected_cars
+
+        local_flow = local_density * local_mean_velocity
+
+        return local_mean_velocity, local_variance_velocity, local_density, local_flow
+
+    def update_traffic_evolution(self, t, cells):
+        pass
@@ -0,0 +1,193 @@
+import numpy as np
+from statistics import NormalDist
+
+
+"""
+Estimators for the uncertainty of simulation results: confidence intervals of paired differences,
+antithetic runs and control variates, and vectorised standard errors and bootstrap intervals of
+(points, runs, timesteps) result arrays.
+"""
+
+class AntitheticRandomState:
+    """
+    Wraps a np.random.RandomState and mirrors its uniform numbers (u -> 1-u), so that a run with this
+    random state brakes exactly where the run with the wrapped state does not.
+    """
+    def __init__(self, random_state):
+        self.random_state = random_state
+
+    def rand(self, *shape):
+        return 1 - self.random_state.rand(*shape)
+
+    def random_sample(self, size=None):
+        return 1 - self.random_state.random_sample(size)
+
+    def choice(self, *args, **kwargs):
+        return self.random_state.choice(*args, **kwargs)
+
+
+def t_coverage(t, dof):
+    """
+    Probability that |T| < t for Student's t-distribution with an integer number of degrees of freedom,
+    from the finite series in Abramowitz and Stegun 26.7.3 and 26.7.4.
+    """
+    theta = np.arctan(t / np.sqrt(dof))
+    cos_squared = np.cos(theta) ** 2
+    if dof % 2 == 1:
+        term, total = np.cos(theta), 0.0
+        for k in range(1, (dof - 1) // 2 + 1):
+            total += term
+            term *= cos_squared * 2 * k / (2 * k + 1)
+        return 2 / np.pi * (theta + np.sin(theta) * total)
+    term, total = 1.0, 0.0
+    for k in range(1, dof // 2 + 1):
+        total += term
+        term *= cos_squared * (2 * k - 1) / (2 * k)
+    return np.sin(theta) * total
+
+
+def t_quantile(confidence, dof):
+    """
+    Two-sided quantile of Student's t-distribution. Up to 30 degrees of freedom it is found by bisection
+    of the exact distribution function, above from the Cornish-Fisher expansion around the normal
+    quantile (accurate to about 1e-4 there).
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    dof = max(int(dof), 1)
+    if dof <= 30:
+        lower, upper = z, 1.0
+        while t_coverage(upper, dof) < confidence:
+            upper *= 2
+        for _ in range(60):
+            middle = 0.5 * (lower + upper)
+            if t_coverage(middle, dof) < confidence:
+                lower = middle
+            else:
+                upper = middle
+        return 0.5 * (lower + upper)
+    return (z + (z ** 3 + z) / (4 * dof)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * dof ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * dof ** 3))
+
+
+def mean_confidence_interval(samples, confidence=0.95, control=None, control_mean=None):
+    """
+    Mean of independent samples with its standard error and confidence interval.
+    :param samples: 1d array of independent samples, e.g. one value per run
+    :param control: optional control variate per sample, whose expectation control_mean is known.
+                    The samples are corrected by the regression on the control. The estimated
+                    coefficient costs one more degree of freedom.
+    :return: dict with mean, stderr and ci=(lower, upper)
+    """
+    samples = np.asarray(samples, dtype=float)
+    n = len(samples)
+    dof = n - 1
+    if control is not None:
+        control = np.asarray(control, dtype=float)
+        control_variance = np.var(control, ddof=1) if n > 2 else 0
+        if control_variance > 0:
+            beta = np.cov(samples, control, ddof=1)[0, 1] / control_variance
+            samples = samples - beta * (control - control_mean)
+            dof = n - 2
+    mean = np.mean(samples)
+    stderr = np.std(samples, ddof=n - dof) / np.sqrt(n) if dof > 0 else np.inf
+    half_width = t_quantile(confidence, dof) * stderr
+    return {"mean": mean, "stderr": stderr, "ci": (mean - half_width, mean + half_width)}
+
+
+def paired_difference(first, second, confidence=0.95, control=None, control_mean=None):
+    """
+    Difference of two strategies simulated with common random numbers.
+    :param first: per run values of the first strategy, shape (runs,) or (runs, 2) for antithetic pairs
+    :param second: per run values of the second strategy, same shape as first
+    :param control: optional control variate per run (same shape as first), with known mean control_mean
+    :return: dict with mean, stderr and ci of first - second
+    """
+    differences = np.asarray(first, dtype=float) - np.asarray(second, dtype=float)
+    if differences.ndim == 2:
+        # antithetic pairs are averaged into one independent sample
+        differences = differences.mean(axis=1)
+        if control is not None:
+            control = np.asarray(control, dtype=float).mean(axis=1)
+    return mean_confidence_interval(differences, confidence, control, control_mean)
+
+
+def batch_means_stderr(series, num_batches=20):
+    """
+    Standard error of the time average of autocorrelated series, from the spread of the means of
+    num_batches consecutive batches.
+    :param series: array (..., timesteps), e.g. (points, runs, timesteps)
+    :return: array (...)
+    """
+    series = np.asarray(series, dtype=float)
+    num_batches = min(num_batches, series.shape[-1])
+    batch_length = series.shape[-1] // num_batches
+    batches = series[..., :num_batches * batch_length].reshape(series.shape[:-1] + (num_batches, batch_length))
+    return np.std(batches.mean(axis=-1), axis=-1, ddof=1) / np.sqrt(num_batches)
+
+
+def blocking_stderr(series, min_blocks=16):
+    """
+    Standard error of the time average of autocorrelated series by the blocking method of Flyvbjerg and
+    Petersen: neighbouring values are averaged pairwise until the blocks are uncorrelated, and the
+    largest error estimate of the levels with at least min_blocks blocks is returned.
+    :param series: array (..., timesteps)
+    :return: array (...)
+    """
+    blocks = np.asarray(series, dtype=float)
+    stderr = np.zeros(blocks.shape[:-1])
+    while blocks.shape[-1] >= min_blocks:
+        n = blocks.shape[-1]
+        stderr = np.maximum(stderr, np.std(blocks, axis=-1, ddof=1) / np.sqrt(n))
+        blocks = 0.5 * (blocks[..., 0:n - n % 2:2] + blocks[..., 1:n - n % 2:2])
+    return stderr
+
+
+def bootstrap_ci(run_values, confidence=0.95, num_resamples=1000, rng=None):
+    """
+    Percentile bootstrap confidence interval of the mean over runs. All points share the same
+    resampling indices, so the whole array is resampled at once.
+    :param run_values: array (..., runs), e.g. per run means of every parameter point
+    :return: lower and upper bound arrays (...)
+    """
+    run_values = np.asarray(run_values, dtype=float)
+    rng = np.random.default_rng() if rng is None else rng
+    num_runs = run_values.shape[-1]
+    resamples = rng.integers(0, num_runs, size=(num_resamples, num_runs))
+    resampled_means = run_values[..., resamples].mean(axis=-1)
+    alpha = (1 - confidence) / 2
+    lower, upper = np.quantile(resampled_means, [alpha, 1 - alpha], axis=-1)
+    return lower, upper
+
+
+def summarise_runs(series, confidence=0.95, num_batches=20, rng=None):
+    """
+    Mean of (points, runs, timesteps) results with its uncertainty. With several runs the standard error
+    is the larger of the spread of the independent run means and the blocking error within the runs,
+    which accounts for the correlation in time and is more stable for a handful of runs. The interval
+    is the bootstrap interval over the runs, widened to t * stderr where that is larger. With a single
+    run, the standard error comes from batch means over time.
+    :param rng: np.random.Generator of the bootstrap, seeded for reproducible intervals
+    :return: dict of (points,) arrays: mean, stderr, ci_lower, ci_upper, and (points, runs) run_means
+    """
+    series = np.asarray(series, dtype=float)
+    run_means = series.mean(axis=-1)
+    mean = run_means.mean(axis=-1)
+    num_runs = series.shape[-2]
+    if num_runs > 1:
+        between_runs = np.std(run_means, axis=-1, ddof=1) / np.sqrt(num_runs)
+        within_runs = np.sqrt(np.sum(blocking_stderr(series) ** 2, axis=-1)) / num_runs
+        stderr = np.maximum(between_runs, within_runs)
+        # the blocking error pools many blocks, so it comes with (nearly) normal quantiles
+        quantile = np.where(between_runs >= within_runs, t_quantile(confidence, num_runs - 1),
+                            NormalDist().inv_cdf(0.5 + confidence / 2))
+        half_width = quantile * stderr
+        ci_lower, ci_upper = bootstrap_ci(run_means, confidence, rng=rng)
+        ci_lower, ci_upper = np.minimum(ci_lower, mean - half_width), np.maximum(ci_upper, mean + half_width)
+    else:
+        num_batches = min(num_batches, series.shape[-1])
+        stderr = batch_means_stderr(series, num_batches)[..., 0]
+        half_width = t_quantile(confidence, num_batches - 1) * stderr
+        ci_lower, ci_upper = mean - half_width, mean + half_width
+    return {"mean": mean, "stderr": stderr, "ci_lower": ci_lower, "ci_upper": ci_upper, "run_means": run_means}
+
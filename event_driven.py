@@ -0,0 +1,136 @@
+import numpy as np
+
+
+"""
+Event-driven engine for MaxVelocity and TrafficLights runs at low density. A car that drives at
+max_velocity with a large gap and no light within reach moves max_velocity - 1 or max_velocity cells per
+step, depending only on random braking. Such free cars are not stepped: they get a deadline, the number of
+steps for which they surely cannot interact, and are advanced in one go by
+n * max_velocity - Binomial(n, p) cells when they are needed. Only the remaining active cars are updated
+cell by cell with the usual rule, and when no car is active the time jumps to the next deadline.
+The results are statistically equivalent to CellularAutomaton, but use different random numbers.
+"""
+
+class EventDrivenAutomaton:
+    def __init__(self, initial_positions, initial_velocities, road_length, max_timesteps):
+        order = np.argsort(initial_positions)
+        self.road_length = road_length
+        self.max_timesteps = max_timesteps
+        # positions are not wrapped around, so the ring order of the cars never changes
+        self.positions = np.asarray(initial_positions, dtype=np.int64)[order]
+        self.velocities = np.asarray(initial_velocities, dtype=int)[order]
+        num_cars = len(self.positions)
+        # time every car's position and velocity refer to, and whether it is free (not stepped)
+        self.last_update = np.zeros(num_cars, dtype=int)
+        self.is_free = np.zeros(num_cars, dtype=bool)
+        self.distance_travelled = 0
+        self.active_car_steps = 0
+
+    def advance_free_cars(self, cars, time_step, rule):
+        """
+        Moves free cars from their last update to time_step. In each of the n steps the car accelerates
+        to max_velocity and brakes with probability p, so it moves n * max_velocity - Binomial(n, p) cells
+        and its velocity is the one of the last step.
+        """
+        steps = time_step - self.last_update[cars]
+        moved = steps > 0
+        p = rule.braking_probability or 0
+        braked_last = moved & (rule.rng.rand(len(cars)) < p)
+        braked_before = rule.rng.binomial(np.maximum(steps - 1, 0), p)
+        displacement = steps * rule.max_velocity - braked_before - braked_last
+        self.positions[cars] += displacement
+        self.velocities[cars] = np.where(moved, rule.max_velocity - braked_last, self.velocities[cars])
+        self.last_update[cars] = time_step
+        self.distance_travelled += int(displacement.sum())
+
+    def gaps_to_leaders(self, cars):
+        leaders = (cars + 1) % len(self.positions)
+        # the leader of the last car is the first one, one lap ahead
+        return self.positions[leaders] + self.road_length * (leaders <= cars) - self.positions[cars] - 1
+
+    def free_steps(self, cars, time_step, deadlines, light_positions, max_velocity):
+        """
+        Number of steps every car surely drives freely: its gap stays at least max_velocity and no light
+        comes within max_velocity cells. A free leader moves at least max_velocity - 1 cells per step
+        until its own deadline, so the gap shrinks by at most one cell per step until then; afterwards
+        the leader may stand still and the gap shrinks by up to max_velocity cells per step.
+        """
+        leaders = (cars + 1) % len(self.positions)
+        leader_free = self.is_free[leaders]
+        # guaranteed progress of the free leaders since their last update and number of steps they stay free
+        catch_up = np.where(leader_free, (max_velocity - 1) * (time_step - self.last_update[leaders]), 0)
+        leader_steps = np.where(leader_free, deadlines[leaders] - time_step, 0)
+        gaps = self.gaps_to_leaders(cars) + catch_up
+        steps = np.where(gaps - max_velocity + 1 <= leader_steps + 1,
+                         gaps - max_velocity + 1,
+                         leader_steps + (gaps - leader_steps) // max_velocity)
+        if len(light_positions) > 0:
+            wrapped = self.positions[cars] % self.road_length
+            next_light = np.searchsorted(light_positions, wrapped, side="right") % len(light_positions)
+            distance_to_light = (light_positions[next_light] - wrapped - 1) % self.road_length + 1
+            steps = np.minimum(steps, (distance_to_light - 1) // max_velocity)
+        return steps
+
+    def simulate(self, rule):
+        """
+        :param rule: MaxVelocity or TrafficLights instance
+        :return: (mean velocity, flow, fraction of car steps that were computed cell by cell)
+        """
+        num_cars = len(self.positions)
+        light_positions = getattr(rule, "light_positions", None)
+        light_positions = np.sort(np.asarray([] if light_positions is None else light_positions, dtype=int))
+        # free cars are checked again at their deadline, they are kept in one bucket per deadline
+        deadlines = np.zeros(num_cars, dtype=int)
+        buckets = {}
+        active = np.arange(num_cars)
+        t = 0
+        while t < self.max_timesteps:
+            if t in buckets:
+                due = np.concatenate(buckets.pop(t))
+                self.advance_free_cars(due, t, rule)
+                self.is_free[due] = False
+                active = np.concatenate((active, due))
+            if len(active) == 0:
+                t = min(min(buckets), self.max_timesteps) if buckets else self.max_timesteps
+                continue
+
+            # free leaders of active cars are brought to the current time and stay free
+            leaders = (active + 1) % num_cars
+            free_leaders = leaders[self.is_free[leaders]]
+            self.advance_free_cars(free_leaders, t, rule)
+
+            velocities = np.minimum(np.minimum(self.velocities[active] + 1, rule.max_velocity),
+                                    self.gaps_to_leaders(active))
+            if rule.braking_probability is not None:
+                velocities = rule.apply_random_braking(velocities)
+            if len(light_positions) > 0:
+                velocities = rule.clamp_at_red_lights(self.positions[active] % self.road_length, velocities,
+                                                      rule.red_light_positions(t))
+            self.positions[active] += velocities
+            self.velocities[active] = velocities
+            self.last_update[active] = t + 1
+            self.distance_travelled += int(velocities.sum())
+            self.active_car_steps += len(active)
+
+            steps = self.free_steps(active, t + 1, deadlines, light_positions, rule.max_velocity)
+            becomes_free = (velocities >= rule.max_velocity - 1) & (steps >= 1)
+            free_cars = active[becomes_free]
+            deadlines[active] = t + 1 + steps
+            self.is_free[free_cars] = True
+            if len(free_cars) > 0:
+                free_deadlines = np.minimum(deadlines[free_cars], self.max_timesteps)
+                order = np.argsort(free_deadlines, kind="stable")
+                bucket_times, bucket_starts = np.unique(free_deadlines[order], return_index=True)
+                for bucket_time, cars in zip(bucket_times.tolist(), np.split(free_cars[order], bucket_starts[1:])):
+                    buckets.setdefault(bucket_time, []).append(cars)
+            active = active[~becomes_free]
+            t += 1
+
+        self.advance_free_cars(np.nonzero(self.is_free)[0], self.max_timesteps, rule)
+        self.is_free[:] = False
+        self.positions %= self.road_length
+
+        mean_velocity = self.distance_travelled / (num_cars * self.max_timesteps) if num_cars > 0 else 0
+        flow = num_cars / self.road_length * mean_velocity
+        active_fraction = self.active_car_steps / (num_cars * self.max_timesteps) if num_cars > 0 else 0
+        return mean_velocity, flow, active_fraction
@@ -0,0 +1,227 @@
+import numpy as np
+
+
+"""
+Manhattan grid of crossing ring roads. num_rows horizontal streets (driving east) cross num_cols vertical
+streets (driving south) every block_length cells, and each crossing cell is shared by the two streets.
+One controller per intersection decides which of the two streets has green.
+
+All streets are updated together: every car has a street index and a position, the cars are sorted by
+street offset + position, and the intersections a car approaches are looked up by index arithmetic, so
+the cost of a step grows with the number of cars only.
+"""
+
+class FixedCycleIntersections:
+    """
+    Fixed-cycle controllers, the grid version of TrafficLights. The horizontal street has green for
+    green_durations steps, then the vertical street for red_durations steps.
+    """
+    def __init__(self, num_rows, num_cols, green_durations, red_durations, offset=None):
+        """
+        :param green_durations: green time of the horizontal street, scalar or (num_rows, num_cols) array
+        :param red_durations: red time of the horizontal street (green time of the vertical one)
+        :param offset: time delay of the cycle of every intersection, e.g. from green_wave_offsets
+        """
+        shape = (num_rows, num_cols)
+        self.green_durations = np.broadcast_to(green_durations, shape)
+        self.red_durations = np.broadcast_to(red_durations, shape)
+        self.offset = np.broadcast_to(0 if offset is None else offset, shape)
+
+    def horizontal_green(self, time_step, automaton):
+        cycle_time = (time_step - self.offset) % (self.green_durations + self.red_durations)
+        return cycle_time < self.green_durations
+
+
+def green_wave_offsets(num_rows, num_cols, block_length, speed):
+    """
+    Offsets for a green wave in both driving directions: every intersection switches block_length / speed
+    steps after its western and its northern neighbour, so a car at that speed meets green everywhere.
+    """
+    rows, cols = np.meshgrid(np.arange(num_rows), np.arange(num_cols), indexing="ij")
+    return np.round((rows + cols) * block_length / speed).astype(int)
+
+
+class SelfOrganisedIntersections:
+    """
+    Queue-based controllers, the grid version of SelfOrganisedTrafficLights, vectorised over all
+    intersections. The vehicles within distance d in front of the red direction are summed up over time,
+    and the intersection switches when the sum reaches threshold, when the green direction is empty while
+    cars are waiting, or after max_green. It never switches before min_green.
+    """
+    def __init__(self, num_rows, num_cols, d, threshold, min_green, max_green):
+        self.d = d
+        self.threshold = threshold
+        self.min_green = min_green
+        self.max_green = max_green
+        self.is_horizontal_green = np.ones((num_rows, num_cols), dtype=bool)
+        self.time_since_change = np.zeros((num_rows, num_cols), dtype=int)
+        self.waiting_time_counter = np.zeros((num_rows, num_cols), dtype=int)
+
+    def horizontal_green(self, time_step, automaton):
+        count_horizontal, count_vertical = automaton.approach_counts(self.d)
+        count_red = np.where(self.is_horizontal_green, count_vertical, count_horizontal)
+        count_green = np.where(self.is_horizontal_green, count_horizontal, count_vertical)
+        self.waiting_time_counter += count_red
+
+        switch = (self.time_since_change >= self.min_green) & (
+            (self.waiting_time_counter >= self.threshold)
+            | ((count_green == 0) & (count_red > 0))
+            | (self.time_since_change >= self.max_green))
+
+        self.is_horizontal_green ^= switch
+        self.time_since_change = np.where(switch, 0, self.time_since_change + 1)
+        self.waiting_time_counter[switch] = 0
+        return self.is_horizontal_green
+
+
+class GridAutomaton:
+    def __init__(self, num_rows, num_cols, block_length, initial_streets, initial_positions,
+                 initial_velocities, max_timesteps):
+        """
+        :param initial_streets: street of every car, 0 .. num_rows - 1 are the horizontal streets,
+                                num_rows .. num_rows + num_cols - 1 the vertical ones
+        :param initial_positions: position of every car along its street; intersection k of a street
+                                  is at position k * block_length
+        """
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.block_length = block_length
+        self.max_timesteps = max_timesteps
+        self.street_lengths = np.concatenate((np.full(num_rows, num_cols * block_length),
+                                              np.full(num_cols, num_rows * block_length)))
+        self.street_offsets = np.concatenate(([0], np.cumsum(self.street_lengths)))
+        # intersections are counted once
+        self.num_cells = self.street_offsets[-1] - num_rows * num_cols
+        self.streets = np.asarray(initial_streets, dtype=int)
+        self.positions = np.asarray(initial_positions, dtype=int)
+        self.velocities = np.asarray(initial_velocities, dtype=int)
+        self.mean_velocities = np.zeros(max_timesteps)
+        self.flows = np.zeros(max_timesteps)
+        self.horizontal_green_history = []
+
+    @staticmethod
+    def random_cars(num_rows, num_cols, block_length, num_cars, rng=np.random):
+        """
+        Random distinct cells for num_cars cars, outside the intersections.
+        :return: streets and positions
+        """
+        num_intersections = num_rows * num_cols
+        cells = rng.choice(2 * num_intersections * (block_length - 1), num_cars, replace=False)
+        blocks, cell_in_block = np.divmod(cells, block_length - 1)
+        # the blocks of the vertical streets are numbered after all horizontal ones
+        vertical = blocks >= num_intersections
+        vertical_blocks = blocks - num_intersections
+        streets = np.where(vertical, num_rows + vertical_blocks // num_rows, blocks // num_cols)
+        block_in_street = np.where(vertical, vertical_blocks % num_rows, blocks % num_cols)
+        return streets, block_in_street * block_length + cell_in_block + 1
+
+    def intersection_ids(self, streets, intersection_index):
+        """
+        Flat index row * num_cols + col of the intersection_index-th intersection along every street.
+        """
+        horizontal = streets < self.num_rows
+        return np.where(horizontal,
+                        streets * self.num_cols + intersection_index % self.num_cols,
+                        (intersection_index % self.num_rows) * self.num_cols + streets - self.num_rows)
+
+    def next_intersection(self, positions):
+        """
+        Index of the next intersection strictly ahead of every position and the distance to it.
+        """
+        index = positions // self.block_length + 1
+        return index, index * self.block_length - positions
+
+    def approach_counts(self, d):
+        """
+        Counts the vehicles within distance d in front of every intersection.
+        :return: (num_rows, num_cols) counts of the horizontal and of the vertical street
+        """
+        index, distance = self.next_intersection(self.positions)
+        near = distance <= d
+        horizontal = self.streets < self.num_rows
+        ids = self.intersection_ids(self.streets, index)
+        num_intersections = self.num_rows * self.num_cols
+        shape = (self.num_rows, self.num_cols)
+        count_horizontal = np.bincount(ids[near & horizontal], minlength=num_intersections).reshape(shape)
+        count_vertical = np.bincount(ids[near & ~horizontal], minlength=num_intersections).reshape(shape)
+        return count_horizontal, count_vertical
+
+    def compute_gaps(self):
+        """
+        Sorts the cars by street and position and returns the gap of every car to the car ahead on its street.
+        """
+        keys = self.street_offsets[self.streets] + self.positions
+        order = np.argsort(keys)
+        self.streets = self.streets[order]
+        self.positions = self.positions[order]
+        self.velocities = self.velocities[order]
+        keys = keys[order]
+
+        street_starts = np.searchsorted(keys, self.street_offsets)
+        ahead = np.arange(len(keys)) + 1
+        # the last car of a street follows the first one
+        ahead = np.where(ahead >= street_starts[self.streets + 1], street_starts[self.streets], ahead)
+        return (self.positions[ahead] - self.positions - 1) % self.street_lengths[self.streets]
+
+    def clamp_at_intersections(self, velocities, horizontal_green, max_velocity):
+        """
+        Stops every car in front of the first blocked intersection within its reach. An intersection is
+        blocked for a street if the street has red or a car of the crossing street is on it.
+        """
+        on_intersection = self.positions % self.block_length == 0
+        horizontal = self.streets < self.num_rows
+        ids = self.intersection_ids(self.streets, self.positions // self.block_length)
+        num_intersections = self.num_rows * self.num_cols
+        occupied_horizontal = np.zeros(num_intersections, dtype=bool)
+        occupied_vertical = np.zeros(num_intersections, dtype=bool)
+        occupied_horizontal[ids[on_intersection & horizontal]] = True
+        occupied_vertical[ids[on_intersection & ~horizontal]] = True
+
+        horizontal_green = np.ravel(horizontal_green)
+        blocked_horizontal = ~horizontal_green | occupied_vertical
+        blocked_vertical = horizontal_green | occupied_horizontal
+
+        index, distance = self.next_intersection(self.positions)
+        # a car can reach more than one intersection per step on short blocks
+        for _ in range(-(-max_velocity // self.block_length)):
+            ids = self.intersection_ids(self.streets, index)
+            blocked = np.where(horizontal, blocked_horizontal[ids], blocked_vertical[ids])
+            velocities = np.where(blocked & (distance <= velocities), np.minimum(velocities, distance - 1), velocities)
+            index = index + 1
+            distance = distance + self.block_length
+        return velocities
+
+    def simulate(self, rule, controller):
+        """
+        :param rule: MaxVelocity instance, which supplies max_velocity, braking_probability and the random numbers
+        :param controller: FixedCycleIntersections or SelfOrganisedIntersections
+        """
+        self.horizontal_green_history = []
+        num_cars = len(self.positions)
+        density = num_cars / self.num_cells
+        for t in range(self.max_timesteps):
+            self.mean_velocities[t] = np.mean(self.velocities) if num_cars > 0 else 0
+            self.flows[t] = density * self.mean_velocities[t]
+
+            gaps = self.compute_gaps()
+            velocities = np.minimum(np.minimum(self.velocities + 1, rule.max_velocity), gaps)
+            if rule.braking_probability is not None:
+                velocities = rule.apply_random_braking(velocities)
+
+            horizontal_green = controller.horizontal_green(t, self)
+            self.horizontal_green_history.append(np.array(horizontal_green))
+            self.velocities = self.clamp_at_intersections(velocities, horizontal_green, rule.max_velocity)
+            self.positions = (self.positions + self.velocities) % self.street_lengths[self.streets]
+
+        return self.mean_velocities, self.flows, self.horizontal_green_history
+
+    def occupancy_grid(self):
+        """
+        Current occupancy as a (num_rows * block_length, num_cols * block_length) image, with the
+        horizontal streets in the rows k * block_length and the vertical ones in the columns.
+        """
+        grid = np.zeros((self.num_rows * self.block_length, self.num_cols * self.block_length), dtype=np.uint8)
+        horizontal = self.streets < self.num_rows
+        grid[self.streets[horizontal] * self.block_length, self.positions[horizontal]] = 1
+        grid[self.positions[~horizontal], (self.streets[~horizontal] - self.num_rows) * self.block_length] = 1
+        return grid
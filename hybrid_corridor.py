@@ -0,0 +1,165 @@
+import numpy as np
+import rule
+from open_road import OpenRoadAutomaton
+
+
+"""
+Hybrid simulation of long signalised corridors. Only a short segment around every light is simulated
+with the cellular automaton (an OpenRoadAutomaton). The stretches between the segments are links of a
+cell transmission model (CTM) with a triangular fundamental diagram, updated for all links at once.
+At the interfaces, the fractional CTM flux is collected in an accumulator and handed over as whole
+vehicles, so no vehicle is created or lost and the cost grows with the number of lights, not with the
+length of the corridor.
+"""
+
+class TriangularDiagram:
+    """
+    Triangular fundamental diagram in CA units: densities in vehicles per cell, flows in vehicles per step.
+    """
+    def __init__(self, free_speed, wave_speed, jam_density):
+        """
+        :param free_speed: slope of the free flow branch, cells per step
+        :param wave_speed: backward speed of the congested branch, cells per step
+        :param jam_density: density at which the flow vanishes
+        """
+        self.free_speed = free_speed
+        self.wave_speed = wave_speed
+        self.jam_density = jam_density
+        self.capacity = free_speed * wave_speed * jam_density / (free_speed + wave_speed)
+        self.critical_density = self.capacity / free_speed
+
+    def sending(self, densities):
+        return np.minimum(self.free_speed * densities, self.capacity)
+
+    def receiving(self, densities):
+        return np.clip(self.wave_speed * (self.jam_density - densities), 0, self.capacity)
+
+
+def fit_triangular_diagram(diagram_results):
+    """
+    Fits a triangular fundamental diagram to one entry of Analyser.density_vel_flow (or of
+    mean_field.estimate_fundamental_diagram): a line through the origin to the densities below half the
+    density of maximum flow and a straight line to the densities above it.
+    """
+    densities = np.asarray(diagram_results['densities'], dtype=float)
+    flows = np.asarray(diagram_results['flows'], dtype=float)
+    peak_density = densities[np.argmax(flows)]
+    free = densities <= 0.5 * peak_density
+    if not free.any():
+        free = densities <= peak_density
+    free_speed = np.sum(densities[free] * flows[free]) / np.sum(densities[free] ** 2)
+    congested = densities > peak_density
+    slope, intercept = np.polyfit(densities[congested], flows[congested], 1)
+    wave_speed = -slope
+    return TriangularDiagram(free_speed, wave_speed, min(intercept / wave_speed, 1.0))
+
+
+class HybridCorridor:
+    def __init__(self, corridor_length, light_positions, green_durations, red_durations, diagram,
+                 max_velocity, braking_probability=None, offset=None, inflow_rate=0.2,
+                 upstream_cells=100, downstream_cells=50, cells_per_link=10):
+        """
+        :param light_positions: sorted positions of the lights along the corridor
+        :param green_durations: green time of every light, red_durations and offset as in TrafficLights
+        :param diagram: TriangularDiagram of the links, e.g. from fit_triangular_diagram
+        :param inflow_rate: vehicles per step which want to enter the corridor
+        :param upstream_cells: length of the CA segment in front of every light
+        :param downstream_cells: length of the CA segment behind every light
+        :param cells_per_link: number of CTM cells of every link. Shorter links get fewer cells, since a
+                               cell has to be at least as long as the free speed (CFL condition).
+        """
+        self.corridor_length = corridor_length
+        self.diagram = diagram
+        self.inflow_rate = inflow_rate
+        self.max_velocity = max_velocity
+        self.rng = np.random
+        num_lights = len(light_positions)
+        offset = [0] * num_lights if offset is None else offset
+
+        # CA segments around the lights, each with its own light rule in segment coordinates
+        self.segment_starts = [light_pos - upstream_cells for light_pos in light_positions]
+        self.segment_ends = [light_pos + downstream_cells for light_pos in light_positions]
+        self.segments = []
+        self.segment_rules = []
+        for i, light_pos in enumerate(light_positions):
+            segment_length = upstream_cells + downstream_cells
+            self.segments.append(OpenRoadAutomaton(segment_length, 1, 0, record_light_states=False))
+            self.segment_rules.append(rule.TrafficLights(segment_length, max_velocity, [upstream_cells],
+                                                         [green_durations[i]], [red_durations[i]],
+                                                         offset=[offset[i]],
+                                                         braking_probability=braking_probability))
+
+        # CTM links before, between and behind the segments, their cells in one flat array
+        link_starts = [0] + self.segment_ends
+        link_ends = self.segment_starts + [corridor_length]
+        link_lengths = np.array(link_ends) - np.array(link_starts)
+        if np.min(link_lengths) < diagram.free_speed:
+            raise ValueError("the CA segments must be at least one CTM cell apart")
+        link_cells = np.minimum(cells_per_link, (link_lengths // diagram.free_speed).astype(int))
+        self.cell_lengths = np.repeat(link_lengths / link_cells, link_cells)
+        self.link_first = np.concatenate(([0], np.cumsum(link_cells)[:-1]))
+        self.link_last = np.cumsum(link_cells) - 1
+        self.vehicles = np.zeros(int(np.sum(link_cells)))
+        # fractional vehicles which left a link and wait to enter the following segment
+        self.accumulators = np.zeros(num_lights)
+        # fractional exit permissions of every segment into the following link
+        self.exit_credits = np.zeros(num_lights)
+        self.entered = 0.0
+        self.left = 0.0
+
+    def total_vehicles(self):
+        return (np.sum(self.vehicles) + np.sum(self.accumulators)
+                + sum(segment.num_cars for segment in self.segments))
+
+    def step(self, time_step):
+        """
+        Advances the links and the segments by one timestep.
+        :return: number of vehicles which left the corridor
+        """
+        diagram = self.diagram
+        densities = self.vehicles / self.cell_lengths
+        sending = diagram.sending(densities)
+        receiving = diagram.receiving(densities)
+
+        # flux over the boundary behind every cell, the last cell of a link is limited by the accumulator
+        # of the following segment, or sends freely out of the corridor
+        outflux = np.empty_like(sending)
+        outflux[:-1] = np.minimum(sending[:-1], receiving[1:])
+        outflux[self.link_last[:-1]] = np.minimum(sending[self.link_last[:-1]], 1 - self.accumulators)
+        outflux[self.link_last[-1]] = sending[self.link_last[-1]]
+        influx = np.empty_like(outflux)
+        influx[1:] = outflux[:-1]
+        influx[self.link_first] = 0
+        influx[self.link_first[0]] = min(self.inflow_rate, receiving[self.link_first[0]])
+        self.entered += influx[self.link_first[0]]
+        self.accumulators += outflux[self.link_last[:-1]]
+        left = outflux[self.link_last[-1]]
+
+        # segments exit into the first cell of the following link, one whole vehicle per whole credit
+        self.exit_credits = np.minimum(self.exit_credits + receiving[self.link_first[1:]], 1)
+        self.vehicles += influx - outflux
+        for i, segment in enumerate(self.segments):
+            segment_rule = self.segment_rules[i]
+            segment_rule.rng = self.rng
+            max_exits = int(self.exit_credits[i])
+            exited, injected = segment.advance(segment_rule, time_step, self.accumulators[i] >= 1, max_exits > 0,
+                                               max_exits)
+            self.accumulators[i] -= injected
+            self.exit_credits[i] -= exited
+            self.vehicles[self.link_first[i + 1]] += exited
+        self.left += left
+        return left
+
+    def simulate(self, max_timesteps):
+        """
+        :return: (vehicles leaving the corridor per step, vehicles in the corridor per step,
+                 (max_timesteps, lights) car counts of the CA segments)
+        """
+        outflows = np.zeros(max_timesteps)
+        num_vehicles = np.zeros(max_timesteps)
+        segment_car_counts = np.zeros((max_timesteps, len(self.segments)), dtype=int)
+        for t in range(max_timesteps):
+            outflows[t] = self.step(t)
+            num_vehicles[t] = self.total_vehicles()
+            segment_car_counts[t] = [segment.num_cars for segment in self.segments]
+        return outflows, num_vehicles, segment_car_counts
@@ -0,0 +1,151 @@
+import numpy as np
+import spacetime_io
+
+
+"""
+Jam detection on space-time diagrams (traffic_evolution arrays or memmapped files). A cell is stopped
+at timestep t if it is occupied at t and at t + 1, which is the case for a standing car and, in dense
+traffic at velocity 1, for a car that is replaced by its follower. Stopped cells form runs in every row
+(clusters), clusters that overlap or touch in consecutive rows belong to the same jam, and jams
+are the connected components of these links. The downstream front of a jam moves backwards, and its
+displacement per step gives the backward wave speed.
+"""
+
+
+def stopped_clusters(traffic_evolution, chunk_rows=4096):
+    """
+    Run-length encodes the stopped cells of every row on the periodic road, chunk by chunk.
+    :return: timestep, first cell and length of every cluster, sorted by timestep and first cell.
+             A cluster across the end of the road starts near road_length and wraps around.
+    """
+    if isinstance(traffic_evolution, str):
+        traffic_evolution = spacetime_io.open_spacetime(traffic_evolution)
+    num_timesteps, road_length = traffic_evolution.shape
+    times, starts, lengths = [], [], []
+    # every chunk overlaps the next one by a row, since a row is compared with the following one
+    for first in range(0, num_timesteps - 1, chunk_rows):
+        rows = np.array(traffic_evolution[first:first + chunk_rows + 1])
+        stopped = (rows[:-1] != 0) & (rows[1:] != 0)
+        previous_stopped = np.roll(stopped, 1, axis=1)
+        next_stopped = np.roll(stopped, -1, axis=1)
+        start_t, start_x = np.nonzero(stopped & ~previous_stopped)
+        end_t, end_x = np.nonzero(stopped & ~next_stopped)
+
+        # every start is paired with the first end at or after it in the same row; runs across the
+        # end of the road have no such end and take the first end of their row
+        start_keys = start_t * road_length + start_x
+        end_keys = end_t * road_length + end_x
+        end_index = np.searchsorted(end_keys, start_keys, side="left")
+        row_first_end = np.searchsorted(end_keys, start_t * road_length, side="left")
+        wraps = (end_index >= len(end_keys)) | (end_t[np.minimum(end_index, len(end_keys) - 1)] != start_t)
+        end_index = np.where(wraps, row_first_end, end_index)
+        run_lengths = (end_x[end_index] - start_x) % road_length + 1
+
+        # rows which are stopped everywhere have no start
+        full_rows = np.nonzero(stopped.all(axis=1))[0]
+        cluster_t = np.concatenate((start_t, full_rows))
+        order = np.argsort(cluster_t, kind="stable")
+        times.append(cluster_t[order] + first)
+        starts.append(np.concatenate((start_x, np.zeros(len(full_rows), dtype=int)))[order])
+        lengths.append(np.concatenate((run_lengths, np.full(len(full_rows), road_length)))[order])
+    if not times:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    return np.concatenate(times), np.concatenate(starts), np.concatenate(lengths)
+
+
+def link_clusters(times, starts, lengths, road_length, link_distance=1):
+    """
+    Pairs of clusters in consecutive timesteps whose cells overlap or are at most link_distance cells
+    apart. Clusters in a row are disjoint and sorted, so the candidates of every cluster are a contiguous
+    range found with searchsorted; shifts by +-road_length cover the periodic wrap.
+    :return: indices of the earlier and of the later cluster of every link
+    """
+    stops = starts + lengths
+    # keys place every row in its own interval of width 3 * road_length, shifted to stay non-negative
+    width = 3 * road_length
+    start_keys = times * width + starts + road_length
+    stop_keys = times * width + stops + road_length
+    row_first = np.searchsorted(times, times - 1, side="left")
+    row_end = np.searchsorted(times, times - 1, side="right")
+
+    earlier, later = [], []
+    for shift in (-road_length, 0, road_length):
+        lower = (times - 1) * width + starts + shift - link_distance + road_length
+        upper = (times - 1) * width + stops + shift + link_distance + road_length
+        first = np.maximum(np.searchsorted(stop_keys, lower, side="right"), row_first)
+        last = np.minimum(np.searchsorted(start_keys, upper, side="left"), row_end)
+        counts = np.maximum(last - first, 0)
+        later_index = np.repeat(np.arange(len(times)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        earlier.append(np.repeat(first, counts) + offsets)
+        later.append(later_index)
+    pairs = np.unique(np.stack((np.concatenate(earlier), np.concatenate(later)), axis=1), axis=0)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def connected_components(num_nodes, first, second):
+    """
+    Labels the connected components of a graph with vectorised union-find: every node takes the
+    smallest label of its neighbours, followed by pointer jumping, until nothing changes.
+    :return: label of every node, the smallest node index of its component
+    """
+    labels = np.arange(num_nodes)
+    while True:
+        smallest = np.minimum(labels[first], labels[second])
+        new_labels = labels.copy()
+        np.minimum.at(new_labels, labels[first], smallest)
+        np.minimum.at(new_labels, labels[second], smallest)
+        new_labels = new_labels[new_labels]
+        while not np.array_equal(new_labels, new_labels[new_labels]):
+            new_labels = new_labels[new_labels]
+        if np.array_equal(new_labels, labels):
+            return labels
+        labels = new_labels
+
+
+def analyse_jams(traffic_evolution, chunk_rows=4096, link_distance=1, min_lifetime=1):
+    """
+    Finds the jams of a space-time diagram.
+    :param traffic_evolution: (timesteps, road_length) array, memmap or path of a .npy file
+    :param min_lifetime: jams which live shorter are ignored in the distributions
+    :return: dict with num_jams, the per jam arrays jam_sizes (largest number of stopped cars),
+             jam_lifetimes and jam_start_times, their distributions size_counts and lifetime_counts
+             (index = value), and wave_speed, the mean backward speed of the downstream jam fronts in
+             cells per timestep together with its standard error
+    """
+    if isinstance(traffic_evolution, str):
+        traffic_evolution = spacetime_io.open_spacetime(traffic_evolution)
+    road_length = traffic_evolution.shape[1]
+    times, starts, lengths = stopped_clusters(traffic_evolution, chunk_rows)
+    earlier, later = link_clusters(times, starts, lengths, road_length, link_distance)
+    labels = connected_components(len(times), earlier, later)
+
+    jam_ids, jam_index = np.unique(labels, return_inverse=True)
+    num_jams = len(jam_ids)
+    jam_sizes = np.zeros(num_jams, dtype=int)
+    jam_start_times = np.full(num_jams, np.iinfo(int).max)
+    jam_end_times = np.zeros(num_jams, dtype=int)
+    np.maximum.at(jam_sizes, jam_index, lengths)
+    np.minimum.at(jam_start_times, jam_index, times)
+    np.maximum.at(jam_end_times, jam_index, times)
+    jam_lifetimes = jam_end_times - jam_start_times + 1
+    keep = jam_lifetimes >= min_lifetime
+
+    # the front is only followed along links without merging or splitting
+    one_to_one = ((np.bincount(earlier, minlength=len(times))[earlier] == 1)
+                  & (np.bincount(later, minlength=len(times))[later] == 1))
+    fronts = starts + lengths - 1
+    displacements = (fronts[later[one_to_one]] - fronts[earlier[one_to_one]] + road_length // 2) % road_length \
+        - road_length // 2
+    num_links = len(displacements)
+    wave_speed = -np.mean(displacements) if num_links > 0 else np.nan
+    wave_speed_stderr = np.std(displacements, ddof=1) / np.sqrt(num_links) if num_links > 1 else np.nan
+
+    return {'num_jams': int(np.count_nonzero(keep)),
+            'jam_sizes': jam_sizes[keep],
+            'jam_lifetimes': jam_lifetimes[keep],
+            'jam_start_times': jam_start_times[keep],
+            'size_counts': np.bincount(jam_sizes[keep]),
+            'lifetime_counts': np.bincount(jam_lifetimes[keep]),
+            'wave_speed': wave_speed,
+            'wave_speed_stderr': wave_speed_stderr}
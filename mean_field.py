@@ -0,0 +1,218 @@
+import numpy as np
+
+
+"""
+Fast estimates of the fundamental diagram of the MaxVelocity (Nagel-Schreckenberg) rule, computed in
+milliseconds instead of hours of simulation:
+- vmax = 1: the 2-cluster approximation, which is exact for this case
+- p = 0: the deterministic result min(density * vmax, 1 - density)
+- otherwise the flow is bracketed. The site-oriented mean-field approximation, in which the cells in
+  front of a car are independently occupied, neglects the correlations that keep cars spaced out and
+  gives a lower bound. The two-branch approximation, free flow density * (vmax - p) and a jam whose
+  front dissolves with probability 1 - p per step, gives an upper bound.
+  The estimate inside the bracket is a calibrated surrogate, not a cluster approximation: the free flow
+  branch density * (vmax - p) is joined to a straight congested branch fitted to simulations by a smooth
+  minimum whose exponent was fitted to the same simulations. calibrate_congested_branch reproduces the
+  tables below. They were measured on a ring of 500 cells, 3000 steps of which the first 1000 were
+  discarded, at the densities 0.02, 0.03 .. 0.61, and fitted on the densities at least 0.1 above the
+  simulated flow maximum.
+  The surrogate is valid for vmax = 2..5 and p = 0.1..0.5. Against those simulations the capacity is
+  within -5% and +5%, the critical density within 0.03 and the flow at every density within 0.02.
+  Between p = 0 and 0.1 and above p = 0.5 the branch is interpolated towards the exact results for
+  p = 0 and p = 1, vmax > 5 uses the vmax = 5 branch, and densities above 0.61 are extrapolated; there
+  only the bracket is guaranteed.
+"""
+
+# congested branch flow = intercept - slope * density, one row per max velocity and one column per
+# braking probability; p = 0 (flow 1 - density) and p = 1 (no flow) are exact
+JAM_MAX_VELOCITIES = [2, 3, 4, 5]
+JAM_BRAKING_PROBABILITIES = [0, 0.1, 0.2, 0.3, 0.4, 0.5, 1]
+JAM_SLOPES = [[1, 0.730, 0.562, 0.443, 0.359, 0.300, 0],
+              [1, 0.757, 0.599, 0.483, 0.405, 0.323, 0],
+              [1, 0.767, 0.610, 0.490, 0.397, 0.326, 0],
+              [1, 0.765, 0.607, 0.489, 0.398, 0.320, 0]]
+JAM_INTERCEPTS = [[1, 0.778, 0.626, 0.510, 0.419, 0.345, 0],
+                  [1, 0.797, 0.652, 0.537, 0.447, 0.362, 0],
+                  [1, 0.803, 0.658, 0.541, 0.445, 0.363, 0],
+                  [1, 0.802, 0.657, 0.541, 0.445, 0.360, 0]]
+
+
+def smoothing_exponent(max_velocity):
+    """
+    Exponent k of the smooth minimum (free^-k + jammed^-k)^(-1/k) of both branches. The peak of the
+    diagram gets sharper as vmax grows; the best k per vmax fitted to the calibration simulations was
+    4.5, 6.5, 8.5 and 11.5 for vmax = 2..5.
+    """
+    return 2 * max_velocity + 1
+
+
+def two_cluster_flow(densities, braking_probability):
+    """
+    Flow of the vmax = 1 rule in the 2-cluster approximation.
+    """
+    densities = np.asarray(densities, dtype=float)
+    q = 1 - braking_probability
+    return 0.5 * (1 - np.sqrt(np.maximum(1 - 4 * q * densities * (1 - densities), 0)))
+
+
+def mean_field_velocity_distribution(densities, max_velocity, braking_probability,
+                                     max_iterations=1000, tolerance=1e-10):
+    """
+    Stationary velocity distribution of the mean-field approximation, iterated for all densities at once.
+    The gap g in front of a car is geometric, P(g = k) = density * (1 - density)^k.
+    :return: (densities, max_velocity + 1) array of velocity probabilities
+    """
+    densities = np.clip(np.asarray(densities, dtype=float), 1e-12, 1)
+    free = 1 - densities
+    num_velocities = max_velocity + 1
+    k = np.arange(num_velocities)
+
+    # transition[d, u, w]: probability that a car which wants velocity u may drive w because of its gap
+    gap_probability = densities[:, None] * free[:, None] ** k
+    transition = np.where(k[None, None, :] < k[None, :, None], gap_probability[:, None, :], 0.0)
+    transition[:, k, k] = free[:, None] ** k
+
+    distribution = np.zeros((len(densities), num_velocities))
+    distribution[:, 0] = 1
+    for _ in range(max_iterations):
+        # acceleration by one up to max_velocity
+        accelerated = np.zeros_like(distribution)
+        accelerated[:, 1:] = distribution[:, :-1]
+        accelerated[:, -1] += distribution[:, -1]
+        # velocity limited by the gap
+        limited = np.einsum("du,duw->dw", accelerated, transition)
+        # random braking
+        braked = (1 - braking_probability) * limited
+        braked[:, :-1] += braking_probability * limited[:, 1:]
+        braked[:, 0] += braking_probability * limited[:, 0]
+
+        converged = np.max(np.abs(braked - distribution)) < tolerance
+        distribution = braked
+        if converged:
+            break
+    return distribution
+
+
+def two_branch_flow(densities, max_velocity, braking_probability):
+    """
+    Flow of the two-branch approximation: the smaller of the free flow branch and the jammed branch.
+    """
+    densities = np.asarray(densities, dtype=float)
+    free_flow = densities * (max_velocity - braking_probability)
+    jammed_flow = (1 - braking_probability) * (1 - densities)
+    return np.minimum(free_flow, jammed_flow)
+
+
+def flow_bounds(densities, max_velocity, braking_probability):
+    """
+    Lower and upper estimate of the flow of the MaxVelocity rule for every density.
+    """
+    densities = np.asarray(densities, dtype=float)
+    if braking_probability == 0:
+        flows = np.minimum(densities * max_velocity, 1 - densities)
+        return flows, flows
+    if max_velocity == 1:
+        flows = two_cluster_flow(densities, braking_probability)
+        return flows, flows
+    distribution = mean_field_velocity_distribution(densities, max_velocity, braking_probability)
+    mean_field_flow = densities * (distribution @ np.arange(max_velocity + 1))
+    # a larger max velocity never lowers the flow, so the exact vmax = 1 result is a lower bound as well
+    lower = np.maximum(mean_field_flow, two_cluster_flow(densities, braking_probability))
+    upper = np.maximum(two_branch_flow(densities, max_velocity, braking_probability), lower)
+    return lower, upper
+
+
+def congested_flow(densities, max_velocity, braking_probability):
+    """
+    Calibrated congested branch of the MaxVelocity rule for vmax >= 2, see the module docstring for
+    where it comes from and where it is valid.
+    """
+    densities = np.asarray(densities, dtype=float)
+    row = np.searchsorted(JAM_MAX_VELOCITIES, min(max(max_velocity, JAM_MAX_VELOCITIES[0]), JAM_MAX_VELOCITIES[-1]))
+    slope = np.interp(braking_probability, JAM_BRAKING_PROBABILITIES, JAM_SLOPES[row])
+    intercept = np.interp(braking_probability, JAM_BRAKING_PROBABILITIES, JAM_INTERCEPTS[row])
+    return np.maximum(intercept - slope * densities, 0)
+
+
+def simulated_flows(densities, max_velocity, braking_probability, road_length=500, max_timesteps=3000,
+                    warm_up=1000, seed=0):
+    """
+    Time averaged flow of the MaxVelocity rule on a ring for every density, started from random positions
+    at rest. The first warm_up steps are discarded.
+    """
+    import cellular_automaton as ca
+    import rule
+
+    flows = []
+    for density in densities:
+        num_cars = int(round(density * road_length))
+        max_velocity_rule = rule.MaxVelocity(road_length, max_velocity, braking_probability)
+        max_velocity_rule.rng = np.random.RandomState(seed + num_cars)
+        positions = np.sort(max_velocity_rule.rng.choice(road_length, num_cars, replace=False))
+        automaton = ca.CellularAutomaton(positions, np.zeros(num_cars), road_length, max_timesteps,
+                                         0, road_length - 1, record_evolution=False, record_light_states=False)
+        flows.append(np.mean(automaton.simulate(max_velocity_rule)[4][warm_up:]))
+    return np.array(flows)
+
+
+def calibrate_congested_branch(max_velocity, braking_probability, densities=None, **simulation):
+    """
+    Fits the congested branch to simulations, the way the JAM_ tables were made.
+    :param simulation: keyword arguments of simulated_flows
+    :return: slope and intercept
+    """
+    densities = np.round(np.arange(0.02, 0.62, 0.01), 3) if densities is None else np.asarray(densities)
+    flows = simulated_flows(densities, max_velocity, braking_probability, **simulation)
+    jammed = densities >= densities[np.argmax(flows)] + 0.1
+    slope, intercept = np.polyfit(densities[jammed], flows[jammed], 1)
+    return -slope, intercept
+
+
+def estimate_flow(densities, max_velocity, braking_probability, bounds=None):
+    """
+    Estimated flow of the MaxVelocity rule for every density.
+    :param bounds: (lower, upper) from flow_bounds, if they are already computed
+    """
+    densities = np.asarray(densities, dtype=float)
+    lower, upper = flow_bounds(densities, max_velocity, braking_probability) if bounds is None else bounds
+    if braking_probability == 0 or max_velocity == 1:
+        return lower
+    free_flow = np.maximum(densities * (max_velocity - braking_probability), 1e-12)
+    jammed_flow = np.maximum(congested_flow(densities, max_velocity, braking_probability), 1e-12)
+    k = smoothing_exponent(max_velocity)
+    flows = (free_flow ** -k + jammed_flow ** -k) ** (-1 / k)
+    return np.clip(flows, lower, upper)
+
+
+def estimate_fundamental_diagram(densities, max_velocity, braking_probability):
+    """
+    Estimated fundamental diagram in the format of one entry of Analyser.density_vel_flow.
+    """
+    densities = np.asarray(densities, dtype=float)
+    lower, upper = flow_bounds(densities, max_velocity, braking_probability)
+    flows = estimate_flow(densities, max_velocity, braking_probability, (lower, upper))
+    velocities = np.divide(flows, densities, out=np.zeros_like(flows), where=densities > 0)
+    return {'densities': list(densities), 'flows': list(flows), 'velocities': list(velocities),
+            'flow_lower': list(lower), 'flow_upper': list(upper)}
+
+
+def critical_density(max_velocity, braking_probability, resolution=1000):
+    """
+    Density of the estimated flow maximum, i.e. the capacity of the road.
+    """
+    densities = np.linspace(0, 1, resolution + 1)[1:]
+    flows = estimate_flow(densities, max_velocity, braking_probability)
+    return densities[np.argmax(flows)], np.max(flows)
+
+
+def adaptive_num_cars(road_length, max_velocity, braking_probability, num_points, width=0.1):
+    """
+    Numbers of cars for a density sweep whose points are concentrated around the estimated critical
+    density, where the flow changes fastest. Half of the points lie within +-width of it, which is more
+    than three times the error of the estimated critical density.
+    """
+    rho_c, _ = critical_density(max_velocity, braking_probability)
+    near = np.linspace(max(rho_c - width, 0), min(rho_c + width, 1), num_points // 2)
+    everywhere = np.linspace(0, 1, num_points - num_points // 2 + 2)[1:-1]
+    num_cars = np.round(np.concatenate((near, everywhere)) * road_length).astype(int)
+    return np.unique(np.clip(num_cars, 1, road_length))
@@ -0,0 +1,132 @@
+import numpy as np
+
+
+"""
+Multi-lane version of the cellular automaton. Every car has a lane, a position and a velocity. The cars
+are kept sorted by (lane, position), so the neighbours of every car in its own and in the adjacent lanes
+are found with searchsorted, and lane changing and driving are vectorised over all lanes at once.
+The single-lane rules (MaxVelocity, TrafficLights, SelfOrganisedTrafficLights) supply the driving
+parameters and the lights, which stand across all lanes.
+"""
+
+class MultiLaneAutomaton:
+    def __init__(self, initial_lanes, initial_positions, initial_velocities,
+                 num_lanes, road_length, max_timesteps, lane_change_probability=1.0, record_evolution=False):
+        """
+        :param initial_lanes: lane index (0 = rightmost) of every car
+        :param lane_change_probability: probability that a car which wants and may change lanes does so
+        :param record_evolution: records the (max_timesteps, num_lanes, road_length) occupancy grid
+        """
+        self.num_lanes = num_lanes
+        self.road_length = road_length
+        self.max_timesteps = max_timesteps
+        self.lane_change_probability = lane_change_probability
+        self.lanes = np.asarray(initial_lanes, dtype=int)
+        self.positions = np.asarray(initial_positions, dtype=int)
+        self.velocities = np.asarray(initial_velocities, dtype=int)
+        self.record_evolution = record_evolution
+        self.traffic_evolution = (np.zeros((max_timesteps, num_lanes, road_length), dtype=np.uint8)
+                                  if record_evolution else None)
+        self.mean_velocities = np.zeros(max_timesteps)
+        self.flows = np.zeros(max_timesteps)
+        self.lane_changes = np.zeros(max_timesteps, dtype=int)
+        self.light_state_history = []
+
+    def sort_cars(self):
+        """
+        Sorts all cars by (lane, position) and returns the sort keys and the index of the first car of
+        every lane (num_lanes + 1 entries, the last one is the number of cars).
+        """
+        keys = self.lanes * self.road_length + self.positions
+        order = np.argsort(keys)
+        self.lanes = self.lanes[order]
+        self.positions = self.positions[order]
+        self.velocities = self.velocities[order]
+        keys = keys[order]
+        lane_starts = np.searchsorted(keys, np.arange(self.num_lanes + 1) * self.road_length)
+        return keys, lane_starts
+
+    def neighbours(self, keys, lane_starts, lanes, positions):
+        """
+        Finds the first car at or in front of, and the first car behind, every given (lane, position).
+        :return: number of free cells from the given cell up to the car in front (0 if the cell is occupied)
+                 and number of free cells behind it up to the next car. Empty lanes have road_length free cells.
+        """
+        positions = positions % self.road_length
+        starts = lane_starts[lanes]
+        ends = lane_starts[lanes + 1]
+        empty = starts == ends
+        front = np.searchsorted(keys, lanes * self.road_length + positions, side="left")
+        # past the last car of the lane, the first car of the lane is in front (periodic road)
+        front = np.where(front >= ends, starts, front)
+        back = np.where(front > starts, front - 1, ends - 1)
+        front = np.where(empty, 0, front)
+        back = np.where(empty, 0, back)
+
+        all_positions = self.positions if len(self.positions) > 0 else np.zeros(1, dtype=int)
+        front_free = np.where(empty, self.road_length, (all_positions[front] - positions) % self.road_length)
+        back_free = np.where(empty, self.road_length, (positions - all_positions[back] - 1) % self.road_length)
+        return front_free, back_free
+
+    def change_lanes(self, t, max_velocity, rng):
+        """
+        Symmetric lane changing: a car changes lane if it is slowed down by the car ahead, the target lane
+        offers a larger gap, the target cell is empty and the car behind in the target lane is at least
+        max_velocity cells away. To avoid two cars moving into the same cell, all cars change to the
+        left on even timesteps and to the right on odd ones.
+        :return: number of lane changes
+        """
+        keys, lane_starts = self.sort_cars()
+        own_gap, _ = self.neighbours(keys, lane_starts, self.lanes, self.positions + 1)
+
+        direction = 1 if t % 2 == 0 else -1
+        targets = self.lanes + direction
+        valid = (targets >= 0) & (targets < self.num_lanes)
+        safe_targets = np.clip(targets, 0, self.num_lanes - 1)
+        target_free, back_free = self.neighbours(keys, lane_starts, safe_targets, self.positions)
+
+        wants = own_gap < np.minimum(self.velocities + 1, max_velocity)
+        # the free cells in the target lane include the cell next to the car, which it would occupy
+        better = target_free - 1 > own_gap
+        safe = (target_free > 0) & (back_free >= max_velocity)
+        changing = valid & wants & better & safe
+        # only draw random numbers when a change is possible, so a single lane uses the same draws as
+        # the single-lane automaton
+        if self.lane_change_probability < 1 and changing.any():
+            changing &= rng.rand(len(self.lanes)) < self.lane_change_probability
+        self.lanes = np.where(changing, targets, self.lanes)
+        return np.count_nonzero(changing)
+
+    def simulate(self, rule):
+        """
+        :param rule: MaxVelocity, TrafficLights or SelfOrganisedTrafficLights instance, which supplies
+                     max_velocity, braking_probability and the lights
+        """
+        self.light_state_history = []
+        num_cars = len(self.positions)
+        density = num_cars / (self.num_lanes * self.road_length)
+        for t in range(self.max_timesteps):
+            if self.record_evolution:
+                self.traffic_evolution[t, self.lanes, self.positions] = 1
+            self.mean_velocities[t] = np.mean(self.velocities) if num_cars > 0 else 0
+            self.flows[t] = density * self.mean_velocities[t]
+
+            self.lane_changes[t] = self.change_lanes(t, rule.max_velocity, rule.rng)
+            keys, lane_starts = self.sort_cars()
+            gaps, _ = self.neighbours(keys, lane_starts, self.lanes, self.positions + 1)
+
+            # Increases the velocity by one, limited by max velocity and the gap to the car ahead
+            velocities = np.minimum(np.minimum(self.velocities + 1, rule.max_velocity), gaps)
+            if rule.braking_probability is not None:
+                velocities = rule.apply_random_braking(velocities)
+
+            # the lights stand across all lanes, self organised lights count the cars of all lanes
+            if hasattr(rule, "update_light_states"):
+                rule.update_light_states(self.positions)
+            self.light_state_history.append(rule.get_light_states(t))
+            velocities = rule.clamp_at_red_lights(self.positions, velocities, rule.red_light_positions(t))
+
+            self.velocities = velocities.astype(int)
+            self.positions = (self.positions + self.velocities) % self.road_length
+
+        return self.traffic_evolution, self.mean_velocities, self.flows, self.lane_changes, self.light_state_history
@@ -0,0 +1,143 @@
+import numpy as np
+
+
+"""
+Open road with an entry and an exit instead of a ring. Cars are injected at cell 0 and leave behind the
+last cell, so the number of cars changes all the time. They are kept in preallocated circular buffers in
+driving order, leader first: departures advance the head, arrivals are written behind the tail, and
+nothing is ever reallocated.
+"""
+
+class OpenRoadAutomaton:
+    def __init__(self, road_length, max_timesteps, inflow_probability, outflow_probability=1.0,
+                 capacity=None, detect_start=None, detect_end=None, record_evolution=False,
+                 record_light_states=True):
+        """
+        :param inflow_probability: probability that a car arrives at the entry in a timestep (alpha).
+                                   It is injected if cell 0 is free, otherwise it is lost.
+        :param outflow_probability: probability that the exit is open in a timestep (beta). While it is
+                                    closed, the leader stops in front of the end of the road.
+        :param capacity: size of the vehicle buffers, by default one car per cell, which is never exceeded
+        :param record_light_states: keeps the light states of every timestep in light_state_history
+        """
+        self.road_length = road_length
+        self.max_timesteps = max_timesteps
+        self.inflow_probability = inflow_probability
+        self.outflow_probability = outflow_probability
+        self.capacity = road_length if capacity is None else capacity
+        self.positions = np.zeros(self.capacity, dtype=int)
+        self.velocities = np.zeros(self.capacity, dtype=int)
+        self.buffer_index = np.arange(self.capacity)
+        self.head = 0
+        self.num_cars = 0
+        self.start = detect_start
+        self.end = detect_end
+        self.record_evolution = record_evolution
+        self.traffic_evolution = np.zeros((max_timesteps, road_length), dtype=np.uint8) if record_evolution else None
+        self.car_counts = np.zeros(max_timesteps, dtype=int)
+        self.injected = np.zeros(max_timesteps, dtype=int)
+        self.exited = np.zeros(max_timesteps, dtype=int)
+        self.local_space_meanVels = np.zeros(max_timesteps)
+        self.local_densities = np.zeros(max_timesteps)
+        self.local_flows = np.zeros(max_timesteps)
+        self.record_light_states = record_light_states
+        self.light_state_history = []
+
+    def car_indices(self):
+        """
+        Buffer indices of the cars in driving order, leader first.
+        """
+        return (self.head + self.buffer_index[:self.num_cars]) % self.capacity
+
+    def clamp_at_red_lights(self, positions, velocities, red_light_positions):
+        """
+        Stops every car in front of the next red light ahead of it. Unlike on the ring, there is no
+        red light ahead of cars behind the last one.
+        """
+        if len(red_light_positions) == 0:
+            return velocities
+        red_light_positions = np.sort(red_light_positions)
+        next_light = np.searchsorted(red_light_positions, positions, side="right")
+        ahead = next_light < len(red_light_positions)
+        distance_to_light = red_light_positions[np.minimum(next_light, len(red_light_positions) - 1)] - positions
+        blocked = ahead & (distance_to_light <= velocities)
+        return np.where(blocked, distance_to_light - 1, velocities)
+
+    def advance(self, rule, time_step, inject, exit_open, max_exits=None):
+        """
+        One timestep of the open road, with the random boundary events given from outside, so the road
+        can be coupled to other models.
+        :param rule: MaxVelocity, TrafficLights or SelfOrganisedTrafficLights instance, which supplies
+                     max_velocity, braking_probability, the random numbers and the lights
+        :param inject: whether a car arrives at the entry
+        :param exit_open: whether the leader may leave the road
+        :param max_exits: if given, at most this many cars leave while the exit is open, the next car stops
+                          in front of the end of the road
+        :return: number of cars that left the road and whether a car was injected
+        """
+        indices = self.car_indices()
+        positions = self.positions[indices]
+        velocities = self.velocities[indices]
+
+        # the leader drives towards the exit, which is a wall while it is closed
+        gaps = np.empty(self.num_cars, dtype=int)
+        gaps[1:] = positions[:-1] - positions[1:] - 1
+        if self.num_cars > 0:
+            gaps[0] = rule.max_velocity if exit_open else self.road_length - 1 - positions[0]
+        if exit_open and max_exits is not None and max_exits < self.num_cars:
+            gaps[max_exits] = min(gaps[max_exits], self.road_length - 1 - positions[max_exits])
+
+        velocities = np.minimum(np.minimum(velocities + 1, rule.max_velocity), gaps)
+        if rule.braking_probability is not None:
+            velocities = rule.apply_random_braking(velocities)
+
+        if hasattr(rule, "update_light_states"):
+            rule.update_light_states(positions, periodic=False)
+        if self.record_light_states:
+            self.light_state_history.append(rule.get_light_states(time_step))
+        velocities = self.clamp_at_red_lights(positions, velocities, rule.red_light_positions(time_step))
+
+        positions = positions + velocities
+        self.positions[indices] = positions
+        self.velocities[indices] = velocities
+
+        # the cars past the end are the first ones in driving order
+        num_exited = int(np.count_nonzero(positions >= self.road_length))
+        self.head = (self.head + num_exited) % self.capacity
+        self.num_cars -= num_exited
+
+        entry_free = self.num_cars == 0 or positions[-1] > 0
+        injected = inject and entry_free and self.num_cars < self.capacity
+        if injected:
+            tail = (self.head + self.num_cars) % self.capacity
+            self.positions[tail] = 0
+            gap = self.road_length - 1 if self.num_cars == 0 else positions[-1] - 1
+            self.velocities[tail] = min(rule.max_velocity, gap)
+            self.num_cars += 1
+        return num_exited, injected
+
+    def simulate(self, rule):
+        """
+        :return: (traffic_evolution, car_counts, injected, exited, local_space_meanVels, local_densities,
+                 local_flows, light_state_history); exited is the throughput of every timestep
+        """
+        self.light_state_history = []
+        for t in range(self.max_timesteps):
+            indices = self.car_indices()
+            positions = self.positions[indices]
+            self.car_counts[t] = self.num_cars
+            if self.record_evolution:
+                self.traffic_evolution[t, positions] = 1
+            if self.start is not None and self.end is not None:
+                mask = (positions >= self.start) & (positions <= self.end)
+                detected = np.count_nonzero(mask)
+                self.local_densities[t] = detected / (self.end - self.start + 1)
+                self.local_space_meanVels[t] = np.mean(self.velocities[indices][mask]) if detected > 0 else 0
+                self.local_flows[t] = self.local_densities[t] * self.local_space_meanVels[t]
+
+            inject = rule.rng.random_sample() < self.inflow_probability
+            exit_open = rule.rng.random_sample() < self.outflow_probability
+            self.exited[t], self.injected[t] = self.advance(rule, t, inject, exit_open)
+
+        return (self.traffic_evolution, self.car_counts, self.injected, self.exited, self.local_space_meanVels,
+                self.local_densities, self.local_flows, self.light_state_history)
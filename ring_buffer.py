@@ -0,0 +1,67 @@
+import numpy as np
+
+
+"""
+Bounded buffer for watching a running simulation. The automaton pushes the occupancy of every timestep
+into a fixed number of rows, so the memory stays constant however long the simulation runs.
+"""
+
+class SpaceTimeRingBuffer:
+    """
+    The most recent `capacity` rows of the space-time diagram, together with the light states.
+
+    Pushing only overwrites one row and increments a counter, so the simulation thread never waits for
+    the viewer. A viewer reading concurrently may see the newest row half written, which is harmless
+    for display purposes.
+    """
+    def __init__(self, capacity, road_length, light_positions=None):
+        self.capacity = capacity
+        self.road_length = road_length
+        self.light_positions = [] if light_positions is None else list(light_positions)
+        self.rows = np.zeros((capacity, road_length), dtype=np.uint8)
+        self.light_rows = np.zeros((capacity, len(self.light_positions)), dtype=bool)
+        self.steps_written = 0
+
+    def push(self, positions, light_states=None):
+        """
+        Writes the occupancy of the next timestep.
+        :param light_states: dict mapping light position to its state, as returned by Rule.get_light_states
+        """
+        row = self.steps_written % self.capacity
+        self.rows[row] = 0
+        self.rows[row, np.asarray(positions, dtype=int)] = 1
+        if light_states:
+            self.light_rows[row] = [light_states.get(light_pos, False) for light_pos in self.light_positions]
+        self.steps_written += 1
+
+    def window_columns(self, max_columns=None):
+        """
+        Number of cells merged into one column of a window, and the number of columns.
+        :param max_columns: as in window
+        :return: (factor, num_columns)
+        """
+        if max_columns is None or self.road_length <= max_columns:
+            return 1, self.road_length
+        factor = int(np.ceil(self.road_length / max_columns))
+        return factor, int(np.ceil(self.road_length / factor))
+
+    def window(self, max_columns=None):
+        """
+        Copies the buffered rows in chronological order, oldest first.
+        :param max_columns: if the road is longer, neighbouring cells are merged (occupied if any car is in
+                            them), so that huge roads can be drawn at screen resolution
+        :return: (rows, light_rows, first timestep of the window); rows has window_columns(max_columns)[1]
+                 columns, also while it is still empty
+        """
+        steps_written = self.steps_written
+        num_rows = min(steps_written, self.capacity)
+        start = steps_written - num_rows
+        order = np.arange(start, steps_written) % self.capacity
+        rows = self.rows[order]
+        light_rows = self.light_rows[order]
+        factor, num_columns = self.window_columns(max_columns)
+        if factor > 1:
+            padded = np.zeros((num_rows, factor * num_columns), dtype=np.uint8)
+            padded[:, :self.road_length] = rows
+            rows = padded.reshape(num_rows, num_columns, factor).max(axis=2)
+        return rows, light_rows, start
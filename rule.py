@@ -7,6 +7,26 @@ class Rule:
     def __init__(self, road_length):
         self.road_length = road_length
         self.light_positions = []
+        # source of the random events, can be replaced by a seeded np.random.RandomState
+        self.rng = np.random
+
+    def __getstate__(self):
+        # the np.random module can not be pickled, unpickled rules fall back to the global one of their process
+        state = self.__dict__.copy()
+        if state.get("rng") is np.random:
+            del state["rng"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault("rng", np.random)
+
+    def reset(self):
+        """
+        Restores the state the rule keeps between timesteps. Called by CellularAutomaton.simulate at the start
+        of every simulation, so that one rule instance can be reused for several runs.
+        """
+        pass
 
     def apply_rule(self, positions, velocities, time_step):
         pass
@@ -21,6 +41,14 @@ class Rule:
                   Returns None or empty dict if the rule has no lights or state tracking.
         """
         return {}
+
+    def red_light_positions(self, time_step):
+        """
+        Sorted positions of the lights which are red in the given timestep, as an integer array.
+        Rules with their light states in arrays override this without building the dict of get_light_states.
+        """
+        return np.sort(np.array([light_pos for light_pos, green in self.get_light_states(time_step).items()
+                                 if not green], dtype=int))
         
 class Rule184(Rule):
     def __init__(self, road_length):
@@ -68,7 +96,7 @@ class Rule184_random(Rule):
         sorted_velocities = velocities[sorted_indices]
 
         for i in range(num_cars):
-            if np.random.random() > self.probability:
+            if self.rng.random_sample() > self.probability:
                 current_pos = sorted_positions[i]
                 next_pos = (current_pos + 1) % self.road_length  # Wrap around (circular road)
 
@@ -84,43 +112,300 @@ class Rule184_random(Rule):
         return sorted_positions, sorted_velocities
 
 
+class VehicleFleet:
+    """
+    Parameters of every vehicle of a mixed fleet (cars, buses, trucks), kept as one (4, cars) array with a
+    row per parameter: max velocity, braking probability, length in cells and vehicle class. The columns
+    follow the order of the cars handed to the rule and are permuted with the cars whenever the rule sorts
+    them, so the parameters of a step are read as contiguous rows.
+    """
+    def __init__(self, max_velocities, braking_probabilities, lengths=None, vehicle_classes=None):
+        """
+        :param lengths: number of cells every vehicle occupies behind its position, one by default
+        :param vehicle_classes: class index of every vehicle, only kept for the analysis
+        """
+        num_vehicles = len(max_velocities)
+        self.parameters = np.zeros((4, num_vehicles))
+        self.parameters[0] = max_velocities
+        self.parameters[1] = braking_probabilities
+        self.parameters[2] = 1 if lengths is None else lengths
+        self.parameters[3] = 0 if vehicle_classes is None else vehicle_classes
+        self.spare_parameters = np.zeros_like(self.parameters)
+        # order of the vehicles at the start of every simulation
+        self.initial_parameters = self.parameters.copy()
+
+    @classmethod
+    def from_classes(cls, vehicle_classes, max_velocities, braking_probabilities, lengths):
+        """
+        :param vehicle_classes: class index of every vehicle
+        :param max_velocities: max velocity of every class, braking_probabilities and lengths likewise
+        """
+        vehicle_classes = np.asarray(vehicle_classes, dtype=int)
+        return cls(np.asarray(max_velocities)[vehicle_classes], np.asarray(braking_probabilities)[vehicle_classes],
+                   np.asarray(lengths)[vehicle_classes], vehicle_classes)
+
+    @property
+    def max_velocities(self):
+        return self.parameters[0]
+
+    @property
+    def braking_probabilities(self):
+        return self.parameters[1]
+
+    @property
+    def lengths(self):
+        return self.parameters[2]
+
+    @property
+    def vehicle_classes(self):
+        return self.parameters[3]
+
+    def __len__(self):
+        return self.parameters.shape[1]
+
+    def reset(self):
+        """ Puts the vehicles back into the order the fleet was created with. """
+        self.parameters[:] = self.initial_parameters
+
+    def reorder(self, order):
+        """ Permutes the vehicles like the cars, e.g. with the argsort of their positions. """
+        np.take(self.parameters, order, axis=1, out=self.spare_parameters)
+        self.parameters, self.spare_parameters = self.spare_parameters, self.parameters
+
+    def random_positions(self, road_length, rng=np.random):
+        """
+        Places the vehicles at random on the ring without overlaps, in the order the fleet was created with,
+        which is the order at the start of every simulation.
+        :return: positions of the vehicle fronts
+        """
+        lengths = self.initial_parameters[2].astype(int)
+        num_vehicles = len(lengths)
+        free_cells = road_length - np.sum(lengths)
+        if free_cells < 0:
+            raise ValueError("the vehicles do not fit on the road")
+        # every vehicle is one token among the free cells, the tokens before it are stretched by their lengths
+        tokens = np.sort(rng.choice(free_cells + num_vehicles, num_vehicles, replace=False))
+        rears = tokens + np.concatenate(([0], np.cumsum(lengths - 1)[:-1]))
+        return rears + lengths - 1
+
+    def occupied_cells(self, positions, road_length):
+        """
+        Cells covered by the vehicles, each reaching length cells back from its position.
+        :param positions: positions of the vehicles in the current order of the fleet
+        """
+        lengths = self.lengths.astype(int)
+        first_cells = np.cumsum(lengths) - lengths
+        offsets = np.arange(np.sum(lengths)) - np.repeat(first_cells, lengths)
+        return (np.repeat(np.asarray(positions, dtype=int), lengths) - offsets) % road_length
+
+
+def initial_positions(rule_instance, num_cars, road_length, rng=np.random):
+    """
+    Random sorted starting positions of num_cars cars. If the rule has a VehicleFleet, its vehicles are placed
+    without overlaps and in the order of the fleet.
+    """
+    fleet = getattr(rule_instance, "fleet", None)
+    if fleet is None:
+        return np.sort(rng.choice(road_length, num_cars, replace=False))
+    if len(fleet) != num_cars:
+        raise ValueError(f"the fleet has {len(fleet)} vehicles, not {num_cars}")
+    return fleet.random_positions(road_length, rng)
+
+
+class StepState:
+    """
+    The cars of one timestep in sorted order and the scratch buffers the stages work in. The buffers
+    are kept between timesteps and only reallocated when the number of cars changes.
+    """
+    def __init__(self):
+        self.positions = np.zeros(0)
+        self.velocities = np.zeros(0)
+        self.previous_velocities = np.zeros(0)
+        self.gaps = np.zeros(0)
+        self.distances = np.zeros(0)
+        self.mask = np.zeros(0, dtype=bool)
+        self.leader_length_buffer = np.zeros(0)
+        self.identity = np.zeros(0, dtype=int)
+        self.time_step = 0
+        # vehicle parameters of the step, scalars or arrays over the sorted cars
+        self.max_velocity = None
+        self.braking_probability = None
+        self.leader_lengths = 1
+
+    def load(self, rule, positions, velocities, time_step):
+        sorted_indices = np.argsort(positions)
+        # the sorted copies are handed back to the caller, everything else is reused
+        self.positions = positions[sorted_indices].astype(float, copy=False)
+        self.velocities = velocities[sorted_indices].astype(float, copy=False)
+        num_cars = len(sorted_indices)
+        if len(self.gaps) != num_cars:
+            self.previous_velocities = np.zeros(num_cars)
+            self.gaps = np.zeros(num_cars)
+            self.distances = np.zeros(num_cars)
+            self.mask = np.zeros(num_cars, dtype=bool)
+            self.leader_length_buffer = np.zeros(num_cars)
+            self.identity = np.arange(num_cars)
+        self.previous_velocities[:] = self.velocities
+        self.time_step = time_step
+
+        if rule.fleet is None:
+            self.max_velocity = rule.max_velocity
+            self.braking_probability = rule.braking_probability
+            self.leader_lengths = 1
+        else:
+            # the cars only change their order when one passes the end of the ring
+            if not np.array_equal(sorted_indices, self.identity):
+                rule.fleet.reorder(sorted_indices)
+            self.max_velocity = rule.fleet.max_velocities
+            self.braking_probability = rule.fleet.braking_probabilities
+            lengths = rule.fleet.lengths
+            self.leader_length_buffer[:-1] = lengths[1:]
+            self.leader_length_buffer[-1:] = lengths[:1]
+            self.leader_lengths = self.leader_length_buffer
+        return self
+
+
+class Accelerate:
+    """ Increases the velocity by one, except when max velocity is reached. """
+    def apply(self, rule, state):
+        np.add(state.velocities, 1, out=state.velocities)
+        np.minimum(state.velocities, state.max_velocity, out=state.velocities)
+
+
+class GapClamp:
+    """ Ensures that cars don't collide, the velocity is at most the gap to the rear of the preceding car. """
+    def apply(self, rule, state):
+        positions, gaps = state.positions, state.gaps
+        if len(positions) == 0:
+            return
+        np.subtract(positions[1:], positions[:-1], out=gaps[:-1])
+        gaps[-1] = positions[0] + rule.road_length - positions[-1]
+        np.subtract(gaps, state.leader_lengths, out=gaps)
+        np.minimum(state.velocities, gaps, out=state.velocities)
+
+
+class RandomBraking:
+    """ Drivers randomly decrease their velocity by one, skipped if the rule has no braking probability. """
+    def apply(self, rule, state):
+        if state.braking_probability is not None:
+            rule.apply_random_braking(state.velocities, state.braking_probability)
+
+
+class SlowToStart:
+    """
+    Cars that stood still in the previous timestep stay where they are with the given probability.
+    """
+    def __init__(self, probability):
+        self.probability = probability
+
+    def apply(self, rule, state):
+        np.less(rule.rng.rand(len(state.velocities)), self.probability, out=state.mask)
+        state.mask &= state.previous_velocities == 0
+        state.velocities[state.mask] = 0
+
+
+def stop_at_red_lights(red_light_positions, road_length, positions, velocities, distances, blocked):
+    """
+    Stops every car in front of the next red light ahead of it on the ring, in place. Only the nearest
+    red light matters, so it is found for all cars at once with searchsorted.
+    :param red_light_positions: sorted positions of the lights which are currently red
+    :param velocities: velocities of the cars, changed in place
+    :param distances: buffer of the dtype of velocities for the distances to the lights
+    :param blocked: boolean buffer for the cars which would pass a red light
+    """
+    if len(red_light_positions) == 0:
+        return
+    next_light = np.searchsorted(red_light_positions, positions, side="right") % len(red_light_positions)
+    np.subtract(red_light_positions[next_light], positions, out=distances)
+    np.mod(distances, road_length, out=distances)
+    np.less_equal(distances, velocities, out=blocked)
+    blocked &= distances > 0
+    np.subtract(distances, 1, out=velocities, where=blocked)
+
+
+class SignalClamp:
+    """ Stops every car in front of the next red light ahead of it, in the buffers of the step. """
+    def apply(self, rule, state):
+        stop_at_red_lights(rule.red_light_positions(state.time_step), rule.road_length,
+                           state.positions, state.velocities, state.distances, state.mask)
+
+
+class Move:
+    """ Updates the positions. """
+    def apply(self, rule, state):
+        np.add(state.positions, state.velocities, out=state.positions)
+        np.mod(state.positions, rule.road_length, out=state.positions)
+
+
 class MaxVelocity(Rule):
     """
     Includes a maximum velocity rule, in a non-deterministic setup.
     Driver randomly decrease their speed by 1 with a certain probability.
+
+    A timestep runs the stages in self.stages in order on the sorted cars, each changing the buffers of a
+    StepState in place. Variants of the rule only declare other stages, e.g.
+    rule.stages.insert(3, SlowToStart(0.5)) adds slow-to-start behaviour after the random braking.
     """
 
-    def __init__(self, road_length, max_velocity, braking_probability=0):
+    def __init__(self, road_length, max_velocity, braking_probability=0, fleet=None):
+        """
+        :param fleet: VehicleFleet of the cars in the order of the initial positions of every simulation,
+                      see initial_positions. Its max velocities, braking probabilities and lengths then replace
+                      max_velocity and braking_probability in apply_rule. The other engines only use the scalar
+                      parameters.
+        """
         super().__init__(road_length)
         self.max_velocity = max_velocity
         self.braking_probability = braking_probability
+        # number of braking draws and events, used as control variate
+        self.braking_draws = 0
+        self.braking_count = 0
+        self.fleet = fleet
+        self.stages = [Accelerate(), GapClamp(), RandomBraking(), Move()]
+        self.step_state = StepState()
+
+    def reset(self):
+        if self.fleet is not None:
+            self.fleet.reset()
 
     def compute_gaps(self, current_positions):
         gap = np.roll(current_positions, -1) - current_positions - np.ones(len(current_positions))
         gap[-1] += self.road_length
         return gap
 
-    def apply_rule(self, positions, velocities, time_step):
-        sorted_indices = np.argsort(positions)
-        sorted_positions = positions[sorted_indices]
-        sorted_velocities = velocities[sorted_indices]
-
-        # Gaps between each car and its preceding vehicle
-        gaps = self.compute_gaps(sorted_positions)
-
-        # Increases the velocity by one, except when max velocity is reached
-        sorted_velocities = np.minimum(sorted_velocities + 1, self.max_velocity)
-
-        # Ensures that cars don't collide
-        sorted_velocities = np.minimum(sorted_velocities, gaps)
-
-        # Includes random braking by drivers
-        braking_events = np.random.rand(len(sorted_velocities)) < self.braking_probability
-        sorted_velocities[braking_events] = np.maximum(sorted_velocities[braking_events] - 1, 0)
+    def apply_random_braking(self, sorted_velocities, braking_probability=None):
+        """
+        Decreases the velocity of randomly chosen drivers by one and keeps count of the braking events.
+        :param braking_probability: scalar or per car probabilities, defaults to braking_probability
+        """
+        if braking_probability is None:
+            braking_probability = self.braking_probability
+        braking_events = self.rng.rand(*np.shape(sorted_velocities)) < braking_probability
+        np.subtract(sorted_velocities, 1, out=sorted_velocities, where=braking_events & (sorted_velocities > 0))
+        self.braking_draws += braking_events.size
+        self.braking_count += np.count_nonzero(braking_events)
+        return sorted_velocities
+
+    def clamp_at_red_lights(self, sorted_positions, sorted_velocities, red_light_positions):
+        """
+        Stops every car in front of the next red light ahead of it, see stop_at_red_lights.
+        :param red_light_positions: positions of the lights which are currently red
+        :return: the clamped velocities, the arguments are not changed
+        """
+        if len(red_light_positions) == 0:
+            return sorted_velocities
+        red_light_positions = np.sort(red_light_positions)
+        dtype = np.result_type(sorted_positions, sorted_velocities, red_light_positions)
+        velocities = np.array(sorted_velocities, dtype=dtype)
+        stop_at_red_lights(red_light_positions, self.road_length, sorted_positions, velocities,
+                           np.empty(velocities.shape, dtype=dtype), np.empty(velocities.shape, dtype=bool))
+        return velocities
 
-        # Updates the positions
-        sorted_positions = (sorted_positions + sorted_velocities) % self.road_length
-        return sorted_positions, sorted_velocities
+    def apply_rule(self, positions, velocities, time_step):
+        state = self.step_state.load(self, positions, velocities, time_step)
+        for stage in self.stages:
+            stage.apply(self, state)
+        return state.positions, state.velocities
 
 class TrafficLights(MaxVelocity):
     """
@@ -128,24 +413,39 @@ class TrafficLights(MaxVelocity):
     """
     def __init__(self, road_length, max_velocity,
                  light_positions, green_durations,
-                 red_durations, start_red=None, offset=None, braking_probability=None):
+                 red_durations, start_red=None, offset=None, braking_probability=None, fleet=None):
         """
         :param start_red: boolean array which indicates if the initial cycle should start with red
         :param offset: array which states the time delay of a traffic lights cycle
+        :param fleet: VehicleFleet of a mixed fleet, see MaxVelocity
         """
-        super().__init__(road_length, max_velocity)
+        super().__init__(road_length, max_velocity, fleet=fleet)
         self.light_positions = light_positions
-        self.green_durations = green_durations
-        self.red_durations = red_durations
+        # the cycles are kept as arrays, so that light_states computes all lights at once
+        self.green_durations = np.asarray(green_durations)
+        self.red_durations = np.asarray(red_durations)
         self.braking_probability = braking_probability
         if start_red is not None:
-            self.start_red = start_red
+            self.start_red = np.asarray(start_red, dtype=bool)
         else:
-            self.start_red = [False for k in range(len(light_positions))]
+            self.start_red = np.zeros(len(light_positions), dtype=bool)
         if offset is not None:
-            self.offset=offset
+            self.offset = np.asarray(offset)
         else:
-            self.offset = [0 for k in range(len(light_positions))]
+            self.offset = np.zeros(len(light_positions), dtype=int)
+        self.stages = [Accelerate(), GapClamp(), RandomBraking(), SignalClamp(), Move()]
+        self.compile_cycles()
+
+    def compile_cycles(self):
+        """
+        Precomputes the arrays light_states works with in every timestep. Has to be called again after
+        the light parameters were changed.
+        """
+        self.cycle_lengths = self.green_durations + self.red_durations
+        # a light which starts with red turns green red_durations steps into its cycle
+        self.green_starts = self.offset + np.where(self.start_red, self.red_durations, 0)
+        self.light_position_array = np.asarray([] if self.light_positions is None else self.light_positions,
+                                               dtype=int)
 
     def is_light_green(self, i, time_step):
         cycle_length = self.green_durations[i] + self.red_durations[i]
@@ -161,13 +461,68 @@ class TrafficLights(MaxVelocity):
         if self.light_positions is not None:
             for i, light_pos in enumerate(self.light_positions):
                 # Call the existing logic used during apply_rule
-                states[light_pos] = self.is_light_green(i, time_step)
+                states[light_pos] = bool(self.is_light_green(i, time_step))
         return states
 
+    def light_states(self, time_step):
+        """
+        :return: boolean array over the lights, True where the light is green, (plans, lights) for
+                 BatchedTrafficLights
+        """
+        return (time_step - self.green_starts) % self.cycle_lengths < self.green_durations
+
+    def red_light_positions(self, time_step):
+        return np.sort(self.light_position_array[~self.light_states(time_step)])
+
+
+class BatchedTrafficLights(TrafficLights):
+    """
+    Implements the traffic light rule for a batch of light plans at once.
+
+    Positions and velocities are (plans, cars) arrays and every row is advanced with its own plan,
+    so a whole parameter sweep is simulated in one vectorised pass. The stages work on the cars of one
+    road, so apply_rule runs its own (plans, cars) step, with a clamp over (plans, cars, lights) since
+    every plan has other red lights.
+    """
+    def __init__(self, road_length, max_velocity,
+                 light_positions, green_durations,
+                 red_durations, start_red=None, offset=None, braking_probability=None):
+        """
+        :param green_durations: (plans, lights) array, or (lights,) array shared by all plans
+        :param red_durations: (plans, lights) array, or (lights,) array shared by all plans
+        :param start_red: (plans, lights) or (lights,) boolean array
+        :param offset: (plans, lights) or (lights,) array of time delays
+        """
+        super().__init__(road_length, max_velocity, light_positions, green_durations,
+                         red_durations, start_red, offset, braking_probability)
+        self.light_positions = np.asarray(light_positions)
+        num_lights = len(self.light_positions)
+        plan_shape = np.broadcast_shapes(np.shape(self.green_durations), np.shape(self.red_durations),
+                                         np.shape(self.start_red), np.shape(self.offset), (1, num_lights))
+        self.num_plans = plan_shape[0]
+        self.green_durations = np.broadcast_to(self.green_durations, plan_shape)
+        self.red_durations = np.broadcast_to(self.red_durations, plan_shape)
+        self.start_red = np.broadcast_to(np.asarray(self.start_red, dtype=bool), plan_shape)
+        self.offset = np.broadcast_to(self.offset, plan_shape)
+        self.compile_cycles()
+
+    def is_light_green(self, i, time_step):
+        return self.light_states(time_step)[:, i]
+
+    def get_light_states(self, time_step):
+        """ Returns the states of the lights, each as a boolean array over the plans. """
+        states = self.light_states(time_step)
+        return {light_pos: states[:, i] for i, light_pos in enumerate(self.light_positions)}
+
+    def compute_gaps(self, current_positions):
+        gap = np.roll(current_positions, -1, axis=1) - current_positions - 1
+        gap[:, -1] += self.road_length
+        return gap
+
     def apply_rule(self, positions, velocities, time_step):
-        sorted_indices = np.argsort(positions)
-        sorted_positions = positions[sorted_indices]
-        sorted_velocities = velocities[sorted_indices]
+        sorted_indices = np.argsort(positions, axis=1)
+        sorted_positions = np.take_along_axis(positions, sorted_indices, axis=1)
+        sorted_velocities = np.take_along_axis(velocities, sorted_indices, axis=1)
 
         # Gaps between each car and its preceding vehicle
         gaps = self.compute_gaps(sorted_positions)
@@ -180,16 +535,15 @@ class TrafficLights(MaxVelocity):
 
         # Includes random braking by drivers
         if self.braking_probability is not None:
-            braking_events = np.random.rand(len(sorted_velocities)) < self.braking_probability
-            sorted_velocities[braking_events] = np.maximum(sorted_velocities[braking_events] - 1, 0)
+            sorted_velocities = self.apply_random_braking(sorted_velocities)
 
-        for i in range(len(self.light_positions)):
-            light_position = self.light_positions[i]
-            if not self.is_light_green(i, time_step):
-                for j in range(len(sorted_positions)):
-                    distance_to_light = (light_position - sorted_positions[j]) % self.road_length
-                    if 0 < distance_to_light <= sorted_velocities[j]:
-                        sorted_velocities[j] = distance_to_light-1
+        # Stops cars in front of red lights, (plans, cars, lights) distances of every car to every light
+        red_lights = ~self.light_states(time_step)
+        distance_to_light = (self.light_positions - sorted_positions[:, :, None]) % self.road_length
+        blocking = (red_lights[:, None, :] & (distance_to_light > 0)
+                    & (distance_to_light <= sorted_velocities[:, :, None]))
+        stopping_distance = np.where(blocking, distance_to_light - 1, np.inf).min(axis=2)
+        sorted_velocities = np.minimum(sorted_velocities, stopping_distance)
 
         # Updates the positions
         sorted_positions = (sorted_positions + sorted_velocities) % self.road_length
@@ -204,8 +558,8 @@ class SelfOrganisedTrafficLights(MaxVelocity):
     """
     def __init__(self, road_length, max_velocity,
                  light_positions, d, threshold,
-                 min_green, max_green, braking_probability=None):
-        super().__init__(road_length, max_velocity)
+                 min_green, max_green, braking_probability=None, fleet=None):
+        super().__init__(road_length, max_velocity, fleet=fleet)
         self.light_positions = light_positions
         self.d = d
         self.threshold = threshold
@@ -213,65 +567,63 @@ class SelfOrganisedTrafficLights(MaxVelocity):
         self.max_green = max_green
         self.braking_probability = braking_probability
         # initial state: all red
-        self.is_green = [False] * len(light_positions)
-        self.time_since_change = [0] * len(light_positions)
-        self.waiting_time_counter = [0] * len(light_positions)
-
-    def update_light_states(self, positions):
-        for i, lp in enumerate(self.light_positions):
-            switch = False
-            distances = (lp - positions) % self.road_length
-            count = int(np.sum((distances > 0) & (distances <= self.d)))
-            if not self.is_green[i]:
-                self.waiting_time_counter[i] += count
-                if self.waiting_time_counter[i] >= self.threshold:
-                    # switch to green
-                    self.is_green[i] = True
-                    switch = True
-                    self.time_since_change[i] = 0
-                    self.waiting_time_counter[i] = 0
-            else:
-                if self.time_since_change[i] >= self.min_green:
-                    if count == 0 or self.time_since_change[i] >= self.max_green:
-                        self.is_green[i] = False
-                        switch = True
-                        self.time_since_change[i] = 0
-                        self.waiting_time_counter[i] = 0
-            if not switch:
-                self.time_since_change[i] += 1
+        self.is_green = np.zeros(len(light_positions), dtype=bool)
+        self.time_since_change = np.zeros(len(light_positions), dtype=int)
+        self.waiting_time_counter = np.zeros(len(light_positions), dtype=int)
+        self.stages = [Accelerate(), GapClamp(), RandomBraking(), SignalClamp(), Move()]
+
+    def reset(self):
+        """ Every simulation starts with all lights red and empty counters. """
+        super().reset()
+        self.is_green[:] = False
+        self.time_since_change[:] = 0
+        self.waiting_time_counter[:] = 0
+
+    def queue_counts(self, positions, periodic=True):
+        """
+        Counts the vehicles within distance d in front of every light, using one searchsorted
+        over the sorted positions.
+        :param periodic: False on an open road, where the window of a light ends at the entry
+        """
+        light_positions = np.asarray(self.light_positions)
+        sorted_positions = np.sort(positions)
+        if periodic:
+            # appends the positions of the previous lap, so that windows reaching behind zero stay contiguous
+            unrolled_positions = np.concatenate((sorted_positions - self.road_length, sorted_positions))
+        else:
+            unrolled_positions = sorted_positions
+        d = min(self.d, self.road_length - 1)
+        upper = np.searchsorted(unrolled_positions, light_positions - 1, side="right")
+        lower = np.searchsorted(unrolled_positions, light_positions - d, side="left")
+        return upper - lower
+
+    def update_light_states(self, positions, periodic=True):
+        count = self.queue_counts(positions, periodic)
+        red = ~self.is_green
+        self.waiting_time_counter[red] += count[red]
+
+        # red lights switch to green once enough vehicles waited,
+        # green lights switch to red after the minimum green time, when no vehicles remain or max green is reached
+        to_green = red & (self.waiting_time_counter >= self.threshold)
+        to_red = (self.is_green & (self.time_since_change >= self.min_green)
+                  & ((count == 0) | (self.time_since_change >= self.max_green)))
+        switch = to_green | to_red
+
+        self.is_green ^= switch
+        self.time_since_change = np.where(switch, 0, self.time_since_change + 1)
+        self.waiting_time_counter[switch] = 0
 
     def get_light_states(self, time_step):
         """ Returns the currently stored state of self-organized lights. """
         states = {}
         for i, light_pos in enumerate(self.light_positions):
-            states[light_pos] = self.is_green[i]  # Return the stored boolean state
+            states[light_pos] = bool(self.is_green[i])  # Return the stored boolean state
         return states
 
+    def red_light_positions(self, time_step):
+        return np.sort(np.asarray(self.light_positions, dtype=int)[~self.is_green])
+
     def apply_rule(self, positions, velocities, time_step):
         # update lights based on current queue lengths
         self.update_light_states(positions)
-
-        # sort for updates
-        sorted_indices = np.argsort(positions)
-        sorted_positions = positions[sorted_indices]
-        sorted_velocities = velocities[sorted_indices]
-
-        # apply max velocity rule
-        gaps = self.compute_gaps(sorted_positions)
-        sorted_velocities = np.minimum(sorted_velocities + 1, self.max_velocity)
-        sorted_velocities = np.minimum(sorted_velocities, gaps)
-        if self.braking_probability is not None:
-            brakes = np.random.rand(len(sorted_velocities)) < self.braking_probability
-            sorted_velocities[brakes] = np.maximum(sorted_velocities[brakes] - 1, 0)
-
-        # enforce red lights for self-organised
-        for i_lp, lp in enumerate(self.light_positions):
-            if not self.is_green[i_lp]:
-                for j in range(len(sorted_positions)):
-                    distance_to_light = (lp - sorted_positions[j]) % self.road_length
-                    if 0 < distance_to_light <= sorted_velocities[j]:
-                        sorted_velocities[j] = distance_to_light - 1
-
-        # update positions
-        sorted_positions = (sorted_positions + sorted_velocities) % self.road_length
-        return sorted_positions, sorted_velocities
+        return super().apply_rule(positions, velocities, time_step)
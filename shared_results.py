@@ -0,0 +1,100 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+import cellular_automaton as ca
+import rule
+
+
+"""
+Result blocks in shared memory for sweeps that run in worker processes. The workers write the per-step
+measurements of every (parameter point, run) directly into preallocated arrays, so nothing is pickled
+back to the parent and the memory use of a sweep is known before it starts.
+"""
+
+class SharedResultBlock:
+    """
+    Named arrays of shape (points, runs, timesteps[, road_length]) held in multiprocessing.shared_memory.
+    """
+    def __init__(self, shapes, dtypes, names=None):
+        """
+        :param shapes: dict mapping metric name to array shape
+        :param dtypes: dict mapping metric name to dtype
+        :param names: dict mapping metric name to the name of an existing shared memory block, to attach to
+        """
+        self.shapes = shapes
+        self.dtypes = {metric: np.dtype(dtype) for metric, dtype in dtypes.items()}
+        self.owner = names is None
+        self.memory = {}
+        self.arrays = {}
+        for metric, shape in shapes.items():
+            if self.owner:
+                num_bytes = max(int(np.prod(shape)) * self.dtypes[metric].itemsize, 1)
+                self.memory[metric] = shared_memory.SharedMemory(create=True, size=num_bytes)
+            else:
+                self.memory[metric] = shared_memory.SharedMemory(name=names[metric])
+            self.arrays[metric] = np.ndarray(shape, dtype=self.dtypes[metric], buffer=self.memory[metric].buf)
+        if self.owner:
+            for array in self.arrays.values():
+                array.fill(0)
+
+    def spec(self):
+        """
+        :return: picklable description of the block, which workers pass to attach
+        """
+        return {'shapes': self.shapes, 'dtypes': {metric: dtype.str for metric, dtype in self.dtypes.items()},
+                'names': {metric: memory.name for metric, memory in self.memory.items()}}
+
+    @classmethod
+    def attach(cls, spec):
+        return cls(spec['shapes'], spec['dtypes'], spec['names'])
+
+    def __getitem__(self, metric):
+        return self.arrays[metric]
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.arrays.values())
+
+    def close(self):
+        """ Releases the block, and frees the shared memory if this process created it. """
+        self.arrays = {}
+        for memory in self.memory.values():
+            memory.close()
+            if self.owner:
+                memory.unlink()
+        self.memory = {}
+
+
+# block the worker process writes into, set by attach_worker
+_worker_block = None
+
+
+def attach_worker(spec):
+    """ Pool initializer: attaches the worker process to the shared result block. """
+    global _worker_block
+    _worker_block = SharedResultBlock.attach(spec)
+
+
+def simulate_into_block(task):
+    """
+    Runs one simulation in a worker process and writes its measurements into the shared block.
+    :param task: tuple (point_index, run, num_cars, rule_instance, road_length, seed)
+    """
+    point_index, run, num_cars, rule_instance, road_length, seed = task
+    rule_instance.rng = np.random.RandomState(seed + run)
+    initial_positions = rule.initial_positions(rule_instance, num_cars, road_length, rule_instance.rng)
+    max_timesteps = _worker_block['flows'].shape[2]
+    record_evolution = 'occupancy' in _worker_block.arrays
+
+    automaton = ca.CellularAutomaton(initial_positions, np.zeros(num_cars), road_length, max_timesteps,
+                                     0, road_length - 1, record_evolution=False)
+    # the automaton writes its measurements straight into the shared arrays
+    automaton.local_flows = _worker_block['flows'][point_index, run]
+    automaton.local_space_meanVels = _worker_block['velocities'][point_index, run]
+    automaton.local_velocity_variance = _worker_block['variances'][point_index, run]
+    automaton.local_densities = _worker_block['densities'][point_index, run]
+    if record_evolution:
+        automaton.record_evolution = True
+        automaton.traffic_evolution = _worker_block['occupancy'][point_index, run]
+    automaton.simulate(rule_instance)
+    return point_index, run
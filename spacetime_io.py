@@ -0,0 +1,135 @@
+import numpy as np
+import queue
+import threading
+
+
+"""
+Out-of-core storage of the space-time diagram. A long simulation of a long road does not fit in memory,
+so the occupancy rows are collected in one of two chunk buffers and written to a .npy file by a background
+thread while the other buffer is filled. The file can be opened as a read-only np.memmap and is read
+in chunks by the analysis and plotting code.
+"""
+
+class SpaceTimeWriter:
+    """
+    Writes (max_timesteps, road_length) uint8 occupancy rows to a .npy file. push() only blocks when the
+    writer thread is still busy with the previous chunk while the next one is already full.
+    """
+    def __init__(self, path, max_timesteps, road_length, chunk_rows=1024):
+        """
+        :param chunk_rows: rows per write; two buffers of chunk_rows x road_length bytes are kept in memory
+        """
+        self.path = path
+        self.road_length = road_length
+        self.chunk_rows = min(chunk_rows, max_timesteps)
+        self.file = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(max_timesteps, road_length))
+        self.free_buffers = queue.Queue()
+        for _ in range(2):
+            self.free_buffers.put(np.zeros((self.chunk_rows, road_length), dtype=np.uint8))
+        self.full_buffers = queue.Queue()
+        self.buffer = None
+        self.buffer_rows = 0
+        self.rows_written = 0
+        self.error = None
+        self.writer = threading.Thread(target=self.write_buffers, daemon=True)
+        self.writer.start()
+
+    def write_buffers(self):
+        while True:
+            job = self.full_buffers.get()
+            if job is None:
+                return
+            buffer, start, num_rows = job
+            try:
+                self.file[start:start + num_rows] = buffer[:num_rows]
+            except Exception as error:
+                # raised again in the simulation thread by close()
+                self.error = error
+            self.free_buffers.put(buffer)
+
+    def push(self, positions):
+        """
+        Writes the occupancy of the next timestep.
+        """
+        if self.buffer is None:
+            self.buffer = self.free_buffers.get()
+            self.buffer_rows = 0
+        row = self.buffer[self.buffer_rows]
+        row[:] = 0
+        row[np.asarray(positions, dtype=int)] = 1
+        self.buffer_rows += 1
+        if self.buffer_rows == self.chunk_rows:
+            self.flush_buffer()
+
+    def flush_buffer(self):
+        if self.buffer is not None and self.buffer_rows > 0:
+            self.full_buffers.put((self.buffer, self.rows_written, self.buffer_rows))
+            self.rows_written += self.buffer_rows
+            self.buffer = None
+
+    def close(self):
+        """
+        Writes the remaining rows, waits for the writer thread and returns the file opened read-only.
+        """
+        self.flush_buffer()
+        self.full_buffers.put(None)
+        self.writer.join()
+        self.file.flush()
+        del self.file
+        if self.error is not None:
+            raise self.error
+        return open_spacetime(self.path)
+
+    def abort(self):
+        """
+        Stops the writer thread without writing the unfinished chunk, used when the simulation fails.
+        The rows written so far stay in the file.
+        """
+        self.buffer = None
+        if self.writer.is_alive():
+            self.full_buffers.put(None)
+            self.writer.join()
+        if hasattr(self, "file"):
+            del self.file
+
+
+def open_spacetime(path):
+    """
+    Opens a space-time file as a read-only memmap, nothing is read until it is indexed.
+    """
+    return np.load(path, mmap_mode="r")
+
+
+def iter_chunks(traffic_evolution, chunk_rows=4096, start=0, stop=None):
+    """
+    Yields (first timestep, rows) chunks of an in-memory or memmapped space-time array, or of a file path.
+    Every chunk is a copy in memory, at most chunk_rows x road_length.
+    """
+    if isinstance(traffic_evolution, str):
+        traffic_evolution = open_spacetime(traffic_evolution)
+    stop = traffic_evolution.shape[0] if stop is None else min(stop, traffic_evolution.shape[0])
+    for first in range(start, stop, chunk_rows):
+        yield first, np.array(traffic_evolution[first:min(first + chunk_rows, stop)])
+
+
+def downsample(traffic_evolution, max_rows=2000, max_columns=2000, chunk_rows=4096):
+    """
+    Reduces a space-time array chunk by chunk to at most max_rows x max_columns for plotting.
+    Merged cells are occupied if any of their cells is.
+    :return: (image, row factor, column factor)
+    """
+    if isinstance(traffic_evolution, str):
+        traffic_evolution = open_spacetime(traffic_evolution)
+    num_timesteps, road_length = traffic_evolution.shape
+    row_factor = max(int(np.ceil(num_timesteps / max_rows)), 1)
+    column_factor = max(int(np.ceil(road_length / max_columns)), 1)
+    # chunks hold whole groups of merged rows
+    chunk_rows = max(chunk_rows // row_factor, 1) * row_factor
+    num_columns = -(-road_length // column_factor)
+    image = np.zeros((-(-num_timesteps // row_factor), num_columns), dtype=np.uint8)
+    for first, rows in iter_chunks(traffic_evolution, chunk_rows):
+        padded = np.zeros((-(-rows.shape[0] // row_factor) * row_factor, num_columns * column_factor), dtype=np.uint8)
+        padded[:rows.shape[0], :road_length] = rows
+        merged = padded.reshape(-1, row_factor, num_columns, column_factor).max(axis=(1, 3))
+        image[first // row_factor:first // row_factor + merged.shape[0]] = merged
+    return image, row_factor, column_factor
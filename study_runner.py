@@ -0,0 +1,148 @@
+import argparse
+import json
+import pickle
+import sys
+
+import numpy as np
+
+from analyser import Analyser
+
+
+"""
+Headless command line entry point that runs named studies of the Analyser from a TOML or JSON config:
+
+    python -m study_runner studies.toml green_red_split --plot
+
+Every top-level entry of the config names one study: the Analyser method in "study", the Analyser
+settings (road_length, max_timesteps, num_runs_per_point) and the method arguments in "parameters".
+Parameter values may be given as {"range": [start, stop, step]} or {"linspace": [start, stop, num]}.
+matplotlib is only imported if a plot is asked for.
+"""
+
+
+def _plot_density_vel_flow(vis, analyser, parameters, results):
+    vis.density_meanvel_flow_plot("pickle_results/density_vel_flow.pkl",
+                                  f"vmax={parameters['max_velocity_list'][-1]}")
+
+
+def _plot_flow_braking_prob(vis, analyser, parameters, results):
+    vis.flow_braking_prob(results)
+
+
+def _plot_traffic_light_cycle(vis, analyser, parameters, results):
+    vis.traffic_light_cycle_flow_sync_plot(results)
+
+
+def _plot_green_red_split(vis, analyser, parameters, results):
+    vis.red_green_proportion_plot("pickle_results/green_red_split.pkl")
+
+
+def _plot_traffic_light_offset(vis, analyser, parameters, results):
+    vis.traffic_light_delay_flow_plot(results)
+
+
+def _plot_cycle_flow_offset(vis, analyser, parameters, results):
+    vis.traffic_light_cycle_flow_delay(results)
+
+
+def _plot_compare_sync_gw(vis, analyser, parameters, results):
+    vis.compare_sync_gw(results)
+
+
+def _plot_compare_gw_sotl(vis, analyser, parameters, results):
+    vis.compare_gw_sotl(results)
+
+
+def _plot_sotl_onefixed(vis, analyser, parameters, results):
+    vis.sotl_parameter_influence_onefixed(parameters['parameter_to_vary'], results)
+
+
+def _plot_sotl_grid(vis, analyser, parameters, results):
+    vis.sotl_parameter_influence_grid(parameters['threshold_values'], parameters['distance_values'],
+                                      "data/flows_grid.csv", results)
+
+
+# Analyser studies which can be run from a config, with the function plotting their results
+STUDIES = {
+    "density_vel_flow": _plot_density_vel_flow,
+    "flow_braking_prob_plot": _plot_flow_braking_prob,
+    "traffic_light_cycle_analysis": _plot_traffic_light_cycle,
+    "analyse_green_red_split": _plot_green_red_split,
+    "traffic_light_offset_analysis": _plot_traffic_light_offset,
+    "traffic_light_cycle_flow_offset": _plot_cycle_flow_offset,
+    "compare_sync_gw": _plot_compare_sync_gw,
+    "compare_gw_sotl": _plot_compare_gw_sotl,
+    "analyse_sotl_parameter_onefixed": _plot_sotl_onefixed,
+    "analyse_sotl_parametergrid": _plot_sotl_grid,
+    "optimise_traffic_lights": None,
+    "optimise_sotl": None,
+}
+
+
+def load_config(path):
+    """
+    Reads a study config from a .toml or .json file.
+    """
+    if path.endswith(".toml"):
+        import tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def expand_parameter(value):
+    """
+    Turns {"range": [...]} and {"linspace": [...]} config values into arrays.
+    """
+    if isinstance(value, dict) and "range" in value:
+        return np.arange(*value["range"])
+    if isinstance(value, dict) and "linspace" in value:
+        start, stop, num = value["linspace"]
+        return np.linspace(start, stop, int(num))
+    return value
+
+
+def run_study(name, config, plot=False):
+    """
+    Runs one named study of a config and returns its results.
+    """
+    study = config["study"]
+    if study not in STUDIES:
+        raise ValueError(f"Unknown study '{study}' in '{name}', choose from {sorted(STUDIES)}")
+    parameters = {key: expand_parameter(value) for key, value in config.get("parameters", {}).items()}
+    analyser = Analyser(config["road_length"], config["max_timesteps"], config["num_runs_per_point"])
+
+    print(f"Running {name} ({study})")
+    results = getattr(analyser, study)(**parameters)
+
+    if plot and STUDIES[study] is not None:
+        # imported here, so that headless runs never load matplotlib
+        import visualiser
+        STUDIES[study](visualiser.Visualiser(), analyser, parameters, results)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Runs named traffic flow studies from a TOML/JSON config.")
+    parser.add_argument("config", help="path to a .toml or .json study config")
+    parser.add_argument("studies", nargs="*", help="names of the studies to run, all if omitted")
+    parser.add_argument("--plot", action="store_true", help="plot the results of every study")
+    parser.add_argument("--output", help="pickle file the results of all studies are written to")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    names = args.studies or list(config)
+    unknown = [name for name in names if name not in config]
+    if unknown:
+        parser.error(f"studies {unknown} are not defined in {args.config}")
+
+    all_results = {name: run_study(name, config[name], args.plot) for name in names}
+    if args.output is not None:
+        with open(args.output, "wb") as f:
+            pickle.dump(all_results, f)
+    return all_results
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
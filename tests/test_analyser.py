@@ -0,0 +1,141 @@
+import numpy as np
+import pytest
+
+import analyser
+import rule
+
+
+class CountingRule(rule.MaxVelocity):
+    """ Counts the simulated timesteps. """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.steps = 0
+
+    def apply_rule(self, positions, velocities, time_step):
+        self.steps += 1
+        return super().apply_rule(positions, velocities, time_step)
+
+
+@pytest.fixture
+def study():
+    return analyser.Analyser(60, 100, 3)
+
+
+def test_successive_halving_finds_the_best_candidate():
+    study = analyser.Analyser(100, 300, 3)
+    candidates = [{'p': p} for p in [0.5, 0.3, 0.0, 0.1, 0.7, 0.2, 0.4, 0.6, 0.8]]
+    results = study._successive_halving(lambda params: rule.MaxVelocity(100, 5, params['p']), candidates, 20)
+    assert results['best_parameters'] == {'p': 0.0}
+    # the last rung is simulated with the full budget and the seed of a single study
+    assert results['best_flow'] == study._run_single_simulation(20, rule.MaxVelocity(100, 5, 0.0), seed=0)['flow']
+    assert [len(rung['candidates']) for rung in results['history']] == [9, 3, 1]
+    assert results['simulated_fraction'] < 0.3
+
+
+def test_optimise_traffic_lights_prefers_long_green():
+    study = analyser.Analyser(100, 300, 3)
+    results = study.optimise_traffic_lights(30, 5, [25, 75], [20, 40], [0.1, 0.5, 0.9], [0, 5])
+    best = results['best_parameters']
+    assert best['green_duration'] > best['red_duration']
+    assert results['simulated_fraction'] < 1
+
+
+def test_studies_restore_the_rng_of_the_rule(study):
+    r = rule.MaxVelocity(60, 3, 0.3)
+    rng = np.random.RandomState(1)
+    r.rng = rng
+    study._run_single_simulation(20, r, seed=0)
+    study._run_single_simulation(20, r)
+    study._successive_halving(lambda params: r, [{}, {}], 20)
+    assert r.rng is rng
+
+
+def test_paired_runs_share_their_random_numbers(study):
+    first, second = rule.MaxVelocity(60, 3, 0.3), rule.MaxVelocity(60, 3, 0.3)
+    first_rng, second_rng = np.random.RandomState(1), np.random.RandomState(2)
+    first.rng, second.rng = first_rng, second_rng
+    for antithetic in (False, True):
+        per_rule = study._run_paired_simulations(20, [first, second], seed=0, antithetic=antithetic)
+        # identical rules see identical braking events, so every paired difference vanishes
+        np.testing.assert_array_equal(per_rule[0]['flows'], per_rule[1]['flows'])
+    assert first.rng is first_rng and second.rng is second_rng
+
+
+def test_shared_sweep_matches_serial_seeded_runs(study):
+    points = [(10, rule.MaxVelocity(60, 3, 0.3)), (30, rule.TrafficLights(60, 3, [20, 50], [5, 5], [5, 5],
+                                                                             braking_probability=0.2))]
+    shared = study.run_shared_sweep(points, num_processes=2, seed=4, record_evolution=True)
+    for k, (num_cars, rule_instance) in enumerate(points):
+        serial = study._run_single_simulation(num_cars, rule_instance, seed=4)
+        for key in ("flow", "velocity", "variance", "flow_ci_lower", "flow_ci_upper", "run_velocities"):
+            np.testing.assert_allclose(shared[key][k], serial[key])
+        np.testing.assert_allclose(shared["occupancy"][k].sum(axis=1), num_cars, rtol=1e-5)
+
+
+def test_seeded_runs_are_reproducible(study):
+    r = rule.MaxVelocity(60, 3, 0.3)
+    first = study._run_single_simulation(20, r, seed=5)
+    second = study._run_single_simulation(20, r, seed=5)
+    assert set(analyser.Analyser.RUN_KEYS.values()) <= set(first)
+    for key in first:
+        np.testing.assert_array_equal(first[key], second[key])
+    assert first["flow_ci_lower"] <= first["flow"] <= first["flow_ci_upper"]
+
+
+def assert_uncertainty(results, prefix=""):
+    """ Every metric comes with its standard error and a confidence interval around the mean. """
+    for name, key in analyser.Analyser.RESULT_KEYS.items():
+        means = np.asarray(results[prefix + key], dtype=float)
+        assert np.shape(results[f"{prefix}{name}_stderrs"]) == means.shape
+        assert np.all(np.asarray(results[f"{prefix}{name}_ci_lowers"]) <= means + 1e-12)
+        assert np.all(means <= np.asarray(results[f"{prefix}{name}_ci_uppers"]) + 1e-12)
+
+
+def test_every_study_reports_uncertainty(study, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "pickle_results").mkdir()
+    (tmp_path / "data").mkdir()
+    sotl_parameters = {'d': 5, 'threshold': 5, 'min_green': 3, 'max_green': 10}
+    assert_uncertainty(study.flow_braking_prob_plot([0.1, 0.5], 10))
+    assert_uncertainty(study.traffic_light_cycle_analysis([10, 20], 3, [15, 45], [4, 8], 0.1))
+    for cycle_results in study.analyse_green_red_split(10, 3, [15, 45], [6, 10], 0.1).values():
+        assert_uncertainty(cycle_results)
+    assert_uncertainty(study.traffic_light_offset_analysis([10, 20], 3, [15, 45], [5, 5], [5, 5], [0, 2], 0.1))
+    assert_uncertainty(study.traffic_light_cycle_flow_offset(15, 3, [15, 45], [4, 8], [0, 3], 0.1))
+    for paired in (False, True):
+        results = study.compare_sync_gw([10, 20], 3, [15, 45], {'green_duration': 5, 'red_duration': 5}, 3,
+                                        paired=paired)
+        assert_uncertainty(results, "gw_")
+        assert_uncertainty(results, "sync_")
+    results = study.compare_gw_sotl([10, 20], 3, [15, 45], {'green_duration': 5, 'red_duration': 5},
+                                    sotl_parameters)
+    assert_uncertainty(results, "gw_")
+    assert_uncertainty(results, "sotl_")
+    assert_uncertainty(study.analyse_sotl_parameter_onefixed(15, 3, [15, 45], 'threshold', [2, 8], sotl_parameters))
+    grids = study.analyse_sotl_parametergrid(15, 3, [15, 45], [2, 8], [3, 6],
+                                             {'min_green': 3, 'max_green': 10, 'braking_probability': 0.1})
+    for name, key in analyser.Analyser.RESULT_KEYS.items():
+        assert np.all(grids[f"{name}_ci_lower_grid"] <= grids[f"{key}_grid"] + 1e-12)
+        assert np.all(grids[f"{key}_grid"] <= grids[f"{name}_ci_upper_grid"] + 1e-12)
+    for diagram in study.density_vel_flow([3], [0.2], num_points=3, seed=0).values():
+        assert_uncertainty(diagram)
+
+
+def test_warm_start_sweep_is_cheaper_than_cold_starts(study):
+    num_cars_list = [5, 15, 25, 35, 45]
+    cold, warm = CountingRule(60, 3, 0.3), CountingRule(60, 3, 0.3)
+    cold_flows = [study._run_single_simulation(num_cars, cold, seed=0)['flow'] for num_cars in num_cars_list]
+    rng = np.random.RandomState(1)
+    warm.rng = rng
+    metrics = study._run_warm_start_sweep(num_cars_list, warm, seed=0)
+    assert warm.rng is rng
+    np.testing.assert_allclose([point['flow'] for point in metrics], cold_flows, atol=0.03)
+    # the first point relaxes for max_timesteps, the others for max_timesteps // 10, all measure max_timesteps // 2
+    assert warm.steps == study.num_runs_per_point * (100 + 50 + (len(num_cars_list) - 1) * (10 + 50))
+    assert warm.steps < cold.steps
+
+
+def test_warm_start_sweep_rejects_fleets(study):
+    fleet = rule.VehicleFleet([3] * 10, [0.1] * 10)
+    with pytest.raises(ValueError):
+        study._run_warm_start_sweep([10], rule.MaxVelocity(60, 3, fleet=fleet))
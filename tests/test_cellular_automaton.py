@@ -0,0 +1,36 @@
+import threading
+
+import numpy as np
+import pytest
+
+import cellular_automaton as ca
+import rule
+
+
+class FailingRule(rule.MaxVelocity):
+    def apply_rule(self, positions, velocities, time_step):
+        if time_step == 5:
+            raise RuntimeError("rule failed")
+        return super().apply_rule(positions, velocities, time_step)
+
+
+def test_evolution_file_matches_in_memory(tmp_path):
+    road_length, num_cars = 50, 20
+    results = []
+    for evolution_file in (None, str(tmp_path / "evolution.npy")):
+        r = rule.MaxVelocity(road_length, 4, 0.2)
+        r.rng = np.random.RandomState(0)
+        automaton = ca.CellularAutomaton(np.arange(0, 40, 2), np.zeros(num_cars), road_length, 100,
+                                         evolution_file=evolution_file, chunk_rows=16)
+        results.append(np.asarray(automaton.simulate(r)[0]))
+    np.testing.assert_array_equal(results[0], results[1])
+
+
+def test_writer_is_stopped_when_the_rule_fails(tmp_path):
+    threads = threading.active_count()
+    automaton = ca.CellularAutomaton(np.arange(0, 20, 2), np.zeros(10), 40, 50,
+                                     evolution_file=str(tmp_path / "evolution.npy"), chunk_rows=2)
+    with pytest.raises(RuntimeError):
+        automaton.simulate(FailingRule(40, 3, 0.2))
+    assert automaton.evolution_writer is None
+    assert threading.active_count() == threads
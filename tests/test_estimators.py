@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+
+import estimators
+
+
+@pytest.mark.parametrize("dof, expected", [(1, 12.7062), (2, 4.3027), (3, 3.1824), (5, 2.5706),
+                                           (10, 2.2281), (30, 2.0423), (60, 2.0003), (120, 1.9799)])
+def test_t_quantile_matches_tables(dof, expected):
+    assert estimators.t_quantile(0.95, dof) == pytest.approx(expected, abs=2e-4)
+
+
+def test_control_variate_counts_the_estimated_slope():
+    rng = np.random.RandomState(0)
+    control = rng.rand(6)
+    samples = 2 * control + 0.1 * rng.rand(6)
+    result = estimators.mean_confidence_interval(samples, control=control, control_mean=0.5)
+    # four degrees of freedom are left after the mean and the slope
+    residuals = samples - np.polyfit(control, samples, 1)[0] * (control - 0.5)
+    expected = estimators.t_quantile(0.95, 4) * np.std(residuals, ddof=2) / np.sqrt(6)
+    lower, upper = result["ci"]
+    assert (upper - lower) / 2 == pytest.approx(expected, rel=1e-6)
+
+
+def test_antithetic_stream_mirrors_the_draws():
+    mirrored = estimators.AntitheticRandomState(np.random.RandomState(3))
+    np.testing.assert_allclose(mirrored.rand(5), 1 - np.random.RandomState(3).rand(5))
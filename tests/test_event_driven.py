@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import cellular_automaton as ca
+import event_driven
+import rule
+
+
+def random_start(road_length, num_cars, seed):
+    return np.sort(np.random.RandomState(seed).choice(road_length, num_cars, replace=False))
+
+
+def test_deterministic_run_matches_the_cellular_automaton():
+    # without random braking the free cars are advanced exactly, so both engines must agree car by car
+    road_length, num_cars, max_timesteps = 400, 30, 500
+    positions = random_start(road_length, num_cars, 0)
+    automaton = ca.CellularAutomaton(positions, np.zeros(num_cars, dtype=int), road_length, max_timesteps,
+                                     0, road_length - 1, record_evolution=False)
+    # the automaton records the velocities at the start of every step
+    mean_velocities = automaton.simulate(rule.TrafficLights(road_length, 5, [100, 300], [30, 20], [10, 25],
+                                                            braking_probability=0))[1]
+
+    events = event_driven.EventDrivenAutomaton(positions, np.zeros(num_cars, dtype=int), road_length, max_timesteps)
+    lights = rule.TrafficLights(road_length, 5, [100, 300], [30, 20], [10, 25], braking_probability=0)
+    mean_velocity, _, active_fraction = events.simulate(lights)
+    np.testing.assert_array_equal(np.sort(events.positions), np.sort(automaton.positions))
+    distance_travelled = num_cars * (np.sum(mean_velocities[1:]) + np.mean(automaton.velocities))
+    assert mean_velocity * num_cars * max_timesteps == pytest.approx(distance_travelled)
+    assert 0 < active_fraction < 1
+
+
+def test_free_flow_matches_the_cellular_automaton_statistically():
+    road_length, num_cars, max_timesteps, p = 1000, 40, 2000, 0.3
+    positions = random_start(road_length, num_cars, 1)
+    automaton = ca.CellularAutomaton(positions, np.zeros(num_cars, dtype=int), road_length, max_timesteps,
+                                     0, road_length - 1, record_evolution=False)
+    cell_rule = rule.MaxVelocity(road_length, 5, p)
+    cell_rule.rng = np.random.RandomState(2)
+    expected = np.mean(automaton.simulate(cell_rule)[1])
+
+    events = event_driven.EventDrivenAutomaton(positions, np.zeros(num_cars, dtype=int), road_length, max_timesteps)
+    event_rule = rule.MaxVelocity(road_length, 5, p)
+    event_rule.rng = np.random.RandomState(3)
+    mean_velocity, flow, active_fraction = events.simulate(event_rule)
+    # free flow at vmax - p, apart from the start from rest
+    assert abs(mean_velocity - expected) < 0.02
+    assert flow == num_cars / road_length * mean_velocity
+    assert active_fraction < 0.3
+    assert len(np.unique(events.positions)) == num_cars
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+import grid_network
+import rule
+
+
+class CheckedController:
+    """
+    Wraps an intersection controller and checks at every step that no two cars share a cell.
+    """
+    def __init__(self, controller):
+        self.controller = controller
+        self.num_checks = 0
+
+    def horizontal_green(self, time_step, automaton):
+        assert automaton.occupancy_grid().sum() == len(automaton.positions)
+        self.num_checks += 1
+        return self.controller.horizontal_green(time_step, automaton)
+
+
+@pytest.mark.parametrize("controller", [
+    grid_network.FixedCycleIntersections(3, 4, 6, 5, grid_network.green_wave_offsets(3, 4, 4, 3)),
+    grid_network.SelfOrganisedIntersections(3, 4, d=3, threshold=6, min_green=2, max_green=12),
+])
+def test_cars_never_collide(controller):
+    num_rows, num_cols, block_length, num_cars, max_timesteps = 3, 4, 4, 30, 200
+    rng = np.random.RandomState(0)
+    streets, positions = grid_network.GridAutomaton.random_cars(num_rows, num_cols, block_length, num_cars, rng)
+    automaton = grid_network.GridAutomaton(num_rows, num_cols, block_length, streets, positions,
+                                           np.zeros(num_cars, dtype=int), max_timesteps)
+    # vmax above the block length lets a car reach two intersections in one step
+    driving_rule = rule.MaxVelocity(automaton.num_cells, 5, 0.2)
+    driving_rule.rng = np.random.RandomState(1)
+    checked = CheckedController(controller)
+    mean_velocities, flows, _ = automaton.simulate(driving_rule, checked)
+
+    assert checked.num_checks == max_timesteps
+    assert automaton.occupancy_grid().sum() == num_cars
+    # cars stay on their streets
+    np.testing.assert_array_equal(np.bincount(automaton.streets, minlength=num_rows + num_cols),
+                                  np.bincount(streets, minlength=num_rows + num_cols))
+    assert mean_velocities.mean() > 0
+    np.testing.assert_allclose(flows, num_cars / automaton.num_cells * mean_velocities)
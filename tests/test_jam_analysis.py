@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+import cellular_automaton as ca
+import jam_analysis
+import rule
+
+
+@pytest.fixture(scope="module")
+def congested_run(tmp_path_factory):
+    road_length, num_cars, max_timesteps = 200, 70, 600
+    r = rule.MaxVelocity(road_length, 5, 0.3)
+    r.rng = np.random.RandomState(4)
+    positions = np.sort(r.rng.choice(road_length, num_cars, replace=False))
+    path = str(tmp_path_factory.mktemp("jams") / "evolution.npy")
+    automaton = ca.CellularAutomaton(positions, np.zeros(num_cars), road_length, max_timesteps,
+                                     evolution_file=path, chunk_rows=64)
+    return automaton.simulate(r)[0], path
+
+
+def test_chunked_analysis_matches_in_memory(congested_run):
+    traffic_evolution, path = congested_run
+    in_memory = jam_analysis.analyse_jams(np.array(traffic_evolution), chunk_rows=10 ** 6)
+    assert in_memory["num_jams"] > 0
+    for chunk_rows in (1, 7, 64, 599):
+        for source in (np.array(traffic_evolution), traffic_evolution, path):
+            chunked = jam_analysis.analyse_jams(source, chunk_rows=chunk_rows)
+            for key, value in in_memory.items():
+                np.testing.assert_array_equal(chunked[key], value)
+
+
+def test_clusters_wrap_around_the_road():
+    traffic_evolution = np.zeros((2, 10), dtype=np.uint8)
+    traffic_evolution[:, [0, 1, 8, 9, 4]] = 1
+    times, starts, lengths = jam_analysis.stopped_clusters(traffic_evolution)
+    np.testing.assert_array_equal(times, [0, 0])
+    np.testing.assert_array_equal(starts, [4, 8])
+    np.testing.assert_array_equal(lengths, [1, 4])
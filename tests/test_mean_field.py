@@ -0,0 +1,37 @@
+import numpy as np
+import pytest
+
+import mean_field
+
+
+@pytest.mark.parametrize("max_velocity, braking_probability", [(2, 0.3), (3, 0.2)])
+def test_estimate_is_within_the_documented_error_of_a_simulation(max_velocity, braking_probability):
+    densities = np.array([0.05, 0.1, 0.15, 0.2, 0.25, 0.35, 0.5])
+    # an independent, shorter run than the calibration
+    simulated = mean_field.simulated_flows(densities, max_velocity, braking_probability, road_length=400,
+                                           max_timesteps=1500, warm_up=500, seed=1)
+    estimated = mean_field.estimate_flow(densities, max_velocity, braking_probability)
+    np.testing.assert_allclose(estimated, simulated, atol=0.02)
+    assert abs(np.max(estimated) / np.max(simulated) - 1) <= 0.05
+
+    lower, upper = mean_field.flow_bounds(densities, max_velocity, braking_probability)
+    assert np.all(lower <= estimated) and np.all(estimated <= upper)
+
+
+def test_exact_cases():
+    densities = np.linspace(0.05, 0.95, 19)
+    np.testing.assert_allclose(mean_field.estimate_flow(densities, 4, 0),
+                               np.minimum(4 * densities, 1 - densities))
+    lower, upper = mean_field.flow_bounds(densities, 1, 0.3)
+    np.testing.assert_array_equal(lower, upper)
+    simulated = mean_field.simulated_flows([0.2, 0.5, 0.8], 1, 0.3, road_length=400, max_timesteps=1500,
+                                           warm_up=500, seed=1)
+    np.testing.assert_allclose(mean_field.two_cluster_flow([0.2, 0.5, 0.8], 0.3), simulated, atol=0.01)
+
+
+def test_tables_cover_the_calibrated_range():
+    rows = np.array(mean_field.JAM_SLOPES)
+    assert rows.shape == (len(mean_field.JAM_MAX_VELOCITIES), len(mean_field.JAM_BRAKING_PROBABILITIES))
+    assert np.shape(mean_field.JAM_INTERCEPTS) == rows.shape
+    # beyond the calibrated max velocities the last row is used
+    np.testing.assert_array_equal(mean_field.congested_flow([0.5], 9, 0.2), mean_field.congested_flow([0.5], 5, 0.2))
@@ -0,0 +1,39 @@
+import numpy as np
+
+import cellular_automaton as ca
+import multilane
+import rule
+
+
+def light_rule(road_length, seed):
+    r = rule.TrafficLights(road_length, 5, [30, 70], [12, 8], [6, 10], braking_probability=0.2)
+    r.rng = np.random.RandomState(seed)
+    return r
+
+
+def test_single_lane_matches_the_cellular_automaton():
+    road_length, num_cars, max_timesteps = 100, 35, 300
+    positions = np.sort(np.random.RandomState(0).choice(road_length, num_cars, replace=False))
+    automaton = ca.CellularAutomaton(positions, np.zeros(num_cars, dtype=int), road_length, max_timesteps,
+                                     0, road_length - 1)
+    traffic_evolution, mean_velocities = automaton.simulate(light_rule(road_length, 1))[:2]
+    lanes = multilane.MultiLaneAutomaton(np.zeros(num_cars), positions, np.zeros(num_cars), 1, road_length,
+                                         max_timesteps, lane_change_probability=0.5, record_evolution=True)
+    lane_evolution, lane_mean_velocities, _, lane_changes, _ = lanes.simulate(light_rule(road_length, 1))
+    np.testing.assert_array_equal(lane_evolution[:, 0], traffic_evolution)
+    np.testing.assert_allclose(lane_mean_velocities, mean_velocities)
+    assert lane_changes.sum() == 0
+
+
+def test_lanes_change_without_collisions():
+    road_length, num_lanes, num_cars = 100, 3, 120
+    rng = np.random.RandomState(2)
+    cells = rng.choice(num_lanes * road_length, num_cars, replace=False)
+    lanes = multilane.MultiLaneAutomaton(cells // road_length, cells % road_length, np.zeros(num_cars),
+                                         num_lanes, road_length, 300, lane_change_probability=0.8,
+                                         record_evolution=True)
+    traffic_evolution, _, _, lane_changes, _ = lanes.simulate(light_rule(road_length, 3))
+    assert lane_changes.sum() > 0
+    # every car keeps a cell of its own
+    np.testing.assert_array_equal(traffic_evolution.sum(axis=(1, 2)), num_cars)
+    assert len(np.unique(lanes.lanes * road_length + lanes.positions)) == num_cars
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import hybrid_corridor
+import open_road
+import rule
+
+
+@pytest.mark.parametrize("outflow_probability", [1.0, 0.4])
+def test_open_road_conserves_vehicles(outflow_probability):
+    road_length = 100
+    road = open_road.OpenRoadAutomaton(road_length, 500, 0.6, outflow_probability, record_evolution=True)
+    r = rule.SelfOrganisedTrafficLights(road_length, 5, [30, 70], 6, 8, 3, 15, braking_probability=0.2)
+    r.rng = np.random.RandomState(0)
+    traffic_evolution, car_counts, injected, exited = road.simulate(r)[:4]
+    assert injected.sum() > 0 and exited.sum() > 0
+    np.testing.assert_array_equal(car_counts[1:], car_counts[:-1] + injected[:-1] - exited[:-1])
+    np.testing.assert_array_equal(traffic_evolution.sum(axis=1), car_counts)
+    assert road.num_cars == car_counts[-1] + injected[-1] - exited[-1]
+
+
+def test_open_road_exits_at_most_max_exits():
+    road = open_road.OpenRoadAutomaton(20, 1, 0)
+    r = rule.MaxVelocity(20, 5)
+    # three cars in front of the exit, which all could leave in one step
+    road.positions[:3] = [19, 18, 17]
+    road.velocities[:3] = 5
+    road.num_cars = 3
+    assert road.advance(r, 0, False, True, max_exits=1)[0] == 1
+    assert road.num_cars == 2
+    assert road.advance(r, 1, False, True, max_exits=0)[0] == 0
+    assert road.num_cars == 2
+    assert np.all(road.positions[road.car_indices()] < 20)
+
+
+def test_hybrid_corridor_conserves_vehicles():
+    diagram = hybrid_corridor.TriangularDiagram(1.0, 0.5, 0.8)
+    corridor = hybrid_corridor.HybridCorridor(1200, [300, 700], [20, 15], [20, 25], diagram, 5,
+                                              braking_probability=0.2, inflow_rate=0.3,
+                                              upstream_cells=60, downstream_cells=30)
+    corridor.rng = np.random.RandomState(1)
+    num_vehicles = np.zeros(800)
+    for t in range(800):
+        corridor.step(t)
+        num_vehicles[t] = corridor.total_vehicles()
+        assert np.all(corridor.exit_credits >= 0)
+        assert np.all(corridor.vehicles >= -1e-12)
+    assert corridor.left > 0
+    assert num_vehicles[-1] == pytest.approx(corridor.entered - corridor.left, abs=1e-9)
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+import cellular_automaton as ca
+import ring_buffer
+import rule
+
+
+def test_window_of_an_empty_buffer_has_the_merged_width():
+    buffer = ring_buffer.SpaceTimeRingBuffer(100, 2500)
+    rows, light_rows, start = buffer.window(2000)
+    assert rows.shape == (0, 1250)
+    assert start == 0
+    assert buffer.window()[0].shape == (0, 2500)
+
+
+def test_window_merges_cells_of_a_partly_filled_buffer():
+    buffer = ring_buffer.SpaceTimeRingBuffer(100, 2500, light_positions=[10])
+    buffer.push([0, 1, 2499], {10: True})
+    buffer.push([5], {10: False})
+    rows, light_rows, start = buffer.window(2000)
+    assert rows.shape == (2, 1250)
+    np.testing.assert_array_equal(np.flatnonzero(rows[0]), [0, 1249])
+    np.testing.assert_array_equal(np.flatnonzero(rows[1]), [2])
+    np.testing.assert_array_equal(light_rows[:, 0], [True, False])
+
+
+def test_window_keeps_the_newest_rows_in_order():
+    buffer = ring_buffer.SpaceTimeRingBuffer(3, 10)
+    for t in range(5):
+        buffer.push([t])
+    rows, _, start = buffer.window()
+    assert start == 2
+    np.testing.assert_array_equal(np.argmax(rows, axis=1), [2, 3, 4])
+
+
+def test_live_plot_draws_an_empty_and_a_filling_buffer(monkeypatch):
+    matplotlib = pytest.importorskip("matplotlib")
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import visualiser
+    monkeypatch.setattr(plt, "show", lambda *args, **kwargs: None)
+    buffer = ring_buffer.SpaceTimeRingBuffer(100, 2500, light_positions=[100, 2000])
+    animation = visualiser.Visualiser().live_plot(buffer, max_columns=2000)
+    figure = plt.gcf()
+    figure.canvas.draw()
+    buffer.push([0, 1, 2499], {100: True, 2000: False})
+    figure.canvas.draw()
+    assert figure.axes[0].images[0].get_array().shape == (100, 1250)
+    animation.event_source.stop()
+    plt.close(figure)
+
+
+def test_live_buffer_sees_multi_cell_vehicles_across_the_end_of_the_ring():
+    road_length, max_timesteps = 40, 60
+    fleet = rule.VehicleFleet.from_classes([0, 1, 0, 1, 0, 0], [5, 3], [0.1, 0.1], [1, 4])
+    r = rule.MaxVelocity(road_length, 5, 0.1, fleet=fleet)
+    r.rng = np.random.RandomState(0)
+    positions = rule.initial_positions(r, len(fleet), road_length, r.rng)
+    buffer = ring_buffer.SpaceTimeRingBuffer(max_timesteps, road_length)
+    automaton = ca.CellularAutomaton(positions, np.zeros(len(fleet)), road_length, max_timesteps,
+                                     live_buffer=buffer)
+    traffic_evolution = automaton.simulate(r)[0]
+    # the cars pass the end of the ring several times in 60 steps, and each time the fleet is reordered
+    np.testing.assert_array_equal(buffer.window()[0], traffic_evolution)
+    np.testing.assert_array_equal(buffer.rows.sum(axis=1), np.sum(fleet.lengths))
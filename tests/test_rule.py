@@ -0,0 +1,187 @@
+import numpy as np
+import pytest
+
+import cellular_automaton as ca
+import rule
+
+
+def reference_step(positions, velocities, road_length, max_velocity, braking_probability, rng,
+                   red_light_positions=()):
+    """ One NaSch timestep written out car by car, drawing the braking numbers like the rules do. """
+    order = np.argsort(positions)
+    positions, velocities = positions[order], velocities[order]
+    num_cars = len(positions)
+    new_velocities = np.zeros(num_cars)
+    for i in range(num_cars):
+        gap = (positions[(i + 1) % num_cars] - positions[i] - 1) % road_length if num_cars > 1 else road_length - 1
+        new_velocities[i] = min(velocities[i] + 1, max_velocity, gap)
+    braking = rng.rand(num_cars) < braking_probability
+    new_velocities[braking & (new_velocities > 0)] -= 1
+    for i in range(num_cars):
+        for light_pos in red_light_positions:
+            distance = (light_pos - positions[i]) % road_length
+            if 0 < distance <= new_velocities[i]:
+                new_velocities[i] = distance - 1
+    return (positions + new_velocities) % road_length, new_velocities
+
+
+def random_state(road_length, num_cars, seed):
+    rng = np.random.RandomState(seed)
+    return np.sort(rng.choice(road_length, num_cars, replace=False)).astype(float), np.zeros(num_cars)
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_max_velocity_matches_reference(seed):
+    road_length, max_velocity, p = 50, 5, 0.3
+    positions, velocities = random_state(road_length, 20, seed)
+    r = rule.MaxVelocity(road_length, max_velocity, p)
+    r.rng = np.random.RandomState(seed)
+    reference_rng = np.random.RandomState(seed)
+    expected = (positions, velocities)
+    for t in range(100):
+        positions, velocities = r.apply_rule(positions, velocities, t)
+        expected = reference_step(*expected, road_length, max_velocity, p, reference_rng)
+        np.testing.assert_array_equal(positions, expected[0])
+        np.testing.assert_array_equal(velocities, expected[1])
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_traffic_lights_match_reference(seed):
+    road_length, max_velocity, p = 60, 4, 0.2
+    light_positions, green, red = [15, 40], [7, 5], [4, 9]
+    positions, velocities = random_state(road_length, 25, seed)
+    r = rule.TrafficLights(road_length, max_velocity, light_positions, green, red, braking_probability=p)
+    r.rng = np.random.RandomState(seed)
+    reference_rng = np.random.RandomState(seed)
+    expected = (positions, velocities)
+    for t in range(100):
+        red_lights = [light_pos for light_pos, is_green in r.get_light_states(t).items() if not is_green]
+        positions, velocities = r.apply_rule(positions, velocities, t)
+        expected = reference_step(*expected, road_length, max_velocity, p, reference_rng, red_lights)
+        np.testing.assert_array_equal(positions, expected[0])
+        np.testing.assert_array_equal(velocities, expected[1])
+
+
+def test_batched_lights_match_single_plans():
+    road_length, max_velocity = 80, 5
+    light_positions = [20, 50, 70]
+    green = np.array([[10, 10, 10], [5, 8, 12], [20, 3, 7]])
+    red = np.array([[10, 10, 10], [9, 4, 6], [3, 15, 7]])
+    offset = np.array([[0, 0, 0], [2, 5, 1], [0, 7, 3]])
+    positions, velocities = random_state(road_length, 30, 1)
+    batched = rule.BatchedTrafficLights(road_length, max_velocity, light_positions, green, red, offset=offset)
+    batched_positions = np.tile(positions, (3, 1))
+    batched_velocities = np.tile(velocities, (3, 1))
+    singles = [rule.TrafficLights(road_length, max_velocity, light_positions, green[k], red[k], offset=offset[k])
+               for k in range(3)]
+    states = [(positions, velocities)] * 3
+    for t in range(150):
+        batched_positions, batched_velocities = batched.apply_rule(batched_positions, batched_velocities, t)
+        states = [single.apply_rule(*state, t) for single, state in zip(singles, states)]
+        for k, (single_positions, single_velocities) in enumerate(states):
+            np.testing.assert_array_equal(batched_positions[k], single_positions)
+            np.testing.assert_array_equal(batched_velocities[k], single_velocities)
+
+
+def test_batched_automaton_measures_every_plan():
+    road_length, num_cars = 60, 20
+    green, red = np.array([[5, 5], [9, 3]]), np.array([[5, 5], [4, 8]])
+    batched = rule.BatchedTrafficLights(road_length, 4, [20, 45], green, red)
+    positions = np.arange(0, 2 * num_cars, 2)
+    automaton = ca.BatchedCellularAutomaton(np.tile(positions, (2, 1)), np.zeros((2, num_cars)),
+                                            road_length, 80, 0, road_length - 1)
+    batched_results = automaton.simulate(batched)
+    for k in range(2):
+        single = rule.TrafficLights(road_length, 4, [20, 45], green[k], red[k])
+        single_results = ca.CellularAutomaton(positions, np.zeros(num_cars), road_length, 80,
+                                              0, road_length - 1).simulate(single)
+        for measured in range(1, 5):
+            np.testing.assert_allclose(batched_results[measured][:, k], single_results[measured])
+
+
+def test_uniform_fleet_matches_scalar_parameters():
+    road_length, num_cars = 100, 30
+    positions, velocities = random_state(road_length, num_cars, 2)
+    scalar = rule.MaxVelocity(road_length, 4, 0.25)
+    fleet = rule.MaxVelocity(road_length, 4, 0.25,
+                             fleet=rule.VehicleFleet(np.full(num_cars, 4), np.full(num_cars, 0.25)))
+    scalar.rng, fleet.rng = np.random.RandomState(3), np.random.RandomState(3)
+    scalar_state, fleet_state = (positions, velocities), (positions, velocities)
+    for t in range(200):
+        scalar_state = scalar.apply_rule(*scalar_state, t)
+        fleet_state = fleet.apply_rule(*fleet_state, t)
+    np.testing.assert_array_equal(scalar_state[0], fleet_state[0])
+    np.testing.assert_array_equal(scalar_state[1], fleet_state[1])
+
+
+def test_fleet_is_reset_between_simulations():
+    road_length = 60
+    fleet = rule.VehicleFleet.from_classes([0, 1, 0, 0, 1, 0], [5, 2], [0.1, 0.1], [1, 3])
+    r = rule.MaxVelocity(road_length, 5, 0.1, fleet=fleet)
+    for seed in range(3):
+        rng = np.random.RandomState(seed)
+        r.rng = rng
+        positions = rule.initial_positions(r, len(fleet), road_length, rng)
+        automaton = ca.CellularAutomaton(positions, np.zeros(len(fleet)), road_length, 100, 0, road_length - 1)
+        traffic_evolution = automaton.simulate(r)[0]
+        # every vehicle keeps its length, so the occupied cells never change in number
+        np.testing.assert_array_equal(traffic_evolution.sum(axis=1), np.sum(fleet.lengths))
+        assert np.all(automaton.velocities <= fleet.max_velocities)
+
+
+def test_initial_positions_checks_the_fleet_size():
+    fleet = rule.VehicleFleet([3, 3], [0, 0])
+    with pytest.raises(ValueError):
+        rule.initial_positions(rule.MaxVelocity(20, 3, fleet=fleet), 3, 20)
+
+
+def sotl_run(r, seed, road_length=80, num_cars=30, max_timesteps=150):
+    rng = np.random.RandomState(seed)
+    r.rng = rng
+    positions = np.sort(rng.choice(road_length, num_cars, replace=False))
+    automaton = ca.CellularAutomaton(positions, np.zeros(num_cars), road_length, max_timesteps, 0, road_length - 1)
+    return automaton.simulate(r)[4]
+
+
+def test_sotl_state_is_reset_between_simulations():
+    r = rule.SelfOrganisedTrafficLights(80, 4, [20, 60], 8, 10, 3, 20, braking_probability=0.1)
+    first = sotl_run(r, 5)
+    sotl_run(r, 6)
+    np.testing.assert_array_equal(sotl_run(r, 5), first)
+    fresh = rule.SelfOrganisedTrafficLights(80, 4, [20, 60], 8, 10, 3, 20, braking_probability=0.1)
+    np.testing.assert_array_equal(sotl_run(fresh, 5), first)
+
+
+def test_sotl_queue_counts_wrap_only_on_the_ring():
+    r = rule.SelfOrganisedTrafficLights(20, 3, [2, 10], 4, 1, 1, 5)
+    positions = np.array([7, 8, 17, 18, 19])
+    np.testing.assert_array_equal(r.queue_counts(positions), [2, 2])
+    np.testing.assert_array_equal(r.queue_counts(positions, periodic=False), [0, 2])
+
+
+@pytest.mark.parametrize("start_red", [None, [True, False, True]])
+def test_red_light_positions_match_the_light_states(start_red):
+    r = rule.TrafficLights(100, 5, [70, 10, 40], [7, 5, 12], [4, 9, 3], start_red=start_red, offset=[0, 3, 8])
+    for t in range(60):
+        expected = sorted(light_pos for light_pos, green in r.get_light_states(t).items() if not green)
+        np.testing.assert_array_equal(r.red_light_positions(t), expected)
+
+    sotl = rule.SelfOrganisedTrafficLights(100, 5, [70, 10, 40], 4, 1, 1, 5)
+    sotl.is_green[:] = [False, True, False]
+    np.testing.assert_array_equal(sotl.red_light_positions(0), [40, 70])
+    assert len(rule.MaxVelocity(100, 5).red_light_positions(0)) == 0
+
+
+def test_clamp_at_red_lights_matches_the_signal_stage():
+    road_length = 50
+    r = rule.TrafficLights(road_length, 5, [12, 30, 49], [1, 1, 1], [5, 5, 5], start_red=[True] * 3)
+    positions, _ = random_state(road_length, 20, 0)
+    velocities = np.random.RandomState(1).randint(0, 6, 20).astype(float)
+    clamped = r.clamp_at_red_lights(positions.astype(int), velocities.astype(int), [49, 12, 30])
+    state = r.step_state.load(r, positions, velocities, 0)
+    rule.SignalClamp().apply(r, state)
+    np.testing.assert_array_equal(state.velocities, clamped)
+    assert clamped.dtype == int
+    # nobody passes a red light
+    distances = (np.array([12, 30, 49]) - positions[:, None].astype(int)) % road_length
+    assert not np.any((distances > 0) & (distances <= clamped[:, None]))
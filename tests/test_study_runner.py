@@ -0,0 +1,46 @@
+import json
+import os
+import pickle
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import study_runner
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_headless_import_does_not_load_matplotlib():
+    code = "import sys, study_runner; assert 'matplotlib' not in sys.modules, sorted(sys.modules)"
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+
+
+def test_expand_parameter():
+    np.testing.assert_array_equal(study_runner.expand_parameter({"range": [1, 7, 2]}), [1, 3, 5])
+    np.testing.assert_array_equal(study_runner.expand_parameter({"linspace": [0, 1, 3]}), [0, 0.5, 1])
+    assert study_runner.expand_parameter([25, 75]) == [25, 75]
+
+
+def test_main_runs_the_named_studies(tmp_path):
+    config = {"search": {"study": "optimise_sotl", "road_length": 60, "max_timesteps": 100,
+                         "num_runs_per_point": 1,
+                         "parameters": {"num_cars": 20, "max_velocity": 3, "light_positions": [15, 45],
+                                        "distance_values": [5, 10], "threshold_values": [2, 10],
+                                        "min_green_values": [2], "max_green_values": [10]}},
+              "unused": {"study": "density_vel_flow"}}
+    config_path = tmp_path / "studies.json"
+    config_path.write_text(json.dumps(config))
+    output_path = tmp_path / "results.pkl"
+    results = study_runner.main([str(config_path), "search", "--output", str(output_path)])
+    assert list(results) == ["search"]
+    assert results["search"]["best_parameters"]["d"] in (5, 10)
+    with open(output_path, "rb") as f:
+        assert pickle.load(f)["search"]["best_flow"] == results["search"]["best_flow"]
+
+
+def test_unknown_study_is_rejected():
+    with pytest.raises(ValueError):
+        study_runner.run_study("broken", {"study": "no_such_study", "road_length": 10, "max_timesteps": 10,
+                                          "num_runs_per_point": 1})
@@ -0,0 +1,49 @@
+import numpy as np
+
+import cellular_automaton as ca
+import rule
+import trajectories
+
+
+def test_varint_round_trip():
+    values = np.array([0, 1, -1, 63, -64, 64, -65, 127, 128, 300, -300, 2 ** 31, -2 ** 31,
+                       2 ** 62, -2 ** 62, np.iinfo(np.int64).max, np.iinfo(np.int64).min])
+    values = np.concatenate((values, np.random.RandomState(0).randint(-10 ** 6, 10 ** 6, 1000)))
+    np.testing.assert_array_equal(trajectories.decode_varint(trajectories.encode_varint(values)), values)
+    assert len(trajectories.decode_varint(trajectories.encode_varint([]))) == 0
+
+
+def test_saved_trajectories_round_trip(tmp_path):
+    road_length, num_cars = 100, 30
+    r = rule.TrafficLights(road_length, 5, [30, 80], [10, 10], [8, 8], braking_probability=0.2)
+    r.rng = np.random.RandomState(0)
+    positions = np.sort(r.rng.choice(road_length, num_cars, replace=False))
+    automaton = ca.CellularAutomaton(positions, np.zeros(num_cars), road_length, 300,
+                                     record_evolution=False, record_trajectories=True)
+    automaton.simulate(r)
+    for compress in (True, False):
+        filename = tmp_path / f"trajectories_{compress}.npz"
+        trajectories.save_trajectories(filename, automaton.trajectory_positions, automaton.trajectory_velocities,
+                                       road_length, compress=compress)
+        positions, velocities, loaded_road_length = trajectories.load_trajectories(filename)
+        np.testing.assert_array_equal(positions, automaton.trajectory_positions)
+        np.testing.assert_array_equal(velocities, automaton.trajectory_velocities)
+        assert loaded_road_length == road_length
+
+
+def test_light_delays_match_a_loop_over_the_lights():
+    rng = np.random.RandomState(1)
+    for _ in range(50):
+        road_length = rng.randint(5, 100)
+        positions = rng.randint(0, road_length, (rng.randint(1, 40), rng.randint(1, 20)))
+        velocities = rng.randint(0, 3, positions.shape)
+        # repeated lights and approaches longer than their spacing count at every light
+        light_positions = list(rng.randint(0, road_length, rng.randint(0, 6)))
+        approach_distance = rng.randint(0, road_length + 2)
+        expected = np.zeros((positions.shape[1], len(light_positions)), dtype=np.int64)
+        for i, light_pos in enumerate(light_positions):
+            distance_to_light = (light_pos - positions) % road_length
+            waiting = (velocities == 0) & (distance_to_light > 0) & (distance_to_light <= approach_distance)
+            expected[:, i] = np.count_nonzero(waiting, axis=0)
+        delays = trajectories.light_delays(positions, velocities, road_length, light_positions, approach_distance)
+        np.testing.assert_array_equal(delays, expected)
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+import rule
+import work_queue
+from analyser import Analyser
+
+
+def test_distributed_runs_match_serial_seeded_runs(tmp_path):
+    road_length, max_timesteps, num_runs = 60, 80, 5
+    path = str(tmp_path / "sweep.db")
+    points = [("sparse", 10, rule.MaxVelocity(road_length, 4, 0.2)),
+              ("dense", 35, rule.TrafficLights(road_length, 4, [20, 45], [8, 8], [6, 6], braking_probability=0.2))]
+    queue = work_queue.WorkQueue(path)
+    queue.submit("sweep", road_length, max_timesteps, points, num_runs, chunk_runs=2, seed=7)
+
+    # a crashed worker leaves a running job behind, which is handed out again once its lease expired
+    abandoned = queue.claim("crashed", lease_seconds=-1)
+    assert work_queue.run_worker(path, max_jobs=2) == 2
+    assert queue.progress("sweep")["jobs"]["done"] == 2
+    assert work_queue.run_worker(path) == 4
+    assert queue.claim("late", lease_seconds=60) is None
+    assert abandoned["job_id"] == 1
+
+    results = queue.collect("sweep")
+    queue.close()
+    assert results['labels'] == ["sparse", "dense"]
+    assert results['num_runs'] == [num_runs, num_runs]
+    serial_study = Analyser(road_length, max_timesteps, num_runs)
+    for point_index, (_, num_cars, rule_instance) in enumerate(points):
+        serial = serial_study._run_single_simulation(num_cars, rule_instance, seed=7)
+        np.testing.assert_allclose(results['run_flows'][point_index], serial['run_flows'])
+        for name, key in Analyser.RESULT_KEYS.items():
+            assert results[key][point_index] == pytest.approx(serial[name])
+            assert results[f"{name}_ci_lowers"][point_index] <= results[key][point_index] \
+                <= results[f"{name}_ci_uppers"][point_index]
@@ -0,0 +1,132 @@
+import numpy as np
+
+
+"""
+Per-vehicle trajectories recorded by CellularAutomaton(record_trajectories=True), stored as
+(timesteps, cars) position and velocity arrays. Storage scales with the number of cars instead of
+the road length. This module derives travel times, stop counts and delays at the lights from them
+and writes them to disk, optionally delta and varint compressed.
+"""
+
+
+def encode_varint(values):
+    """
+    Encodes integers as zigzag LEB128 varints (7 bits per byte, high bit marks a following byte).
+    :param values: 1d integer array
+    :return: uint8 array
+    """
+    values = np.asarray(values, dtype=np.int64)
+    zigzag = ((values << 1) ^ (values >> 63)).astype(np.uint64)
+    num_bytes = np.ones(len(zigzag), dtype=np.int64)
+    for k in range(1, 10):
+        num_bytes += zigzag >= np.uint64(1 << (7 * k))
+
+    # (values, 10) table of 7 bit groups, of which the first num_bytes of every row are kept
+    shifts = np.arange(10, dtype=np.uint64) * np.uint64(7)
+    groups = ((zigzag[:, None] >> shifts) & np.uint64(0x7F)).astype(np.uint8)
+    byte_index = np.arange(10)
+    groups[byte_index < num_bytes[:, None] - 1] |= 0x80
+    return groups[byte_index < num_bytes[:, None]]
+
+
+def decode_varint(data):
+    """
+    Decodes zigzag LEB128 varints written by encode_varint.
+    :return: 1d int64 array
+    """
+    data = np.asarray(data, dtype=np.uint8)
+    last_bytes = (data & 0x80) == 0
+    value_index = np.concatenate(([0], np.cumsum(last_bytes)[:-1]))
+    starts = np.flatnonzero(np.concatenate(([True], last_bytes[:-1])))
+    byte_in_value = np.arange(len(data)) - starts[value_index]
+    terms = (data & 0x7F).astype(np.uint64) << (byte_in_value.astype(np.uint64) * np.uint64(7))
+    zigzag = np.bitwise_or.reduceat(terms, starts) if len(data) > 0 else np.zeros(0, dtype=np.uint64)
+    return ((zigzag >> np.uint64(1)).astype(np.int64) ^ -(zigzag & np.uint64(1)).astype(np.int64))
+
+
+def save_trajectories(filename, positions, velocities, road_length, compress=True):
+    """
+    Writes trajectories to an .npz file. With compress=True the arrays are stored as varints of their
+    differences along time, which takes about one byte per car and timestep.
+    """
+    if not compress:
+        np.savez(filename, positions=positions, velocities=velocities, road_length=road_length)
+        return
+    shape = np.shape(positions)
+    delta_positions = np.diff(positions, axis=0, prepend=0) % road_length
+    delta_velocities = np.diff(velocities, axis=0, prepend=0)
+    np.savez(filename, shape=shape, road_length=road_length,
+             positions=encode_varint(delta_positions.ravel()),
+             velocities=encode_varint(delta_velocities.ravel()))
+
+
+def load_trajectories(filename):
+    """
+    Reads trajectories written by save_trajectories.
+    :return: positions, velocities, road_length
+    """
+    with np.load(filename) as data:
+        road_length = int(data["road_length"])
+        if "shape" not in data:
+            return data["positions"], data["velocities"], road_length
+        shape = tuple(data["shape"])
+        positions = np.cumsum(decode_varint(data["positions"]).reshape(shape), axis=0) % road_length
+        velocities = np.cumsum(decode_varint(data["velocities"]).reshape(shape), axis=0)
+    return positions.astype(np.int32), velocities.astype(np.int32), road_length
+
+
+def distance_travelled(positions, road_length):
+    """
+    :return: (timesteps, cars) distance every vehicle has covered since the first timestep
+    """
+    steps = np.diff(positions, axis=0) % road_length
+    return np.concatenate((np.zeros((1, positions.shape[1]), dtype=steps.dtype), np.cumsum(steps, axis=0)))
+
+
+def travel_times(positions, road_length, segment_length=None):
+    """
+    Mean number of timesteps every vehicle needs to cover segment_length cells (one lap by default).
+    :return: array over cars, inf for vehicles which did not move
+    """
+    segment_length = road_length if segment_length is None else segment_length
+    distance = distance_travelled(positions, road_length)[-1]
+    with np.errstate(divide="ignore"):
+        return (positions.shape[0] - 1) * segment_length / distance
+
+
+def stop_counts(velocities):
+    """
+    Number of times every vehicle came to a stop.
+    :return: array over cars
+    """
+    stopping = (velocities[1:] == 0) & (velocities[:-1] > 0)
+    return np.count_nonzero(stopping, axis=0)
+
+
+def light_delays(positions, velocities, road_length, light_positions, approach_distance):
+    """
+    Delay of every vehicle at every light, i.e. the number of timesteps it stood still within
+    approach_distance cells in front of the light.
+    :return: (cars, lights) array
+    """
+    num_cars = positions.shape[1]
+    num_lights = len(light_positions)
+    delays = np.zeros((num_cars, num_lights), dtype=np.int64)
+    if num_lights == 0:
+        return delays
+    # only the stopped (timestep, car) samples, each looks up the lights ahead of it in the sorted positions
+    _, stopped_cars = np.nonzero(velocities == 0)
+    stopped_positions = positions[velocities == 0]
+    order = np.argsort(light_positions, kind="stable")
+    sorted_lights = np.asarray(light_positions)[order]
+    next_light = np.searchsorted(sorted_lights, stopped_positions, side="right")
+    # the k-th light ahead is further away than the (k-1)-th, so this stops after the overlapping approaches
+    for k in range(num_lights):
+        light = (next_light + k) % num_lights
+        distance_to_light = (sorted_lights[light] - stopped_positions) % road_length
+        waiting = (distance_to_light > 0) & (distance_to_light <= approach_distance)
+        if not np.any(waiting):
+            break
+        delays += np.bincount(stopped_cars[waiting] * num_lights + order[light[waiting]],
+                              minlength=num_cars * num_lights).reshape(num_cars, num_lights)
+    return delays
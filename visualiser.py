@@ -3,6 +3,8 @@ import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 import csv
 import pickle
+import threading
+import spacetime_io
 
 class Visualiser:
 
@@ -52,6 +54,15 @@ class Visualiser:
             loaded_data = pickle.load(f)
         return loaded_data
 
+    @staticmethod
+    def error_band(axis, x, ci_lowers, ci_uppers, color=None):
+        """
+        Shades the confidence band between the ci_lower and ci_upper of the results, if they are available.
+        """
+        if ci_lowers is None or ci_uppers is None:
+            return
+        axis.fill_between(x, ci_lowers, ci_uppers, color=color, alpha=0.2, linewidth=0)
+
     def create_gif(self, traffic_evolution, light_positions=None, light_state_history=None):
         plt.rcParams.update({"xtick.labelsize": 8})
         fig, axis = plt.subplots()
@@ -137,6 +148,79 @@ class Visualiser:
 
         plt.show()
 
+    def file_matrix_plot(self, path, light_positions=None, max_rows=2000, max_columns=2000):
+        """
+        Plots a space-time diagram which was written to a file by CellularAutomaton(evolution_file=...).
+        The file is read in chunks and reduced to at most max_rows x max_columns, so it never has to fit
+        in memory.
+        """
+        traffic_evolution = spacetime_io.open_spacetime(path)
+        image, _, _ = spacetime_io.downsample(traffic_evolution, max_rows, max_columns)
+        num_timesteps, road_length = traffic_evolution.shape
+        fig, axis = plt.subplots()
+        axis.imshow(image, cmap="gray_r", vmin=0, vmax=2, aspect="auto", interpolation="nearest",
+                    extent=[-0.5, road_length - 0.5, num_timesteps, 0])
+        if light_positions is not None:
+            for light_pos in light_positions:
+                axis.axvline(light_pos, color="red", alpha=0.3)
+        axis.set_xlabel("Road Position")
+        axis.set_ylabel("Time Step")
+
+        plt.show()
+
+    def live_plot(self, ring_buffer, max_fps=20, max_columns=2000, is_running=None):
+        """
+        Shows a scrolling space-time window of a running simulation. Only the image and the light markers
+        are redrawn (blitting), at most max_fps times per second.
+        :param ring_buffer: SpaceTimeRingBuffer the automaton pushes into
+        :param max_columns: roads longer than this are drawn with merged cells
+        :param is_running: optional function, the window stops updating once it returns False
+        """
+        _, num_columns = ring_buffer.window_columns(max_columns)
+        fig, axis = plt.subplots()
+        image = axis.imshow(np.zeros((ring_buffer.capacity, num_columns), dtype=np.uint8), cmap="gray_r",
+                            vmin=0, vmax=2, aspect="auto", interpolation="nearest",
+                            extent=[-0.5, ring_buffer.road_length - 0.5, -0.5, ring_buffer.capacity - 0.5])
+        # the current light states are shown at the bottom edge, next to the newest row
+        lights = axis.scatter(ring_buffer.light_positions, np.full(len(ring_buffer.light_positions), -0.5),
+                              marker="s", s=40, color="red", clip_on=False, zorder=3)
+        # inside the axes, since blitting only redraws the axes area
+        time_text = axis.text(0.01, 0.99, "", transform=axis.transAxes, va="top",
+                              bbox=dict(facecolor="white", alpha=0.8, linewidth=0))
+        axis.set_xlabel("Road Position")
+        axis.set_ylabel("Time Steps Ago")
+        last_drawn = [-1]
+
+        def update_data(frame):
+            if ring_buffer.steps_written != last_drawn[0]:
+                rows, light_rows, start = ring_buffer.window(max_columns)
+                frame_data = np.zeros((ring_buffer.capacity, num_columns), dtype=np.uint8)
+                # the newest row is drawn at the bottom of the window
+                frame_data[ring_buffer.capacity - rows.shape[0]:] = rows
+                image.set_data(frame_data)
+                if light_rows.shape[0] > 0 and light_rows.shape[1] > 0:
+                    lights.set_color(np.where(light_rows[-1], "green", "red"))
+                last_drawn[0] = start + rows.shape[0]
+                time_text.set_text(f"t = {last_drawn[0]}")
+            if is_running is not None and not is_running():
+                animation.event_source.stop()
+            return image, lights, time_text
+
+        animation = FuncAnimation(fig=fig, func=update_data, interval=1000 / max_fps,
+                                  blit=True, cache_frame_data=False)
+        plt.show()
+        return animation
+
+    def watch(self, automaton, rule, max_fps=20, max_columns=2000):
+        """
+        Runs automaton.simulate(rule) in a background thread and shows it live.
+        The automaton needs a live_buffer.
+        """
+        simulation = threading.Thread(target=automaton.simulate, args=(rule,), daemon=True)
+        simulation.start()
+        self.live_plot(automaton.live_buffer, max_fps, max_columns, is_running=simulation.is_alive)
+        return simulation
+
     def density_meanvel_flow_plot(self, filename, fixed_value):
         """
         Plots the general density vs mean velocity / flow graph.
@@ -153,8 +237,12 @@ class Visualiser:
                     plot_label = part2
                 elif fixed_value in part2:
                     plot_label = part1
-                ax_f.plot(data['densities'], data['flows'], marker='.', linestyle='-', label=plot_label)
-                ax_v.plot(data['densities'], data['velocities'], marker='.', linestyle='-', label=plot_label)
+                line_f, = ax_f.plot(data['densities'], data['flows'], marker='.', linestyle='-', label=plot_label)
+                line_v, = ax_v.plot(data['densities'], data['velocities'], marker='.', linestyle='-', label=plot_label)
+                self.error_band(ax_f, data['densities'], data.get('flow_ci_lowers'), data.get('flow_ci_uppers'),
+                                line_f.get_color())
+                self.error_band(ax_v, data['densities'], data.get('velocity_ci_lowers'), data.get('velocity_ci_uppers'),
+                                line_v.get_color())
 
         ax_f.set_ylabel("Average Flow [vehicles/timestep]")
         ax_f.set_xlabel("Density [vehicles/cell]")
@@ -165,10 +253,15 @@ class Visualiser:
         ax_v.legend()
         plt.show()
 
-    def traffic_light_cycle_flow_sync_plot(self, num_cars_list, road_length, cycle_lengths, flow_list):
+    def traffic_light_cycle_flow_sync_plot(self, results):
+        """
+        :param results: results dict of Analyser.traffic_light_cycle_analysis
+        """
         plt.figure()
-        for k in range(len(flow_list)):
-            plt.plot(cycle_lengths, flow_list[k], label=f"density={num_cars_list[k]/road_length}")
+        for k in range(len(results['flows'])):
+            line, = plt.plot(results['cycle_lengths'], results['flows'][k], label=f"density={results['densities'][k]}")
+            self.error_band(plt.gca(), results['cycle_lengths'], results['flow_ci_lowers'][k],
+                            results['flow_ci_uppers'][k], line.get_color())
         plt.xlabel("Cycle Length")
         plt.ylabel("Flow [vehicles/timestep]")
         plt.legend(loc="upper right")
@@ -180,8 +273,10 @@ class Visualiser:
         for T, data in results.items():
             green_durations = np.array(data['green_durations'])
             actual_fractions = green_durations / T
-            plt.plot(actual_fractions, data['flows'], marker='.', markersize=5,
-                     linestyle='-', label=f'Total Cycle = {T}')
+            line, = plt.plot(actual_fractions, data['flows'], marker='.', markersize=5,
+                             linestyle='-', label=f'Total Cycle = {T}')
+            self.error_band(plt.gca(), actual_fractions, data.get('flow_ci_lowers'), data.get('flow_ci_uppers'),
+                            line.get_color())
 
         plt.xlabel("Green Time Fraction")
         plt.ylabel("Average Flow [vehicles/timestep]")
@@ -190,48 +285,75 @@ class Visualiser:
         plt.xlim(0, 1)
         plt.show()
 
-    def traffic_light_delay_flow_plot(self, num_cars_list, road_length, offset_range, flow_list):
+    def traffic_light_delay_flow_plot(self, results):
+        """
+        :param results: results dict of Analyser.traffic_light_offset_analysis
+        """
         plt.figure()
-        for k in range(len(flow_list)):
-            plt.plot(offset_range, flow_list[k], label=f"density={num_cars_list[k]/road_length}")
+        for k in range(len(results['flows'])):
+            line, = plt.plot(results['offsets'], results['flows'][k], label=f"density={results['densities'][k]}")
+            self.error_band(plt.gca(), results['offsets'], results['flow_ci_lowers'][k],
+                            results['flow_ci_uppers'][k], line.get_color())
         plt.xlabel("Time delay")
         plt.ylabel("Flow [vehicles/timestep]")
         #plt.legend()
         plt.show()
 
-    def traffic_light_cycle_flow_delay(self, cycle_lengths, offsets, flow_list, velocity_list):
+    def traffic_light_cycle_flow_delay(self, results):
+        """
+        :param results: results dict of Analyser.traffic_light_cycle_flow_offset
+        """
+        cycle_lengths, offsets = results['cycle_lengths'], results['offsets']
         plt.figure()
-        for k in range(len(flow_list)):
-            plt.plot(cycle_lengths, flow_list[k], label=f"Time delay: {offsets[k]}")
+        for k in range(len(offsets)):
+            line, = plt.plot(cycle_lengths, results['flows'][k], label=f"Time delay: {offsets[k]}")
+            self.error_band(plt.gca(), cycle_lengths, results['flow_ci_lowers'][k], results['flow_ci_uppers'][k],
+                            line.get_color())
         plt.xlabel("Cycle Length")
         plt.ylabel("Flow [vehicles/timestep]")
         plt.legend()
         plt.show()
 
         plt.figure()
-        for k in range(len(flow_list)):
-            plt.plot(cycle_lengths, velocity_list[k], label=f"Time delay: {offsets[k]}")
+        for k in range(len(offsets)):
+            line, = plt.plot(cycle_lengths, results['velocities'][k], label=f"Time delay: {offsets[k]}")
+            self.error_band(plt.gca(), cycle_lengths, results['velocity_ci_lowers'][k],
+                            results['velocity_ci_uppers'][k], line.get_color())
         plt.xlabel("Cycle Length")
         plt.ylabel("Velocity [cells/timestep]")
         plt.legend()
         plt.show()
 
 
-    def flow_braking_prob(self, p_values, avg_flow):
+    def flow_braking_prob(self, results):
+        """
+        :param results: results dict of Analyser.flow_braking_prob_plot
+        """
         plt.figure()
-        plt.plot(p_values, avg_flow)
+        line, = plt.plot(results['braking_probabilities'], results['flows'])
+        self.error_band(plt.gca(), results['braking_probabilities'], results['flow_ci_lowers'],
+                        results['flow_ci_uppers'], line.get_color())
         plt.xlabel("Braking probability")
         plt.ylabel("Average flow [vehicles/timestep]")
         plt.show()
 
-    def sotl_parameter_influence_onefixed(self, parameter_to_vary, parameter_values, flow):
+    def sotl_parameter_influence_onefixed(self, parameter_to_vary, results):
+        """
+        :param results: results dict of Analyser.analyse_sotl_parameter_onefixed
+        """
         plt.figure()
-        plt.plot(parameter_values, flow)
+        line, = plt.plot(results['parameter_values'], results['flows'])
+        self.error_band(plt.gca(), results['parameter_values'], results['flow_ci_lowers'],
+                        results['flow_ci_uppers'], line.get_color())
         plt.xlabel(parameter_to_vary)
         plt.ylabel("Flow [vehicles/timestep]")
         plt.show()
 
-    def sotl_parameter_influence_grid(self, threshold_values, distance_values, path_to_grid):
+    def sotl_parameter_influence_grid(self, threshold_values, distance_values, path_to_grid, results=None):
+        """
+        :param results: results dict of Analyser.analyse_sotl_parametergrid, if given the width of the
+                        confidence interval of the flow is drawn as labelled contour lines
+        """
         X, Y = np.meshgrid(distance_values, threshold_values)
         fig, ax = plt.subplots(figsize=(8, 6))
         flows_grid = self.read_csv_grid(path_to_grid)
@@ -240,6 +362,10 @@ class Visualiser:
 
         cbar = fig.colorbar(contour)
         cbar.set_label('Average Flow [vehicles/timestep]')
+        if results is not None:
+            ci_widths = results['flow_ci_upper_grid'] - results['flow_ci_lower_grid']
+            lines = ax.contour(X, Y, ci_widths, colors='white', linewidths=0.8, levels=5)
+            ax.clabel(lines, fmt="CI %.3f", fontsize=8)
 
         # Label the axes
         ax.set_xlabel("Detection Distance (d) [cells]")
@@ -249,7 +375,11 @@ class Visualiser:
     def compare_sync_gw(self, results):
         plt.figure()
         plt.plot(results["densities"], results["gw_flows"], label="Green wave", color="green")
-        plt.plot(results["densities"], results["sync_flows"], label="Synchronised")
+        line, = plt.plot(results["densities"], results["sync_flows"], label="Synchronised")
+        self.error_band(plt.gca(), results["densities"], results.get("gw_flow_ci_lowers"),
+                        results.get("gw_flow_ci_uppers"), "green")
+        self.error_band(plt.gca(), results["densities"], results.get("sync_flow_ci_lowers"),
+                        results.get("sync_flow_ci_uppers"), line.get_color())
         plt.xlabel("Density [vehicles/cell]")
         plt.ylabel("Flow [vehicles/timestep]")
         plt.legend()
@@ -257,7 +387,11 @@ class Visualiser:
 
         plt.figure()
         plt.plot(results["densities"], results["gw_velocities"], label="Green wave", color="green")
-        plt.plot(results["densities"], results["sync_velocities"], label="Synchronised")
+        line, = plt.plot(results["densities"], results["sync_velocities"], label="Synchronised")
+        self.error_band(plt.gca(), results["densities"], results.get("gw_velocity_ci_lowers"),
+                        results.get("gw_velocity_ci_uppers"), "green")
+        self.error_band(plt.gca(), results["densities"], results.get("sync_velocity_ci_lowers"),
+                        results.get("sync_velocity_ci_uppers"), line.get_color())
         plt.xlabel("Density [vehicles/cell]")
         plt.ylabel("Velocity [cells/timestep]")
         plt.legend()
@@ -266,7 +400,11 @@ class Visualiser:
     def compare_gw_sotl(self, results):
         plt.figure()
         plt.plot(results["densities"], results["gw_flows"], label="Green wave", color="green")
-        plt.plot(results["densities"], results["sotl_flows"], label="Self organised")
+        line, = plt.plot(results["densities"], results["sotl_flows"], label="Self organised")
+        self.error_band(plt.gca(), results["densities"], results.get("gw_flow_ci_lowers"),
+                        results.get("gw_flow_ci_uppers"), "green")
+        self.error_band(plt.gca(), results["densities"], results.get("sotl_flow_ci_lowers"),
+                        results.get("sotl_flow_ci_uppers"), line.get_color())
         plt.xlabel("Density [vehicles/cell]")
         plt.ylabel("Flow [vehicles/timestep]")
         plt.legend()
@@ -274,7 +412,11 @@ class Visualiser:
 
         plt.figure()
         plt.plot(results["densities"], results["gw_velocities"], label="Green wave", color="green")
-        plt.plot(results["densities"], results["sotl_velocities"], label="Self organised")
+        line, = plt.plot(results["densities"], results["sotl_velocities"], label="Self organised")
+        self.error_band(plt.gca(), results["densities"], results.get("gw_velocity_ci_lowers"),
+                        results.get("gw_velocity_ci_uppers"), "green")
+        self.error_band(plt.gca(), results["densities"], results.get("sotl_velocity_ci_lowers"),
+                        results.get("sotl_velocity_ci_uppers"), line.get_color())
         plt.xlabel("Density [vehicles/cell]")
         plt.ylabel("Velocity [cells/timestep]")
         plt.legend()
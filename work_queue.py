@@ -0,0 +1,339 @@
+import argparse
+import os
+import pickle
+import socket
+import sqlite3
+import sys
+import threading
+import time
+
+import numpy as np
+
+import estimators
+import rule
+from analyser import Analyser
+from study_runner import load_config, expand_parameter
+
+
+"""
+Distributes sweeps over any number of machines through a SQLite database on a shared filesystem, without
+a broker. A study is split into jobs of (parameter point, chunk of runs). Workers claim jobs with a
+lease, renew it while they simulate and write the per-run results back. Jobs whose lease expired, e.g.
+because the worker died, are handed out again. Run k of a point always uses seed + k, so a re-run job
+gives the same result.
+
+    python -m work_queue sweep.db submit studies.toml density_sweep --chunk-runs 5
+    python -m work_queue sweep.db worker            (on every node, as often as there are cores)
+    python -m work_queue sweep.db status density_sweep
+    python -m work_queue sweep.db collect density_sweep --output density_sweep.pkl
+
+The shared filesystem has to support file locks, which SQLite uses to serialise the claims.
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS studies (
+    study_id INTEGER PRIMARY KEY, name TEXT UNIQUE, road_length INTEGER, max_timesteps INTEGER,
+    seed INTEGER, created REAL);
+CREATE TABLE IF NOT EXISTS points (
+    study_id INTEGER, point_index INTEGER, label TEXT, num_cars INTEGER, rule BLOB,
+    PRIMARY KEY (study_id, point_index));
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY, study_id INTEGER, point_index INTEGER, run_start INTEGER, num_runs INTEGER,
+    status TEXT DEFAULT 'pending', worker TEXT, lease_expires REAL, attempts INTEGER DEFAULT 0,
+    finished REAL, result BLOB);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, job_id);
+"""
+
+
+def density_vel_flow_points(road_length, parameters):
+    """
+    Points of the density_vel_flow study: every max velocity and braking probability for every number of cars.
+    """
+    num_cars_list = parameters.get('num_cars_list', np.arange(1, road_length + 1))
+    points = []
+    for v_max in parameters['max_velocity_list']:
+        for prob in parameters['braking_prob_list']:
+            for num_cars in num_cars_list:
+                points.append((f"vmax={v_max}, p={prob:.2f}", int(num_cars),
+                               rule.MaxVelocity(road_length, int(v_max), float(prob))))
+    return points
+
+
+def compare_gw_sotl_points(road_length, parameters):
+    """
+    Points of the compare_gw_sotl study: the green wave and the self organised rule for every number of cars.
+    """
+    light_positions = list(parameters['light_positions'])
+    num_lights = len(light_positions)
+    gw_parameters = parameters['gw_parameters']
+    sotl_parameters = parameters['sotl_parameters']
+    gw_rule = rule.TrafficLights(road_length, parameters['max_velocity'], light_positions,
+                                 [gw_parameters['green_duration']] * num_lights,
+                                 [gw_parameters['red_duration']] * num_lights,
+                                 [gw_parameters.get('start_red', False)] * num_lights,
+                                 offset=gw_parameters.get("offset"), braking_probability=0.1)
+    sotl_rule = rule.SelfOrganisedTrafficLights(road_length, parameters['max_velocity'], light_positions,
+                                                sotl_parameters['d'], sotl_parameters['threshold'],
+                                                sotl_parameters['min_green'], sotl_parameters['max_green'],
+                                                braking_probability=0.1)
+    return [(label, int(num_cars), rule_instance)
+            for num_cars in parameters['num_cars_list']
+            for label, rule_instance in (('gw', gw_rule), ('sotl', sotl_rule))]
+
+
+# studies which can be split into independent points, with the function building their points
+POINT_BUILDERS = {
+    "density_vel_flow": density_vel_flow_points,
+    "compare_gw_sotl": compare_gw_sotl_points,
+}
+
+
+class WorkQueue:
+    def __init__(self, path, timeout=60):
+        """
+        :param timeout: seconds to wait for a lock held by another worker
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def study_id(self, name):
+        row = self.connection.execute("SELECT study_id FROM studies WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise ValueError(f"Unknown study '{name}' in {self.path}")
+        return row[0]
+
+    def submit(self, name, road_length, max_timesteps, points, num_runs, chunk_runs, seed=0):
+        """
+        Adds a study with one job per point and chunk of chunk_runs runs.
+        :param points: list of (label, num_cars, rule_instance) tuples
+        """
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            cursor = self.connection.execute(
+                "INSERT INTO studies (name, road_length, max_timesteps, seed, created) VALUES (?, ?, ?, ?, ?)",
+                (name, road_length, max_timesteps, seed, time.time()))
+            study_id = cursor.lastrowid
+            self.connection.executemany(
+                "INSERT INTO points VALUES (?, ?, ?, ?, ?)",
+                [(study_id, point_index, label, num_cars, pickle.dumps(rule_instance))
+                 for point_index, (label, num_cars, rule_instance) in enumerate(points)])
+            self.connection.executemany(
+                "INSERT INTO jobs (study_id, point_index, run_start, num_runs) VALUES (?, ?, ?, ?)",
+                [(study_id, point_index, run_start, min(chunk_runs, num_runs - run_start))
+                 for point_index in range(len(points)) for run_start in range(0, num_runs, chunk_runs)])
+        return study_id
+
+    def claim(self, worker, lease_seconds):
+        """
+        Hands out the oldest pending job, after putting jobs with expired leases back to pending.
+        :return: dict describing the job, or None if no job is left
+        """
+        now = time.time()
+        with self.connection:
+            # takes the write lock first, so that no two workers claim the same job
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.execute("UPDATE jobs SET status = 'pending', worker = NULL "
+                                    "WHERE status = 'running' AND lease_expires < ?", (now,))
+            row = self.connection.execute(
+                "SELECT job_id, jobs.study_id, jobs.point_index, run_start, num_runs, num_cars, rule, "
+                "road_length, max_timesteps, seed FROM jobs "
+                "JOIN points ON points.study_id = jobs.study_id AND points.point_index = jobs.point_index "
+                "JOIN studies ON studies.study_id = jobs.study_id "
+                "WHERE status = 'pending' ORDER BY job_id LIMIT 1").fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE jobs SET status = 'running', worker = ?, lease_expires = ?, "
+                                    "attempts = attempts + 1 WHERE job_id = ?",
+                                    (worker, now + lease_seconds, row[0]))
+        keys = ("job_id", "study_id", "point_index", "run_start", "num_runs", "num_cars", "rule",
+                "road_length", "max_timesteps", "seed")
+        job = dict(zip(keys, row))
+        job["rule"] = pickle.loads(job["rule"])
+        return job
+
+    def renew(self, job_id, worker, lease_seconds):
+        """
+        Extends the lease of a running job. Returns False if the job was given to another worker.
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE job_id = ? AND worker = ? AND status = 'running'",
+                (time.time() + lease_seconds, job_id, worker))
+        return cursor.rowcount == 1
+
+    def complete(self, job_id, result):
+        """
+        Stores the result of a job. A job which was re-queued and finished twice keeps its first result,
+        which is the same since the runs are seeded.
+        """
+        with self.connection:
+            self.connection.execute("UPDATE jobs SET status = 'done', finished = ?, result = ?, worker = NULL "
+                                    "WHERE job_id = ? AND status != 'done'",
+                                    (time.time(), pickle.dumps(result), job_id))
+
+    def progress(self, name, window=300):
+        """
+        :param window: the throughput is measured over the jobs finished in the last window seconds
+        :return: dict with the number of jobs and runs per status, runs per second and the estimated
+                 seconds until all jobs are done
+        """
+        study_id = self.study_id(name)
+        counts = {"pending": 0, "running": 0, "done": 0}
+        runs = {"pending": 0, "running": 0, "done": 0}
+        for status, num_jobs, num_runs in self.connection.execute(
+                "SELECT status, COUNT(*), SUM(num_runs) FROM jobs WHERE study_id = ? GROUP BY status", (study_id,)):
+            counts[status] = num_jobs
+            runs[status] = num_runs
+        recent_runs = self.connection.execute(
+            "SELECT SUM(num_runs) FROM jobs WHERE study_id = ? AND status = 'done' AND finished > ?",
+            (study_id, time.time() - window)).fetchone()[0] or 0
+        throughput = recent_runs / window
+        remaining = runs["pending"] + runs["running"]
+        return {"jobs": counts, "runs": runs, "runs_per_second": throughput,
+                "seconds_remaining": remaining / throughput if throughput > 0 else (0 if remaining == 0 else np.inf)}
+
+    def collect(self, name, confidence=0.95):
+        """
+        Gathers the finished runs of every point, ordered by run.
+        :return: dict with per point lists labels, num_cars, densities, num_runs, the mean, standard error and
+                 confidence interval of every metric (flows, flow_stderrs, flow_ci_lowers, flow_ci_uppers,
+                 velocities, ..., variances, ...) and the per run flows run_flows
+        """
+        study_id = self.study_id(name)
+        road_length = self.connection.execute("SELECT road_length FROM studies WHERE study_id = ?",
+                                              (study_id,)).fetchone()[0]
+        points = self.connection.execute("SELECT point_index, label, num_cars FROM points WHERE study_id = ? "
+                                         "ORDER BY point_index", (study_id,)).fetchall()
+        run_values = {run_key: {point_index: [] for point_index, _, _ in points}
+                      for run_key in Analyser.RUN_KEYS.values()}
+        for point_index, result in self.connection.execute(
+                "SELECT point_index, result FROM jobs WHERE study_id = ? AND status = 'done' "
+                "ORDER BY point_index, run_start", (study_id,)):
+            result = pickle.loads(result)
+            for run_key, values in run_values.items():
+                values[point_index].extend(result[run_key])
+
+        results = {'labels': [], 'num_cars': [], 'densities': [], 'num_runs': [], **Analyser._new_results(),
+                   'run_flows': []}
+        for point_index, label, num_cars in points:
+            metrics = {}
+            for name, run_key in Analyser.RUN_KEYS.items():
+                values = run_values[run_key][point_index]
+                interval = estimators.mean_confidence_interval(values, confidence) if values \
+                    else {"mean": np.nan, "stderr": np.nan, "ci": (np.nan, np.nan)}
+                metrics[name] = interval["mean"]
+                metrics[f"{name}_stderr"] = interval["stderr"]
+                metrics[f"{name}_ci_lower"], metrics[f"{name}_ci_upper"] = interval["ci"]
+            results['labels'].append(label)
+            results['num_cars'].append(num_cars)
+            results['densities'].append(num_cars / road_length)
+            results['num_runs'].append(len(run_values["run_flows"][point_index]))
+            Analyser._append_metrics(results, metrics)
+            results['run_flows'].append(run_values["run_flows"][point_index])
+        return results
+
+
+def run_worker(path, lease_seconds=600, max_jobs=None, poll_seconds=0):
+    """
+    Claims and runs jobs until the queue is empty (or max_jobs are done). A background thread renews
+    the lease every lease_seconds / 3 while a job runs.
+    :param poll_seconds: if positive, waits this long and looks again instead of stopping at an empty queue
+    :return: number of jobs done
+    """
+    queue = WorkQueue(path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    jobs_done = 0
+    try:
+        while max_jobs is None or jobs_done < max_jobs:
+            job = queue.claim(worker, lease_seconds)
+            if job is None:
+                if poll_seconds <= 0:
+                    break
+                time.sleep(poll_seconds)
+                continue
+
+            finished = threading.Event()
+
+            def renew_lease(job_id=job["job_id"]):
+                # sqlite connections may not be shared between threads
+                heartbeat = WorkQueue(path)
+                while not finished.wait(lease_seconds / 3):
+                    heartbeat.renew(job_id, worker, lease_seconds)
+                heartbeat.close()
+
+            heartbeat_thread = threading.Thread(target=renew_lease, daemon=True)
+            heartbeat_thread.start()
+            try:
+                analyser = Analyser(job["road_length"], job["max_timesteps"], job["num_runs"])
+                metrics = analyser._run_single_simulation(job["num_cars"], job["rule"], num_runs=job["num_runs"],
+                                                          seed=job["seed"] + job["run_start"])
+            finally:
+                finished.set()
+                heartbeat_thread.join()
+            queue.complete(job["job_id"], {key: np.asarray(metrics[key])
+                                           for key in ("run_flows", "run_velocities", "run_variances")})
+            jobs_done += 1
+    finally:
+        queue.close()
+    return jobs_done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SQLite work queue for distributing traffic flow sweeps.")
+    parser.add_argument("database", help="path of the SQLite queue on a shared filesystem")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="splits a study of a config into jobs")
+    submit.add_argument("config", help="path to a .toml or .json study config")
+    submit.add_argument("study", help="name of the study in the config")
+    submit.add_argument("--chunk-runs", type=int, default=1, help="runs per job")
+    submit.add_argument("--seed", type=int, default=0)
+
+    worker = commands.add_parser("worker", help="runs jobs until the queue is empty")
+    worker.add_argument("--lease", type=float, default=600, help="lease length in seconds")
+    worker.add_argument("--max-jobs", type=int)
+    worker.add_argument("--poll", type=float, default=0, help="seconds between looks at an empty queue")
+
+    status = commands.add_parser("status", help="shows the progress of a study")
+    status.add_argument("study")
+
+    collect = commands.add_parser("collect", help="gathers the results of a study")
+    collect.add_argument("study")
+    collect.add_argument("--output", help="pickle file the results are written to")
+    args = parser.parse_args(argv)
+
+    if args.command == "worker":
+        return run_worker(args.database, args.lease, args.max_jobs, args.poll)
+
+    queue = WorkQueue(args.database)
+    try:
+        if args.command == "submit":
+            config = load_config(args.config)[args.study]
+            if config["study"] not in POINT_BUILDERS:
+                parser.error(f"study '{config['study']}' cannot be distributed, choose from {sorted(POINT_BUILDERS)}")
+            parameters = {key: expand_parameter(value) for key, value in config.get("parameters", {}).items()}
+            points = POINT_BUILDERS[config["study"]](config["road_length"], parameters)
+            queue.submit(args.study, config["road_length"], config["max_timesteps"], points,
+                         config["num_runs_per_point"], args.chunk_runs, args.seed)
+            print(f"Submitted {len(points)} points of {args.study}")
+        elif args.command == "status":
+            progress = queue.progress(args.study)
+            print(f"jobs {progress['jobs']}, runs {progress['runs']}, "
+                  f"{progress['runs_per_second']:.2f} runs/s, {progress['seconds_remaining']:.0f} s remaining")
+            return progress
+        elif args.command == "collect":
+            results = queue.collect(args.study)
+            if args.output is not None:
+                with open(args.output, "wb") as f:
+                    pickle.dump(results, f)
+            return results
+    finally:
+        queue.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])